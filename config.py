@@ -19,12 +19,23 @@ import sys
 import re
 import json
 import shutil
+import stat
+import errno
+import fcntl
+import hashlib
+import tarfile
+import zipfile
+import fnmatch
+import threading
+import time
+import ctypes
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 ###VERSIONS###
 
 version = "1.6.2"
 prog_internal_version = 112
-file_version = 17
+file_version = 26
 
 #############
 
@@ -101,10 +112,17 @@ def read_config(key):
     try:
         return db["options"][key]
     except KeyError:
-        if key in ["Verbose", "AutoInstall", "SkipQuestions", "UpdateURLPrograms"]:
+        if key in ["Verbose", "AutoInstall", "SkipQuestions", "UpdateURLPrograms", "AutoMaintain", "OverwriteDeletes",
+        "OverwriteChecksums", "Dedupe"]:
             return False
         elif key in ["PressEnterKey", "WarnMissingDeps"]:
             return True
+        elif key in ["LastMaintained", "LastFrozen", "FreezeAfterDays"]:
+            return 0
+        elif key == "SnapshotCount":
+            return 3
+        elif key == "ExtractMemoryLimit":
+            return 0
         elif key == "ShellFile":
             return get_shell_file()
         elif key == "Mode":
@@ -161,6 +179,9 @@ def vprint(to_print, end=None):
         if mode == "cli":
             print(to_print, end=end)
         elif mode == "gui":
+            if gui_events is not None:
+                gui_events("-STATUS-", to_print)
+                return
             try:
                 if end is not None:
                     output_area.Update(to_print)
@@ -246,6 +267,42 @@ def name(program):
     return program_internal_name
 
 
+def split_git_url(url):
+    """Split Git URL.
+
+    Splits a git URL that may have a subdirectory to sparsely check out
+    appended to it (ex. https://example.com/repo.git#path/to/subdir).
+
+    Args:
+        url (str): Git URL, optionally ending in #path/to/subdir
+
+    Returns:
+        tuple: (Git URL without the subdirectory, subdirectory or None if no subdirectory was supplied)
+
+    """
+    if "#" not in url:
+        return url, None
+    git_url, sparse_path = url.split("#", 1)
+    return git_url, sparse_path.strip("/")
+
+
+def git_name(url):
+    """Get Program Name for Git URL.
+
+    Args:
+        url (str): Git URL, optionally ending in #path/to/subdir
+
+    Returns:
+        str: Name of program to use internally. This is the name of the subdirectory if one is supplied,
+        and the name of the repository otherwise.
+
+    """
+    git_url, sparse_path = split_git_url(url)
+    if sparse_path:
+        return sparse_path[sparse_path.rfind("/")+1:]
+    return name(git_url)
+
+
 def dirname(path):
     """Get Program Name for Directory
 
@@ -285,6 +342,395 @@ def extension(program):
         return program[program.rfind("."):]
 
 
+def has_space(size):
+    """Check for Free Space.
+
+    Args:
+        size (int): Number of bytes needed
+
+    Returns:
+        bool: Whether /tmp, and ~/.tarstall if it's on another filesystem, both have size bytes free
+
+    """
+    paths = {}
+    for p in ["/tmp", full("~/.tarstall")]:
+        paths.setdefault(os.stat(p).st_dev, p)
+    for p in paths.values():
+        if shutil.disk_usage(p).free < size:
+            vprint("{} doesn't have {} bytes free!".format(p, size))
+            return False
+    return True
+
+
+EXTRACT_BUFFER = 1024 * 1024  # Size of the buffers members are copied out of archives with
+EXTRACT_WORKER_MEMORY = 8 * EXTRACT_BUFFER  # Rough memory used by each zip extraction thread, including decompressor state
+
+
+def stream_members(tar):
+    """Stream Tar Members.
+
+    Yields the members of a tar opened in stream mode. TarFile keeps every member it reads in a list,
+    so the list is emptied after each one is handled to keep memory flat no matter how many members there are.
+
+    Args:
+        tar (tarfile.TarFile): Tar opened in stream mode
+
+    Yields:
+        tarfile.TarInfo: Each member of the tar
+
+    """
+    member = tar.next()
+    while member is not None:
+        yield member
+        tar.members = []
+        member = tar.next()
+
+
+def scan_archive(path):
+    """Scan Archive.
+
+    Reads an archive's index (its tar headers or a zip's central directory) without extracting anything.
+
+    Args:
+        path (str): Path to archive to scan
+
+    Returns:
+        dict/None: "size" (total uncompressed size in bytes), "files" (number of files), and "top" (names of the entries
+        at the top of the archive as keys, and whether each is a directory as values), or None if the archive type can't
+        be scanned.
+
+    """
+    top = {}
+    size = 0
+    files = 0
+
+    def add(name, is_dir, entry_size):
+        nonlocal size, files
+        parts = [p for p in name.split("/") if p not in ["", "."]]
+        if parts:
+            top[parts[0]] = top.get(parts[0], False) or is_dir or len(parts) > 1
+        if not is_dir:
+            size += entry_size
+            files += 1
+
+    file_extension = extension(path)
+    if file_extension in ['.tar.gz', '.tar.xz']:
+        with tarfile.open(full(path), "r|*") as tar:
+            for member in stream_members(tar):
+                if member.sparse is not None:  # Only the data of sparse members takes up space
+                    add(member.name, False, sum([chunk[1] for chunk in member.sparse]))
+                else:
+                    add(member.name, member.isdir(), member.size)
+    elif file_extension == '.zip':
+        with zipfile.ZipFile(full(path)) as z:
+            for info in z.infolist():
+                add(info.filename, info.is_dir(), info.file_size)
+    else:
+        return None
+    return {"size": size, "files": files, "top": top}
+
+
+def file_kind(path, mode):
+    """Get How a File Can be Run.
+
+    Only files with an executable bit or without an extension are opened to check their magic number,
+    since those are the only ones likely to be programs.
+
+    Args:
+        path (str): Path to file
+        mode (int): The file's st_mode
+
+    Returns:
+        str: "elf" for ELF binaries, "script" for files starting with a shebang, "exec" for other files with
+        an executable bit, or None if the file doesn't look runnable
+
+    """
+    executable = mode & 0o111
+    if not executable and "." in os.path.basename(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(4)
+    except OSError:
+        magic = b""
+    if magic == b"\x7fELF":
+        return "elf"
+    elif magic[:2] == b"#!":
+        return "script"
+    elif executable:
+        return "exec"
+    return None
+
+
+def index_files(root_dir):
+    """Index a Directory's Files.
+
+    Walks root_dir once with os.scandir(), skipping a top-level .git directory and not following
+    symlinks to directories.
+
+    Args:
+        root_dir (str): Directory to index
+
+    Returns:
+        tuple[]: (path from root_dir, kind from file_kind()) for each file, sorted by path
+
+    """
+    root_dir = full(root_dir)
+    index = []
+    to_scan = [""]
+    while to_scan:
+        rel_dir = to_scan.pop()
+        try:
+            entries = os.scandir(os.path.join(root_dir, rel_dir))
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                rel = os.path.join(rel_dir, entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if rel != ".git":
+                            to_scan.append(rel)
+                        continue
+                    mode = entry.stat().st_mode  # Symlinks to files are indexed as what they point to
+                except OSError:
+                    continue
+                if stat.S_ISREG(mode):
+                    index.append((rel, file_kind(entry.path, mode)))
+    return sorted(index)
+
+
+def filter_path(path, include=[], exclude=[]):
+    """Check Path Against Filters.
+
+    Globs are matched against a path and each of its parent directories, so "docs" matches
+    everything in the docs directory, and "*.pdb" matches .pdb files at any depth.
+
+    Args:
+        path (str): Path relative to the program's directory
+        include (str[]): Globs of paths to keep. Everything is kept if empty. Defaults to [].
+        exclude (str[]): Globs of paths to skip. Defaults to [].
+
+    Returns:
+        bool: Whether the path matches an include glob (or there are none) and doesn't match any exclude glob
+
+    """
+    parts = path.split("/")
+    paths = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    if any(fnmatch.fnmatchcase(p, g) for p in paths for g in exclude):
+        return False
+    return not include or any(fnmatch.fnmatchcase(p, g) for p in paths for g in include)
+
+
+def within(path, directory):
+    """Check if a Path is Within a Directory.
+
+    Args:
+        path (str): Path to check. Symlinks in it are resolved, and it doesn't have to exist.
+        directory (str): Directory path should be in
+
+    Returns:
+        bool: Whether path resolves to directory or somewhere inside it
+
+    """
+    path = os.path.realpath(path)
+    directory = os.path.realpath(directory)
+    return path == directory or path.startswith(directory.rstrip("/") + "/")
+
+
+def extract_zip_member(z, info, dest):
+    """Extract Zip Member.
+
+    Extracts a member of a zip file, keeping the Unix permissions and symlinks that zipfile would otherwise lose.
+    Anything already at the member's path is replaced rather than written through, so an earlier symlink
+    can't redirect the member outside of dest.
+
+    Args:
+        z (zipfile.ZipFile): Zip file to extract from
+        info (zipfile.ZipInfo): Member to extract
+        dest (str): Directory to extract into
+
+    Returns:
+        str: Path the member was extracted to
+
+    Raises:
+        OSError: If the member, or the file a symlink member points to, would be outside of dest
+
+    """
+    name = "/".join([p for p in info.filename.split("/") if p not in ["", ".", ".."]])  # Same cleaning as ZipFile.extract()
+    target = os.path.join(dest, name)
+    if not within(os.path.dirname(target), dest):
+        raise OSError(errno.EPERM, "Zip member would be extracted outside of {}".format(dest), info.filename)
+    mode = info.external_attr >> 16
+    if stat.S_ISLNK(mode):
+        with z.open(info) as f:
+            link = f.read(4096).decode("utf-8", errors="surrogateescape")  # Longest path Linux allows
+        if not within(os.path.join(os.path.dirname(target), link), dest):
+            raise OSError(errno.EPERM, "Zip symlink points outside of {}".format(dest), info.filename)
+    try:
+        os.unlink(target)
+    except FileNotFoundError:
+        pass
+    if stat.S_ISLNK(mode):
+        os.symlink(link, target)
+        return target
+    with z.open(info) as src, open(target, "wb") as f:
+        shutil.copyfileobj(src, f, EXTRACT_BUFFER)
+    if mode:
+        os.chmod(target, stat.S_IMODE(mode))
+    return target
+
+
+def extract_zip_members(path, infos, dest, on_progress=None, workers=None):
+    """Extract Zip Members in Parallel.
+
+    Zip members are compressed independently, so they're decompressed across a thread pool, with each
+    thread reading through its own handle to the zip. Only the last member with each name is extracted,
+    so threads never race to write the same path. Directories are created up front so threads
+    never race to create the same one, and symlinks are made one at a time once every regular file
+    is written, so no file can be written through one.
+
+    Args:
+        path (str): Path to zip file
+        infos (zipfile.ZipInfo[]): Members to extract
+        dest (str): Directory to extract into
+        on_progress (function): Called with the number of bytes extracted so far and the total after each
+        member is extracted. Defaults to None.
+        workers (int): Most threads to extract with. Defaults to None, letting ThreadPoolExecutor decide.
+
+    Returns:
+        tuple[]: (path, mode) of every directory member extracted
+
+    """
+    dirs = []
+    files = []
+    links = []
+    made = set()
+    last = {}
+    for info in infos:
+        last["/".join([p for p in info.filename.split("/") if p not in ["", ".", ".."]])] = info  # Same cleaning as ZipFile.extract()
+    for name, info in last.items():
+        parent = os.path.dirname(name) if not info.is_dir() else name
+        if parent and parent not in made:
+            if not within(os.path.join(dest, parent), dest):
+                raise OSError(errno.EPERM, "Zip member would be extracted outside of {}".format(dest), info.filename)
+            os.makedirs(os.path.join(dest, parent), exist_ok=True)
+            made.add(parent)
+        if info.is_dir():
+            if info.external_attr >> 16:
+                dirs.append((os.path.join(dest, name), info.external_attr >> 16))
+        elif stat.S_ISLNK(info.external_attr >> 16):
+            links.append(info)
+        else:
+            files.append(info)
+    total = sum([info.file_size for info in files])
+    done = 0
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def extract(info):
+        if not hasattr(local, "z"):
+            local.z = zipfile.ZipFile(path)
+            with handles_lock:
+                handles.append(local.z)
+        extract_zip_member(local.z, info, dest)
+        return info.file_size
+
+    try:
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(extract, info) for info in files]
+            for future in as_completed(futures):
+                done += future.result()
+                if on_progress is not None:
+                    on_progress(done, total)
+    finally:
+        for z in handles:
+            z.close()
+    if links:
+        with zipfile.ZipFile(path) as z:
+            for info in links:
+                extract_zip_member(z, info, dest)
+    return dirs
+
+
+def extract_archive(path, dest, root="", include=[], exclude=[], on_progress=None, memory_limit=0):
+    """Extract Archive.
+
+    Extracts a .tar.gz, .tar.xz, or .zip in-process. Tars are streamed one member at a time, and zip
+    members are extracted in parallel with extract_zip_members(). Only members inside root are extracted,
+    and include and exclude globs are matched against member paths relative to root with filter_path(),
+    so filtered out members are never written. Hardlinks to filtered out members are skipped too.
+    Members and links that would end up outside of dest are refused.
+
+    Members are always copied out through fixed size buffers, and tar members are forgotten once
+    they're extracted, so memory use doesn't grow with the size of the archive or its members.
+
+    Args:
+        path (str): Path to archive to extract
+        dest (str): Directory to extract into
+        root (str): Directory in the archive that holds the program, or "" for the whole archive. Defaults to "".
+        include (str[]): Globs of paths to extract. Everything is extracted if empty. Defaults to [].
+        exclude (str[]): Globs of paths to not extract. Defaults to [].
+        on_progress (function): Called with the number of bytes extracted so far and the total as
+        extraction goes. The total is None for tars, since they're streamed. Defaults to None.
+        memory_limit (int): Bytes of memory extraction should stay within, which limits how many zip members are
+        extracted at once. Defaults to 0, for no limit.
+
+    Returns:
+        int: Number of members extracted
+
+    Raises:
+        OSError/tarfile.TarError: If the archive can't be read, or a member would end up outside of dest
+
+    """
+    def wanted(name):
+        name = "/".join([p for p in name.split("/") if p not in ["", "."]])
+        if root:
+            if name == root:
+                return True
+            if not name.startswith(root + "/"):
+                return False
+            name = name[len(root) + 1:]
+        return name == "" or filter_path(name, include, exclude)
+
+    dest = full(dest)
+    extracted = 0
+    dirs = []  # Directory permissions are set last, in case they don't allow writing into them
+    file_extension = extension(path)
+    if file_extension in ['.tar.gz', '.tar.xz']:
+        done = 0
+        with tarfile.open(full(path), "r|*", copybufsize=EXTRACT_BUFFER) as tar:
+            kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}  # Refuses links out of dest
+            for member in stream_members(tar):
+                if not wanted(member.name):
+                    continue
+                if member.islnk() and not wanted(member.linkname):
+                    # Streamed tars only hold a hardlink's data once, at its target, which was never written
+                    vprint("Skipping {}, since it links to filtered out {}".format(member.name, member.linkname))
+                    continue
+                if member.isdir():
+                    tar.extract(member, dest, set_attrs=False, **kwargs)
+                    dirs.append((os.path.join(dest, member.name), member.mode, member.mtime))
+                else:
+                    tar.extract(member, dest, **kwargs)
+                    done += member.size
+                    if on_progress is not None:
+                        on_progress(done, None)
+                extracted += 1
+    elif file_extension == '.zip':
+        with zipfile.ZipFile(full(path)) as z:
+            infos = [info for info in z.infolist() if wanted(info.filename)]
+        extracted = len(infos)
+        workers = max(1, memory_limit // EXTRACT_WORKER_MEMORY) if memory_limit > 0 else None
+        dirs = [(target, mode, None) for target, mode in extract_zip_members(full(path), infos, dest, on_progress, workers)]
+    for target, mode, mtime in reversed(dirs):
+        os.chmod(target, stat.S_IMODE(mode))
+        if mtime is not None:
+            os.utime(target, (mtime, mtime))
+    return extracted
+
+
 def exists(file_name):
     """Check if File Exists.
 
@@ -311,6 +757,25 @@ def locked():
     return exists("/tmp/tarstall-lock")
 
 
+def wait_for_unlock(timeout):
+    """Wait for tarstall to be Unlocked.
+
+    Args:
+        timeout (int): Most seconds to wait
+
+    Returns:
+        bool: Whether tarstall was unlocked in time
+
+    """
+    waited = 0
+    while locked():
+        if waited >= timeout:
+            return False
+        time.sleep(1)
+        waited += 1
+    return True
+
+
 def full(file_name):
     """Full Path.
 
@@ -326,6 +791,465 @@ def full(file_name):
     return os.path.abspath(os.path.expanduser(file_name))
 
 
+def dir_size(path):
+    """Get Directory Size.
+
+    Args:
+        path (str): Path to directory to get the size of
+
+    Returns:
+        int: Total size of all files in the directory, in bytes. Symlinks are not followed.
+
+    """
+    total = 0
+    try:
+        with os.scandir(full(path)) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    total += dir_size(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+
+def tree_usage(path, cache=None):
+    """Get Directory Tree Usage.
+
+    Totals the size and number of files in a directory tree. A directory's files are only looked at
+    again if its modification time changed since cache was made, which happens when files in it are
+    added, removed, or replaced by renaming, or if it's a different directory, such as one from a new
+    version of a program. Files written to in place aren't noticed.
+
+    Args:
+        path (str): Path to directory to total
+        cache (dict): Cache from a previous call for the same tree, or None to look at every file. Defaults to None.
+
+    Returns:
+        tuple: Total size in bytes, number of files, and the cache to pass to the next call
+
+    """
+    path = full(path)
+    old_cache = cache or {}
+    cache = {}
+    total_size = 0
+    total_files = 0
+    to_scan = [""]
+    while to_scan:
+        rel = to_scan.pop()
+        dir_path = os.path.join(path, rel)
+        try:
+            st = os.stat(dir_path)
+            key = [st.st_dev, st.st_ino, st.st_mtime_ns]  # Copied directories keep their mtime, but not their inode
+            entry = old_cache.get(rel)
+            if entry is None or entry[0] != key:
+                size = 0
+                files = 0
+                subdirs = []
+                with os.scandir(dir_path) as it:
+                    for e in it:
+                        if e.is_dir(follow_symlinks=False):
+                            subdirs.append(e.name)
+                        else:
+                            size += e.stat(follow_symlinks=False).st_size
+                            files += 1
+                entry = [key, size, files, subdirs]
+        except FileNotFoundError:
+            continue
+        cache[rel] = entry
+        total_size += entry[1]
+        total_files += entry[2]
+        to_scan.extend(os.path.join(rel, d) for d in entry[3])
+    return total_size, total_files, cache
+
+
+FICLONE = 0x40049409  # ioctl for making reflink copies, see ioctl_ficlone(2)
+
+
+def copy_contents(in_fd, out_fd, size):
+    """Copy Contents Between Files.
+
+    Uses the fastest method available out of a reflink clone (on filesystems that support them,
+    such as btrfs and xfs), copy_file_range(), sendfile(), or a regular read and write. Some filesystems
+    make copy_file_range() or sendfile() copy nothing instead of failing, so a method that copies
+    nothing at all falls back to the next one.
+
+    Args:
+        in_fd (int): File descriptor to copy from
+        out_fd (int): File descriptor to copy to
+        size (int): Number of bytes to copy
+
+    """
+    try:
+        fcntl.ioctl(out_fd, FICLONE, in_fd)
+        return
+    except OSError:
+        pass
+    copied = 0
+    try:
+        while copied < size:
+            sent = os.copy_file_range(in_fd, out_fd, size - copied)
+            if sent == 0:
+                break
+            copied += sent
+        else:
+            return
+        if copied:
+            return  # The file shrank while it was being copied
+    except (OSError, AttributeError):
+        pass  # Falls back from wherever the file offsets were left
+    try:
+        while copied < size:
+            sent = os.sendfile(out_fd, in_fd, None, size - copied)
+            if sent == 0:
+                break
+            copied += sent
+        else:
+            return
+        if copied:
+            return
+    except OSError:
+        pass
+    while True:
+        buf = os.read(in_fd, 1048576)
+        if not buf:
+            return
+        os.write(out_fd, buf)
+
+
+def temp_name(path):
+    """Get Temporary Name.
+
+    Args:
+        path (str): Path to get a temporary name for
+
+    Returns:
+        str: Path to a temporary file in the same directory as path
+
+    """
+    return os.path.join(os.path.dirname(path), ".{}.tarstall-tmp".format(os.path.basename(path)))
+
+
+def exchange(path_a, path_b):
+    """Atomically Exchange Two Paths.
+
+    Uses renameat2() with RENAME_EXCHANGE, so neither path is ever missing.
+
+    Args:
+        path_a (str): Path to exchange with path_b
+        path_b (str): Path to exchange with path_a
+
+    Returns:
+        bool: Whether the paths were exchanged. False if the kernel, libc, or filesystem doesn't support it.
+
+    """
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return False
+    at_fdcwd = -100
+    rename_exchange = 2
+    if renameat2(at_fdcwd, os.fsencode(path_a), at_fdcwd, os.fsencode(path_b), rename_exchange) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+        return False
+    raise OSError(err, os.strerror(err), path_a)
+
+
+def copy_file(src, dest):
+    """Copy File.
+
+    Copies a file's contents, permissions and modification time with copy_contents(). The copy is
+    written next to dest and renamed over it, so files hardlinked to the old dest are left untouched.
+
+    Args:
+        src (str): Path to file to copy
+        dest (str): Path to copy the file to
+
+    Returns:
+        int: Number of bytes copied
+
+    """
+    st = os.stat(src)
+    tmp = temp_name(dest)
+    try:
+        with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+            copy_contents(fsrc.fileno(), fdst.fileno(), st.st_size)
+        os.chmod(tmp, stat.S_IMODE(st.st_mode))
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return st.st_size
+
+
+def copy_symlink(src, dest):
+    """Copy Symlink.
+
+    Args:
+        src (str): Path to symlink to copy
+        dest (str): Path to create the new symlink at
+
+    Returns:
+        int: 0, since no file contents are copied
+
+    """
+    tmp = temp_name(dest)
+    try:
+        os.remove(tmp)
+    except FileNotFoundError:
+        pass
+    os.symlink(os.readlink(src), tmp)
+    os.replace(tmp, dest)
+    return 0
+
+
+def hash_file(path, algorithm="sha256"):
+    """Hash File.
+
+    Args:
+        path (str): Path to file to hash
+        algorithm (str): Any algorithm supported by hashlib. Defaults to "sha256".
+
+    Returns:
+        str: Hex digest of the file's contents
+
+    """
+    file_hash = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1048576), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def sync_file(src, dest, checksum=False):
+    """Sync File.
+
+    Copies src to dest with copy_file(), unless dest is already a file with the same size,
+    permissions, and modification time (or contents if checksum is True) as src.
+
+    Args:
+        src (str): Path to file to copy
+        dest (str): Path to copy the file to
+        checksum (bool): Whether to compare contents instead of modification times. Defaults to False.
+
+    Returns:
+        int: Number of bytes written
+
+    """
+    try:
+        src_stat = os.stat(src)
+        dest_stat = os.lstat(dest)
+        if stat.S_ISREG(dest_stat.st_mode) and src_stat.st_size == dest_stat.st_size and \
+        stat.S_IMODE(src_stat.st_mode) == stat.S_IMODE(dest_stat.st_mode):
+            if checksum and hash_file(src) == hash_file(dest):
+                return 0
+            elif not checksum and src_stat.st_mtime_ns == dest_stat.st_mtime_ns:
+                return 0
+    except FileNotFoundError:
+        pass
+    return copy_file(src, dest)
+
+
+def sync_symlink(src, dest):
+    """Sync Symlink.
+
+    Copies a symlink with copy_symlink(), unless dest is already a symlink pointing to the same place.
+
+    Args:
+        src (str): Path to symlink to copy
+        dest (str): Path to create the new symlink at
+
+    Returns:
+        int: 0, since no file contents are copied
+
+    """
+    if os.path.islink(dest) and os.readlink(dest) == os.readlink(src):
+        return 0
+    return copy_symlink(src, dest)
+
+
+def queue_copies(src, dest, executor, futures, dirs, sync=False, checksum=False, delete=False):
+    """Queue Directory Copies.
+
+    Recursively creates the directories in src at dest, and submits copies of all files
+    and symlinks to executor. Used by copy_tree().
+
+    Args:
+        src (str): Directory to copy from
+        dest (str): Directory to copy to
+        executor (ThreadPoolExecutor): Executor to submit copies to
+        futures (Future[]): List to add the futures of submitted copies to
+        dirs (tuple[]): List to add (os.stat_result of src, dest) to for every directory created
+        sync (bool): Whether to skip unchanged files using sync_file() and sync_symlink(). Defaults to False.
+        checksum (bool): Passed to sync_file(). Defaults to False.
+        delete (bool): Whether to delete anything in dest that isn't in src. Defaults to False.
+
+    """
+    if os.path.lexists(dest) and not (os.path.isdir(dest) and not os.path.islink(dest)):
+        os.remove(dest)
+    os.makedirs(dest, exist_ok=True)
+    dirs.append((os.stat(src), dest))
+    with os.scandir(src) as it:
+        entries = list(it)
+    if delete:
+        names = [entry.name for entry in entries]
+        for name in os.listdir(dest):
+            if name not in names:
+                vprint("Deleting {}".format(os.path.join(dest, name)))
+                if os.path.isdir(os.path.join(dest, name)) and not os.path.islink(os.path.join(dest, name)):
+                    shutil.rmtree(os.path.join(dest, name))
+                else:
+                    os.remove(os.path.join(dest, name))
+    for entry in entries:
+        target = os.path.join(dest, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            queue_copies(entry.path, target, executor, futures, dirs, sync, checksum, delete)
+            continue
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        if entry.is_symlink():
+            if sync:
+                futures.append(executor.submit(sync_symlink, entry.path, target))
+            else:
+                futures.append(executor.submit(copy_symlink, entry.path, target))
+        elif entry.is_file(follow_symlinks=False):
+            if sync:
+                futures.append(executor.submit(sync_file, entry.path, target, checksum))
+            else:
+                futures.append(executor.submit(copy_file, entry.path, target))
+        else:
+            vprint("Skipping special file {}".format(entry.path))
+
+
+def copy_tree(src, dest, sync=False, checksum=False, delete=False):
+    """Copy Directory Tree.
+
+    Copies the contents of src into dest, the same way "rsync -a src/ dest" does. Files are
+    copied in parallel with copy_file(), and permissions, modification times and symlinks are preserved.
+
+    Args:
+        src (str): Directory to copy the contents of
+        dest (str): Directory to copy into. Created if it doesn't exist.
+        sync (bool): Whether to only copy files that have changed (see sync_tree()). Defaults to False.
+        checksum (bool): Whether to compare contents instead of modification times when syncing. Defaults to False.
+        delete (bool): Whether to delete anything in dest that isn't in src. Defaults to False.
+
+    Returns:
+        int: Number of bytes written
+
+    """
+    src = full(src)
+    dest = full(dest)
+    dirs = []
+    futures = []
+    with ThreadPoolExecutor() as executor:
+        queue_copies(src, dest, executor, futures, dirs, sync, checksum, delete)
+        written = sum([f.result() for f in futures])
+    for st, d in reversed(dirs):  # Children come before their parents, so a read-only parent can't block anything
+        os.chmod(d, stat.S_IMODE(st.st_mode))
+        os.utime(d, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return written
+
+
+def sync_tree(src, dest, checksum=False, delete=False):
+    """Sync Directory Tree.
+
+    Like copy_tree(), but files in dest that already have the same size, permissions and modification time
+    (or contents, if checksum is True) as their counterpart in src aren't copied again.
+
+    Args:
+        src (str): Directory to sync the contents of
+        dest (str): Directory to sync into. Created if it doesn't exist.
+        checksum (bool): Whether to compare contents instead of modification times. Defaults to False.
+        delete (bool): Whether to delete anything in dest that isn't in src. Defaults to False.
+
+    Returns:
+        int: Number of bytes written
+
+    """
+    return copy_tree(src, dest, True, checksum, delete)
+
+
+def link_tree(src, dest, reflink=True, skip=[]):
+    """Link Directory Tree.
+
+    Recreates src at dest without copying any file contents. Files become reflink copies where the
+    filesystem supports them, and hardlinks to the files in src otherwise. Symlinks, permissions,
+    and modification times are kept.
+
+    Args:
+        src (str): Directory to recreate
+        dest (str): Path to recreate src at. Shouldn't exist already.
+        reflink (bool): Whether to try making reflink copies. Defaults to True.
+        skip (str[]): Names of entries directly in src to leave out. Defaults to [].
+
+    Returns:
+        bool: Whether reflink copies worked, or can still be tried
+
+    """
+    src = full(src)
+    dest = full(dest)
+    os.makedirs(dest)
+    with os.scandir(src) as it:
+        for entry in it:
+            if entry.name in skip:
+                continue
+            target = os.path.join(dest, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                reflink = link_tree(entry.path, target, reflink)
+            elif entry.is_symlink():
+                os.symlink(os.readlink(entry.path), target)
+            elif entry.is_file(follow_symlinks=False):
+                if reflink:
+                    try:
+                        with open(entry.path, "rb") as fsrc, open(target, "wb") as fdst:
+                            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                        st = entry.stat(follow_symlinks=False)
+                        os.chmod(target, stat.S_IMODE(st.st_mode))
+                        os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+                        continue
+                    except OSError:
+                        reflink = False  # The filesystem doesn't support reflinks, so hardlink from now on
+                        try:
+                            os.remove(target)
+                        except FileNotFoundError:
+                            pass
+                os.link(entry.path, target)
+    st = os.stat(src)
+    os.chmod(dest, stat.S_IMODE(st.st_mode))
+    os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return reflink
+
+
+def move_tree(src, dest):
+    """Move Directory Tree.
+
+    Renames src to dest. If they're on different filesystems or dest is a directory that isn't
+    empty, src is copied into dest with copy_tree() then deleted.
+
+    Args:
+        src (str): Directory to move
+        dest (str): Path to move the directory to
+
+    """
+    src = full(src)
+    dest = full(dest)
+    try:
+        os.rename(src, dest)
+    except OSError as e:
+        if e.errno not in [errno.EXDEV, errno.ENOTEMPTY, errno.EEXIST]:
+            raise
+        copy_tree(src, dest)
+        shutil.rmtree(src)
+
+
 def spaceify(file_name):
     """Add Backslashes.
 
@@ -512,6 +1436,7 @@ mode = read_config("Mode")
 
 install_bar = None  # Holds a progress bar if we're in a GUI
 output_area = None  # Holds a text area if we're in a GUI (for displaying status messages)
+gui_events = None  # Set by the GUI while it runs operations on its worker thread. Called with an event name and value.
 
 if db != {}:
     vprint("Database loaded successfully!")
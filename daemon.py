@@ -0,0 +1,330 @@
+"""tarstall: A package manager for managing archives
+    Copyright (C) 2020  hammy3502
+
+    tarstall is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    tarstall is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with tarstall.  If not, see <https://www.gnu.org/licenses/>."""
+
+import os
+import json
+import fcntl
+import socket
+import signal
+import struct
+import threading
+import socketserver
+
+import config
+
+SOCKET = "~/.tarstall/daemon.sock"
+PIDFILE = "~/.tarstall/daemon.pid"  # Locked by the running daemon, so only one can start
+
+# prog_manage functions clients can call. Anything that asks the user questions is left out, since
+# the daemon has no one to ask.
+EXPOSED = ["pre_install", "uninstall", "update_program", "update_programs", "rollback", "freeze", "thaw",
+"freeze_unused", "dedupe_programs", "maintain_git_programs", "disk_usage", "verify_program", "list_files",
+"list_programs", "check_programs", "repair_programs", "set_filters", "set_update_checksum", "add_upgrade_url",
+"remove_update_url", "update_script", "rename", "list_snapshots", "pathify", "add_binlink",
+"remove_paths_and_binlinks", "create_desktop", "remove_desktop", "which_program", "find_conflicts", "sync_report"]
+# Calls in EXPOSED that only read, so they're run right away instead of waiting for calls that change things
+READ_ONLY = ["list_files", "list_programs", "check_programs", "which_program", "find_conflicts", "list_snapshots"]
+
+SCHEDULE_INTERVAL = 3600  # Seconds between runs of tarstall's scheduled jobs while the daemon is up
+
+lock = threading.Lock()  # Calls that change things are run one at a time, since they all share prog_manage and config's state
+db_mtime = None  # Modification time of the database when it was last loaded or written
+
+
+def refresh_db():
+    """Refresh Database.
+
+    Reloads the database if something other than the daemon, such as a tarstall run without the daemon,
+    changed it since it was last loaded.
+
+    """
+    global db_mtime
+    try:
+        mtime = os.stat(config.full("~/.tarstall/database")).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if mtime != db_mtime:
+        config.vprint("Database changed on disk, reloading it")
+        config.db = config.get_db()
+        db_mtime = mtime
+
+
+def note_db_mtime():
+    """Note the Database's Modification Time.
+
+    Ran after the daemon changes the database, so refresh_db() doesn't reload the daemon's own changes.
+
+    """
+    global db_mtime
+    try:
+        db_mtime = os.stat(config.full("~/.tarstall/database")).st_mtime_ns
+    except FileNotFoundError:
+        pass
+
+
+def run_scheduled(prog_manage):
+    """Run Scheduled Jobs.
+
+    Runs prog_manage.scheduled_jobs() between calls, since clients skip tarstall's startup while the daemon is running.
+
+    Args:
+        prog_manage (module): prog_manage module to run the jobs with
+
+    Returns:
+        bool: Whether the jobs ran. They don't if another instance of tarstall is running.
+
+    """
+    with lock:
+        if config.locked():
+            return False
+        config.lock()
+        try:
+            refresh_db()
+            prog_manage.scheduled_jobs()
+        except Exception as e:
+            config.vprint("Scheduled jobs failed: {}: {}".format(type(e).__name__, e))
+        finally:
+            config.unlock()
+            note_db_mtime()
+    return True
+
+
+def run_read(prog_manage, name, request):
+    """Run a Read-Only Call.
+
+    Read-only calls don't wait for the lock. The database is only refreshed from disk if nothing holds the lock,
+    since a call that's running may have changes it hasn't written yet.
+
+    Args:
+        prog_manage (module): prog_manage module to run the call with
+        name (str): Function in READ_ONLY to call
+        request (dict): Request from a client, with "args" and "kwargs" keys
+
+    Returns:
+        dict: The same as run_call()
+
+    """
+    if lock.acquire(blocking=False):
+        try:
+            refresh_db()
+        finally:
+            lock.release()
+    for attempt in range(3):
+        try:
+            return {"status": "Success", "result": getattr(prog_manage, name)(*request.get("args", []), **request.get("kwargs", {}))}
+        except RuntimeError as e:  # A call running alongside changed the database while this one read it
+            error = e
+        except Exception as e:
+            return {"status": "Error", "error": "{}: {}".format(type(e).__name__, e)}
+    return {"status": "Error", "error": "{}: {}".format(type(error).__name__, error)}
+
+
+def run_call(prog_manage, request):
+    """Run a Call.
+
+    Args:
+        prog_manage (module): prog_manage module to run the call with
+        request (dict): Request from a client, with "call", "args", and "kwargs" keys
+
+    Returns:
+        dict: Response to send back, with "status" set to "Success" and the call's "result", or "status" set to
+        "Bad call", "Locked", or "Error" with an "error" message
+
+    """
+    name = request.get("call")
+    if name not in EXPOSED:
+        return {"status": "Bad call", "error": "{} can't be called through the daemon".format(name)}
+    if name in READ_ONLY:
+        return run_read(prog_manage, name, request)
+    with lock:
+        if config.locked():
+            return {"status": "Locked", "error": "Another instance of tarstall is running"}
+        config.lock()
+        try:
+            refresh_db()
+            result = getattr(prog_manage, name)(*request.get("args", []), **request.get("kwargs", {}))
+            return {"status": "Success", "result": result}
+        except Exception as e:
+            return {"status": "Error", "error": "{}: {}".format(type(e).__name__, e)}
+        finally:
+            config.unlock()
+            note_db_mtime()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Handles a Client Connection.
+
+    Each line a client sends is a JSON request, and each is answered with a line of JSON. Clients must be
+    running as the same user as the daemon.
+
+    """
+
+    def handle(self):
+        creds = self.request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        if struct.unpack("3i", creds)[1] != os.getuid():
+            return
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = {"status": "Bad call", "error": "Requests must be JSON"}
+            else:
+                response = run_call(self.server.prog_manage, request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def running():
+    """Check if the Daemon is Running.
+
+    Returns:
+        bool: Whether a daemon is accepting connections on SOCKET
+
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(config.full(SOCKET))
+        return True
+    except OSError:
+        return False
+
+
+def serve():
+    """Run the Daemon.
+
+    Runs tarstall's startup once, then serves calls on SOCKET until interrupted or sent SIGTERM. The scheduled jobs
+    tarstall's startup runs are run again every SCHEDULE_INTERVAL seconds.
+
+    Returns:
+        str: "Running" if a daemon is already running, a status from tarstall_startup() if tarstall can't
+        start, or "Stopped" once the daemon is stopped.
+
+    """
+    pidfile = open(config.full(PIDFILE), "a+")  # Held open, and so locked, for as long as the daemon runs
+    try:
+        fcntl.flock(pidfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        pidfile.close()
+        return "Running"
+    pidfile.truncate(0)
+    pidfile.write(str(os.getpid()))
+    pidfile.flush()
+    try:
+        return run_server()
+    finally:
+        pidfile.close()
+
+
+def run_server():
+    """Run the Daemon's Server.
+
+    The second half of serve(), run once it holds PIDFILE, so no other daemon can be starting alongside it.
+
+    Returns:
+        str: The same as serve(), other than "Running"
+
+    """
+    import prog_manage
+    status = prog_manage.tarstall_startup()
+    if status not in ["Good", "Missing Deps", "Root"]:
+        return status
+    config.unlock()  # Taken again for each call instead
+    refresh_db()
+    config.mode = "daemon"  # Nothing to print progress to or ask questions with
+    path = config.full(SOCKET)
+    try:
+        os.remove(path)  # Left over from a daemon that didn't stop cleanly, since this one holds PIDFILE
+    except FileNotFoundError:
+        pass
+    old_umask = os.umask(0o177)  # Only the user can connect
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(old_umask)
+    server.prog_manage = prog_manage
+    stopped = threading.Event()
+
+    def schedule():
+        while not stopped.wait(SCHEDULE_INTERVAL):
+            run_scheduled(prog_manage)
+
+    threading.Thread(target=schedule, daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    config.vprint("Serving on {}".format(path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return "Stopped"
+
+
+class Client:
+    """Thin Client for the Daemon.
+
+    Has a method for each function in EXPOSED, taking the same arguments and returning the same result
+    as calling it from prog_manage directly. One connection is kept open for all calls, and the database
+    is reloaded after each one so config.db reflects what the daemon did.
+
+    """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(config.full(SOCKET))
+        self.file = self.sock.makefile("rwb")
+
+    def call(self, name, *args, **kwargs):
+        """Call a Function in the Daemon.
+
+        Args:
+            name (str): Function in EXPOSED to call
+
+        Returns:
+            Any type: What the function returned. Tuples come back as lists.
+
+        Raises:
+            RuntimeError: If the daemon couldn't run the call
+
+        """
+        self.file.write(json.dumps({"call": name, "args": args, "kwargs": kwargs}).encode() + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise RuntimeError("The tarstall daemon closed the connection")
+        response = json.loads(line)
+        if response["status"] != "Success":
+            raise RuntimeError(response["error"])
+        config.db = config.get_db()
+        return response["result"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __getattr__(self, name):
+        if name not in EXPOSED:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
@@ -0,0 +1,356 @@
+"""tarstall: A package manager for managing archives
+    Copyright (C) 2020  hammy3502
+
+    tarstall is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    tarstall is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with tarstall.  If not, see <https://www.gnu.org/licenses/>."""
+
+import os
+import re
+import asyncio
+from subprocess import DEVNULL
+
+import config
+import generic
+import prog_manage
+
+PERCENT = re.compile(r"(\d{1,3})%")
+
+# Coroutines only wait on downloads and subprocesses. Everything that touches the database or
+# ~/.tarstall runs between awaits, so it's never interleaved with another coroutine's changes.
+
+
+async def run_command(command, cwd=None, on_line=None):
+    """Run a Command.
+
+    Reads the command's output as it comes, splitting it on both newlines and carriage returns,
+    since git and wget redraw their progress with carriage returns.
+
+    Args:
+        command (str[]): Command to run
+        cwd (str): Directory to run the command in. Defaults to None.
+        on_line (function): Called with each line of output. Defaults to None.
+
+    Returns:
+        tuple: Exit code of the command and its output
+
+    Raises:
+        OSError: If the command can't be run
+
+    """
+    if config.verbose and on_line is None:
+        process = await asyncio.create_subprocess_exec(*command, cwd=cwd)
+        return (await process.wait(), "")
+    process = await asyncio.create_subprocess_exec(*command, cwd=cwd, stdin=DEVNULL,
+    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    output = []
+    pending = ""
+    while True:
+        chunk = await process.stdout.read(4096)
+        if not chunk:
+            break
+        text = chunk.decode("utf-8", errors="replace")
+        output.append(text)
+        lines = re.split(r"[\r\n]", pending + text)
+        pending = lines.pop()
+        if on_line is not None:
+            for line in lines:
+                on_line(line)
+    if pending and on_line is not None:
+        on_line(pending)
+    return (await process.wait(), "".join(output))
+
+
+def git_progress(on_progress):
+    """Make a Git Progress Parser.
+
+    Args:
+        on_progress (function): Called with how far along the git operation is, from 0 to 1
+
+    Returns:
+        function: Line handler for run_command()
+
+    """
+    def on_line(line):
+        match = PERCENT.search(line)
+        if match is None:
+            return
+        percent = int(match.group(1)) / 100
+        if "Receiving objects:" in line:
+            on_progress(0.6 * percent)
+        elif "Resolving deltas:" in line:
+            on_progress(0.6 + 0.4 * percent)
+        elif "Unpacking objects:" in line:
+            on_progress(percent)
+    return on_line
+
+
+async def git_clone(url, branch=None, sparse_path=None, dest=None, cwd=None, on_progress=None):
+    """Clone a Git Repository.
+
+    The awaitable version of prog_manage.git_clone_with_progress().
+
+    Args:
+        url (str): URL to git clone from
+        branch (str): If specified, use a custom branch to clone from. Defaults to None.
+        sparse_path (str): If specified, only check out this subdirectory of the repository. Defaults to None.
+        dest (str): If specified, the directory to clone into. Defaults to None.
+        cwd (str): Directory to run git in. Defaults to None.
+        on_progress (function): Called with how far along the clone is, from 0 to 1. Defaults to None.
+
+    Returns:
+        int: Exit code from git
+
+    """
+    command = ["git", "clone"]
+    if branch is not None:
+        command += ["--branch", branch]
+    if sparse_path is not None:
+        command += ["--filter=blob:none", "--sparse"]
+    command.append(url)
+    if dest is not None:
+        command.append(dest)
+    if on_progress is not None:
+        command.append("--progress")
+    err, output = await run_command(command, cwd, None if on_progress is None else git_progress(on_progress))
+    if err == 0 and sparse_path is not None:
+        if dest is None:
+            dest = config.name(url)
+        config.vprint("Checking out {} from repository".format(sparse_path))
+        err, output = await run_command(["git", "sparse-checkout", "set", "--cone", sparse_path],
+        os.path.join(cwd or os.getcwd(), dest))
+    return err
+
+
+async def wget(url, cwd=None, on_progress=None):
+    """Download a File with wget.
+
+    The awaitable version of prog_manage.wget_with_progress().
+
+    Args:
+        url (str): URL to file to grab
+        cwd (str): Directory to download the file to. Defaults to None.
+        on_progress (function): Called with how far along the download is, from 0 to 1. Defaults to None.
+
+    Returns:
+        int: Exit code from wget
+
+    """
+    def on_line(line):
+        match = PERCENT.search(line)
+        if match is not None and on_progress is not None:
+            on_progress(int(match.group(1)) / 100)
+    err, output = await run_command(["wget", "--progress=dot", url], cwd, on_line if on_progress is not None else None)
+    return err
+
+
+async def update_git_program(program, script=False, fetched=False, show_progress=False, progress_modifier=1):
+    """Update a Git Program.
+
+    prog_manage.update_git_program() runs this.
+
+    Args:
+        program (str): Name of program to update
+        script (bool): Whether to run the program's upgrade script in its staged version before it's activated.
+        Defaults to False.
+        fetched (bool): Whether the program's repository was already fetched, so its upstream only needs to be
+        fast-forwarded into its checkout instead of pulled. Defaults to False.
+        show_progress (bool): Whether to display a progress bar. Defaults to False.
+        progress_modifier (int): The number to divide the total progress by. Defaults to 1.
+
+    Returns:
+        str: "No git" if git isn't found, "Error updating" on a generic failure, "Success" on a successful update,
+        "No update" if the program is already up-to-date, or a failure from run_upgrade_script().
+
+    """
+    if not config.check_bin("git"):
+        config.vprint("git isn't installed!")
+        return "No git"
+    update = prog_manage.start_git_update(program, script)
+    generic.progress(5 / progress_modifier, show_progress)
+    command = ["git", "merge", "--ff-only", "@{u}"] if fetched else ["git", "pull"]
+    err, output = await run_command(command, update[0], lambda line: None)
+    generic.progress(95 / progress_modifier, show_progress)
+    if script and err == 0 and "Already up to date." not in output:
+        status = await run_upgrade_script(program, update[0])
+        if status != "Success":
+            prog_manage.trash(update[0])
+            prog_manage.empty_trash()
+            return status
+    status = prog_manage.finish_git_update(program, update, err, output)
+    generic.progress(100 / progress_modifier, show_progress)
+    return status
+
+
+async def wget_program(program, force=False, script=False, show_progress=False, progress_modifier=1):
+    """Download and Install a Program's Update URL.
+
+    prog_manage.wget_program() runs this. Each program downloads to its own directory, so any number
+    can download at once.
+
+    Args:
+        program (str): Program that has an update_url to update
+        force (bool): Whether to install the archive even if it's the same as the installed one. Defaults to False.
+        script (bool): Passed to prog_manage.install_update(). Defaults to False.
+        show_progress (bool): Whether to display a progress bar. Defaults to False.
+        progress_modifier (int): The number to divide the total progress by. Defaults to 1.
+
+    Returns:
+        str: "No wget", "Wget error", "Checksum error" if the archive doesn't match the program's
+        update_checksum, "No update" if the archive is the same as the one already installed,
+        "Install error" if install() fails, a failure from run_upgrade_script(), or "Success" on success.
+
+    """
+    if not prog_manage.can_update and not config.check_bin("wget"):
+        return "No wget"
+    temp_dir = prog_manage.make_update_dir(program, "/tmp/tarstall-temp2-{}".format(program))
+    expected = None
+    if config.db["programs"][program]["update_checksum"] is not None:
+        expected = await asyncio.to_thread(prog_manage.get_update_checksum, program, temp_dir)
+        if expected == "Checksum error":
+            return expected
+    generic.progress(10 / progress_modifier, show_progress)
+    config.vprint("Downloading archive...")
+    archive = os.path.join(temp_dir, program + ".tar.gz")
+    digests = await asyncio.to_thread(prog_manage.download, config.db["programs"][program]["update_url"], archive,
+    "sha256" if expected is None else expected[0], 10 / progress_modifier, 65 / progress_modifier, show_progress)
+    return prog_manage.install_update(program, archive, digests, expected, force, show_progress, progress_modifier, script)
+
+
+async def run_upgrade_script(program, program_dir=None):
+    """Run a Program's Upgrade Script.
+
+    The awaitable version of prog_manage.run_upgrade_script(), which is run on another thread, since
+    installs run it from inside updates.
+
+    Args:
+        program (str): Program with a post_upgrade_script to run
+        program_dir (str): Directory to run the script in. Defaults to None, running it in ~/.tarstall/bin/<program>.
+
+    Returns:
+        str: The same as prog_manage.run_upgrade_script()
+
+    """
+    return await asyncio.to_thread(prog_manage.run_upgrade_script, program, program_dir)
+
+
+async def update_program(program, force=False, fetched=False, show_progress=False):
+    """Update a Program.
+
+    prog_manage.update_program() runs this. Frozen programs are thawed first.
+
+    Args:
+        program (str): Name of program to update
+        force (bool): Whether to reinstall a program from its update URL even if the archive hasn't changed. Defaults to False.
+        fetched (bool): Passed to update_git_program(). Defaults to False.
+        show_progress (bool): Whether to display a progress bar. Defaults to False.
+
+    Returns:
+        str: "No script" if the upgrade script doesn't exist, "Does not update" if the program has nothing
+        to update it with, "Success", or a failure from update_git_program(), wget_program(), or run_upgrade_script()
+
+    """
+    if config.db["programs"][program]["frozen"] is not None:
+        status = prog_manage.thaw(program)
+        if status != "Success":
+            return status
+    script = config.db["programs"][program]["post_upgrade_script"]
+    if script is not None and not config.exists(script):
+        config.db["programs"][program]["post_upgrade_script"] = None
+        config.write_db()
+        return "No script"
+    updates = config.db["programs"][program]["install_type"] == "git" or config.db["programs"][program]["update_url"] is not None
+    progs = int(updates) + int(script is not None)  # Each gets an equal share of the progress bar
+    status = None
+    staged = prog_manage.uses_versions(program)
+    in_version = script is not None and staged  # The script runs in the new version before it's activated
+    if config.db["programs"][program]["install_type"] == "git":
+        status = await update_git_program(program, in_version, fetched, show_progress, progs)
+    elif config.db["programs"][program]["update_url"] is not None:
+        status = await wget_program(program, force, in_version, show_progress, progs)
+    if status is not None and (status != "Success" or script is None or in_version):
+        if status == "No update":
+            generic.progress(100, show_progress)
+        return status
+    if script is None:
+        return "Does not update"
+    generic.progress(50 * (progs - 1), show_progress)
+    if staged:
+        version_dir = prog_manage.stage_version(program, True)
+        status = await run_upgrade_script(program, version_dir)
+        if status != "Success":
+            prog_manage.trash(version_dir)
+            prog_manage.empty_trash()
+            return status
+        prog_manage.activate_version(program, version_dir)
+    else:
+        if status is None:
+            prog_manage.snapshot_program(program)
+        status = await run_upgrade_script(program)
+        if status != "Success":
+            return status
+    generic.progress(100, show_progress)
+    prog_manage.record_program(program)
+    return "Success"
+
+
+async def update_programs(force=False, limit=8, on_update=None):
+    """Update Programs.
+
+    The awaitable version of prog_manage.update_programs(), which updates up to limit programs at once.
+    Worktrees share their parent's repository, so a parent and its worktrees are updated together:
+    the repository is fetched once, then each checkout is fast-forwarded one after the other.
+
+    Args:
+        force (bool): Passed to update_program(). Defaults to False.
+        limit (int): Most programs to update at once. Defaults to 8.
+        on_update (function): Called with each program's name and status once it's updated. Defaults to None.
+
+    Returns:
+        str/dict: The same as prog_manage.update_programs()
+
+    """
+    if len(config.db["programs"].keys()) == 0:
+        return "No programs"
+    if not config.check_bin("git"):
+        return "No git"
+    semaphore = asyncio.Semaphore(limit)
+    statuses = {}
+
+    def updates(p):
+        if not config.db["programs"][p]["update_url"] and (config.db["programs"][p]["install_type"] == "git" or config.db["programs"][p]["post_upgrade_script"]):
+            return True
+        return bool(config.db["programs"][p]["update_url"] and config.read_config("UpdateURLPrograms"))
+
+    async def update(programs):
+        for p in programs:
+            if not updates(p):
+                statuses[p] = "Does not update"
+        programs = [p for p in programs if p not in statuses]
+        if not programs:
+            return
+        async with semaphore:
+            fetched = False
+            if len(programs) > 1:  # Concurrent pulls in worktrees of one repository fight over its refs
+                config.vprint("Fetching {} for its worktrees".format(programs[0]))
+                err, output = await run_command(["git", "fetch"], config.full("~/.tarstall/bin/{}".format(programs[0])),
+                lambda line: None)
+                fetched = err == 0
+            for p in programs:
+                statuses[p] = await update_program(p, force, fetched)
+                if on_update is not None:
+                    on_update(p, statuses[p])
+
+    groups = [[p] + prog_manage.get_worktrees(p) for p in list(config.db["programs"].keys())
+    if config.db["programs"][p]["worktree_of"] not in config.db["programs"]]
+    await asyncio.gather(*[update(g) for g in groups])
+    return {p: statuses[p] for p in config.db["programs"] if p in statuses}
@@ -17,6 +17,8 @@
 import sys
 import config
 import os
+import functools
+import threading
 
 if config.mode == "gui":
     try:
@@ -25,59 +27,170 @@ if config.mode == "gui":
         pass  # This will be caught by tarstall.py, let's not worry about it here.
 
 
-def file_browser(root_dir):
+def on_gui_thread(func):
+    """Run on the GUI Thread.
+
+    PySimpleGUI windows can only be used from the main thread. When the GUI's worker thread calls a function
+    wrapped with this, the call is sent to the main thread as a "-CALL-" event, and the worker waits for its result.
+
+    Args:
+        func (function): Function that opens windows in GUI mode
+
+    Returns:
+        function: Wrapped function
+
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if config.mode != "gui" or config.gui_events is None or threading.current_thread() is threading.main_thread():
+            return func(*args, **kwargs)
+        call = {"func": func, "args": args, "kwargs": kwargs, "done": threading.Event()}
+        config.gui_events("-CALL-", call)
+        call["done"].wait()
+        if "error" in call:
+            raise call["error"]
+        return call["result"]
+    return wrapper
+
+
+def run_call(call):
+    """Run a Call from the Worker Thread.
+
+    Args:
+        call (dict): Value of a "-CALL-" event sent by on_gui_thread()
+
+    """
+    try:
+        call["result"] = call["func"](*call["args"], **call["kwargs"])
+    except BaseException as e:
+        call["error"] = e
+    call["done"].set()
+
+
+file_indexes = {}  # Maps the real path, inode, and mtime of each directory file_browser() has indexed to its index
+
+
+def fuzzy_score(query, path):
+    """Score a Fuzzy Match.
+
+    Args:
+        query (str): Text to search for, ignoring case
+        path (str): Path to match against
+
+    Returns:
+        tuple: Score that sorts better matches first, or None if the characters of query don't all appear in path in order
+
+    """
+    query = query.lower()
+    path = path.lower()
+    if query in os.path.basename(path):
+        return (0, len(path))
+    elif query in path:
+        return (1, len(path))
+    start = None
+    pos = -1
+    for c in query:
+        pos = path.find(c, pos + 1)
+        if pos == -1:
+            return None
+        if start is None:
+            start = pos
+    return (2, pos - start, len(path))
+
+
+def launch_targets(files, program=None):
+    """Find Likely Launch Targets.
+
+    Args:
+        files (tuple[]): Index from config.index_files()
+        program (str): Name of the program the files are from, to put files named like it first. Defaults to None.
+
+    Returns:
+        tuple[]: Entries of files that can be run, most likely to be the program's launcher first
+
+    """
+    kinds = {"elf": 0, "script": 1, "exec": 2}
+    program = (program or "").lower()
+
+    def rank(entry):
+        path, kind = entry
+        name = os.path.basename(path).lower().split(".")[0]
+        named = program != "" and name != "" and (program in name or name in program)
+        return (not named, os.path.dirname(path).split("/")[-1] != "bin", kinds[kind], path.count("/"), path)
+
+    return sorted([(p, k) for p, k in files if k is not None and ".so" not in os.path.basename(p)], key=rank)
+
+
+def search_files(files, query):
+    """Fuzzy Search Files.
+
+    Args:
+        files (tuple[]): Index from config.index_files()
+        query (str): Text to search for
+
+    Returns:
+        tuple[]: Entries of files matching query, with files that can be run and closer matches first
+
+    """
+    scored = []
+    for p, k in files:
+        score = fuzzy_score(query, p)
+        if score is not None:
+            scored.append((k is None, score, p, k))
+    scored.sort()
+    return [(p, k) for runnable, score, p, k in scored]
+
+
+def file_browser(root_dir, program=None):
     """File Browser.
 
-    File browser for CLI that allows the choosing of files in folders.
+    Lets the user pick a file in root_dir, starting with the files most likely to launch the program. Typing
+    anything else fuzzy searches every file. Directories are only indexed once until they change, so picking
+    more files from one is instant.
 
     Args:
         root_dir (str): Path to top directory. Anything above this will be unaccessible
-    
+        program (str): Program root_dir belongs to, used to suggest files named after it first. Defaults to None.
+
     Returns:
-        str: path/to/file/from/root_dir/file.txt (Path to the selected file from root_dir (NOT FROM / !!!!)
+        str: path/to/file/from/root_dir/file.txt (Path to the selected file from root_dir (NOT FROM / !!!!), or None if cancelled
 
     """
     root_dir = config.full(root_dir)
-    os.chdir(root_dir)
-    all_files = os.listdir()
-    folders = []
-    files = []
-    for f in all_files:
-        if os.path.isdir("./{}".format(f)):
-            folders.append(f)
+    # New versions get new paths, and in place changes to the top directory change its mtime. Anything deeper
+    # can change unnoticed, so the GUI clears file_indexes whenever an operation finishes.
+    info = os.stat(root_dir)
+    key = (os.path.realpath(root_dir), info.st_ino, info.st_mtime_ns)
+    if key not in file_indexes:
+        config.vprint("Indexing files in {}".format(root_dir))
+        file_indexes[key] = config.index_files(root_dir)
+    files = file_indexes[key]
+    paths = set([p for p, k in files])
+    heading = "Likely launch targets:"
+    shown = launch_targets(files, program)[:10]
+    while True:
+        if shown == []:
+            listing = "No files found!"
         else:
-            files.append(f)
-    msg = "Folders: " + ' '.join(folders) + "\n" + "Files: " + ' '.join(files)
-    file_chosen = 'Cool fact. This line was originally written on line 163.'
-    current_folder_path = []
-    while file_chosen not in files:
-        all_files = os.listdir()
-        folders = []
-        files = []
-        for f in all_files:
-            if os.path.isdir("./{}".format(f)):
-                folders.append(f)
-            else:
-                files.append(f)
-        msg = "Folders: " + ' '.join(folders) + "\n" + "Files: " + ' '.join(files)
-        file_chosen = ask(msg + '\n\nPlease enter a file listed above. If you would like to cancel, type exit. If you would like to go up a directory, type "..": ')
-        if file_chosen == "exit":
+            listing = "\n".join(["{} - {}{}".format(i + 1, p, " (executable)" if k is not None else "")
+            for i, (p, k) in enumerate(shown)])
+        answer = ask(heading + "\n" + listing + "\n\nPlease enter the number of a file above, type to search for a file, "
+        "or type exit to cancel: ")
+        if answer == "exit":
             return None
-        elif file_chosen in folders:
-            os.chdir(config.full("./{}".format(file_chosen)))
-            current_folder_path.append(file_chosen)
-        elif file_chosen == "..":
-            if os.getcwd() == root_dir:
-                pprint("\nCan't go up a directory!\n")
-            else:
-                os.chdir(config.full(".."))
-    if current_folder_path != []:
-        extra_slash = "/"
-    else:
-        extra_slash = ""
-    return "/".join(current_folder_path) + extra_slash + file_chosen
+        elif answer.isdigit() and 1 <= int(answer) <= len(shown):
+            return shown[int(answer) - 1][0]
+        elif answer in paths:
+            return answer
+        elif answer == "":
+            heading = "Likely launch targets:"
+            shown = launch_targets(files, program)[:10]
+        else:
+            heading = 'Files matching "{}":'.format(answer)
+            shown = search_files(files, answer)[:10]
 
 
+@on_gui_thread
 def ask(question):
     """Get Any User Input.
 
@@ -105,6 +218,7 @@ def ask(question):
                 return values["answer"]
 
 
+@on_gui_thread
 def ask_file(question):
     """Get User Input for File.
 
@@ -179,6 +293,7 @@ def easy_get_action(options, replacements=[]):
     return get_input(msg, options_list, default, gui_labels, True)
 
 
+@on_gui_thread
 def get_input(question, options, default, gui_labels=[], from_easy=False):
     """Get User Input.
 
@@ -255,6 +370,27 @@ def endi(state):
     return "disabled"
 
 
+def human_size(num_bytes):
+    """Bytes to Human-Readable Size.
+
+    Args:
+        num_bytes (int): Number of bytes
+
+    Returns:
+        str: Size with a unit attached, such as "1.5 MB"
+
+    """
+    size = float(num_bytes)
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(size) < 1024:
+            if unit == "B":
+                return "{} {}".format(int(size), unit)
+            return "{:.1f} {}".format(size, unit)
+        size /= 1024
+    return "{:.1f} TB".format(size)
+
+
+@on_gui_thread
 def pprint(st, title="tarstall-gui"):
     """Print Depending on Mode.
 
@@ -269,6 +405,7 @@ def pprint(st, title="tarstall-gui"):
         print(st)
 
 
+@on_gui_thread
 def ppause(st, title="tarstall-gui"):
     """Print and Pause if CLI.
 
@@ -296,7 +433,9 @@ def progress(val, should_show=True):
 
     """
     if config.mode == "gui":
-        if config.install_bar is not None:
+        if config.gui_events is not None:
+            config.gui_events("-PROGRESS-", val)
+        elif config.install_bar is not None:
             config.install_bar.UpdateBar(val)
     elif config.mode == "cli" and not config.verbose and should_show:
         try:
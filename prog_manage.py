@@ -21,12 +21,25 @@ import sys
 import re
 import getpass
 import datetime
+import time
+import stat
+import json
+import hashlib
+import fcntl
+import tarfile
+import zipfile
+import shlex
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 try:
     import requests
     can_update = True
+    download_errors = (OSError, requests.RequestException)
+    session = requests.Session()  # Reuses connections across downloads, such as when running as a daemon
 except ImportError:
     can_update = False
+    download_errors = (OSError,)
 
 import config
 import generic
@@ -36,6 +49,8 @@ if config.verbose:
 else:
     c_out = DEVNULL
 
+last_sync = None  # [program, bytes written, bytes skipped] from the last sync_program(), until sync_report() takes it
+
 
 def wget_with_progress(url, start_percent, end_percent, show_progress=True):
     """Wget with Progress.
@@ -52,27 +67,134 @@ def wget_with_progress(url, start_percent, end_percent, show_progress=True):
         int: Exit code from wget
 
     """
-    if config.verbose:
-        process = Popen(["wget", url])
-    else:
-        process = Popen(["wget", url], stdout=PIPE, stderr=STDOUT)
+    import engine  # engine imports prog_manage
+    on_progress = None
     if not config.verbose and show_progress:
-        while process.poll() is None:
-            p_status = process.stdout.readline().decode("utf-8")
-            try:
-                index = p_status.rfind("%")
-                if index != -1:
-                    percent_complete = int(p_status[index-2:index].strip())
-                    if percent_complete > 0:
-                        generic.progress(start_percent + ((end_percent - start_percent) * (percent_complete / 100)))
-            except (TypeError, ValueError):
-                pass
+        on_progress = lambda done: generic.progress(start_percent + (end_percent - start_percent) * done)
+    return asyncio.run(engine.wget(url, on_progress=on_progress))
+
+
+def download(url, dest, algorithm="sha256", start_percent=0, end_percent=100, show_progress=True):
+    """Download and Hash a File.
+
+    The file is hashed as it downloads, so it never has to be read back. It's always hashed with SHA-256 too,
+    since that's what installs identify archives by. Uses requests if it's installed, and streams the file
+    out of wget otherwise.
+
+    Args:
+        url (str): URL to file to download
+        dest (str): Path to download the file to
+        algorithm (str): Any algorithm supported by hashlib. Defaults to "sha256".
+        start_percent (int): Where generic.progress() last was. Defaults to 0.
+        end_percent (int): Where generic.progress() should end up. Defaults to 100.
+        show_progress (bool): Whether to show progress. Defaults to True.
+
+    Returns:
+        dict/None: Hex digests of the downloaded file keyed by algorithm, always including "sha256",
+        or None if the download failed
+
+    """
+    hashes = {a: hashlib.new(a) for a in set([algorithm, "sha256"])}
+    try:
+        with open(dest, "wb") as f:
+            if can_update:
+                with session.get(url, stream=True, timeout=30) as r:
+                    r.raise_for_status()
+                    total = int(r.headers.get("Content-Length", 0))
+                    done = 0
+                    for chunk in r.iter_content(1048576):
+                        for h in hashes.values():
+                            h.update(chunk)
+                        f.write(chunk)
+                        done += len(chunk)
+                        if total:
+                            generic.progress(start_percent + (end_percent - start_percent) * done / total, show_progress)
+            else:
+                process = Popen(["wget", "-q", "-O", "-", url], stdout=PIPE, stderr=c_out)
+                for chunk in iter(lambda: process.stdout.read(1048576), b""):
+                    for h in hashes.values():
+                        h.update(chunk)
+                    f.write(chunk)
+                if process.wait() != 0:
+                    return None
+    except download_errors:
+        config.vprint("Failed to download {}".format(url))
+        return None
+    generic.progress(end_percent, show_progress)
+    return {a: h.hexdigest() for a, h in hashes.items()}
+
+
+def parse_checksum(checksum, file_name=None):
+    """Parse a Checksum.
+
+    Args:
+        checksum (str): A hex digest, optionally prefixed with an algorithm (ie. "sha512:<digest>"), or the contents of
+        a checksum file as made by sha256sum and similar programs
+        file_name (str): Name of the file to find the digest of in a checksum file with multiple entries. A lone entry is
+        used whatever its name. Defaults to None.
+
+    Returns:
+        tuple/None: The hashlib algorithm and the hex digest, or None if the checksum couldn't be understood
+
+    """
+    lengths = {32: "md5", 40: "sha1", 56: "sha224", 64: "sha256", 96: "sha384", 128: "sha512"}
+    lines = [l.strip() for l in checksum.strip().splitlines() if l.strip()]
+    if len(lines) == 1 and re.fullmatch(r"(\w+:)?[0-9a-fA-F]+", lines[0]):
+        algorithm, _, digest = lines[0].rpartition(":")
     else:
-        process.wait()
-    return process.poll()
+        entries = []
+        for l in lines:
+            match = re.fullmatch(r"([0-9a-fA-F]+) [ *](.+)", l)  # sha256sum and friends
+            bsd_match = re.fullmatch(r"\w+ \((.+)\) = ([0-9a-fA-F]+)", l)  # BSD style
+            if match:
+                entries.append((os.path.basename(match.group(2)), match.group(1)))
+            elif bsd_match:
+                entries.append((os.path.basename(bsd_match.group(1)), bsd_match.group(2)))
+        if len(entries) == 1:
+            digest = entries[0][1]  # A lone entry is for our file, whatever it's named
+        else:
+            digests = [d for n, d in entries if file_name is None or n == file_name]
+            if not digests:
+                return None
+            digest = digests[0]
+        algorithm = ""
+    if algorithm == "":
+        algorithm = lengths.get(len(digest), "")
+    algorithm = algorithm.lower()
+    if algorithm not in hashlib.algorithms_available:
+        return None
+    return algorithm, digest.lower()
+
 
+def get_update_checksum(program, temp_dir="/tmp/tarstall-temp2"):
+    """Get the Expected Checksum of a Program's Update.
 
-def git_clone_with_progress(url, start_percent, end_percent, branch=None):
+    Args:
+        program (str): Program with an update_checksum to get
+        temp_dir (str): Directory to download checksum files to. Defaults to "/tmp/tarstall-temp2".
+
+    Returns:
+        tuple/str: The hashlib algorithm and hex digest the program's update should have, or "Checksum error"
+        if the checksum couldn't be obtained.
+
+    """
+    checksum = config.db["programs"][program]["update_checksum"]
+    if re.match(r"https?://", checksum):
+        config.vprint("Downloading checksum file")
+        checksum_file = os.path.join(temp_dir, "checksums")
+        if download(checksum, checksum_file, show_progress=False) is None:
+            return "Checksum error"
+        with open(checksum_file, errors="replace") as f:
+            checksum = f.read()
+        os.remove(checksum_file)
+    url_file = os.path.basename(config.db["programs"][program]["update_url"].split("?")[0])
+    parsed = parse_checksum(checksum, url_file)
+    if parsed is None:
+        return "Checksum error"
+    return parsed
+
+
+def git_clone_with_progress(url, start_percent, end_percent, branch=None, sparse_path=None, dest=None):
     """Performs a Git Clone with Progress.
 
     Args:
@@ -80,36 +202,18 @@ def git_clone_with_progress(url, start_percent, end_percent, branch=None):
         start_percent (int): Starting value for generic.progress()
         end_percent (int): Ending value for generic.progress()
         branch (str): If specified, use a custom branch to clone from. Defaults to None.
+        sparse_path (str): If specified, only check out this subdirectory of the repository
+        using a cone mode sparse-checkout. Defaults to None.
+        dest (str): If specified, the directory to clone into. Defaults to None.
 
     Returns:
         [int: Exit code from git
     """
-    command = ["git", "clone"]
-    if branch is not None:
-        command.append("--branch")
-        command.append(branch)
-    command.append(url)
-    if config.verbose:
-        err = call(command)
-    else:
-        command.append("--progress")
-        process = Popen(command, stderr=STDOUT, stdout=PIPE, universal_newlines=True)
-        multiplier = end_percent - start_percent
-        while process.poll() is None:
-            p_status = process.stdout.readline()
-            try:
-                percent_complete = int(p_status[p_status.rfind("%")-2:p_status.rfind("%")].strip())
-                if percent_complete > 0:
-                    if "Resolving deltas:" in p_status:
-                        generic.progress(start_percent + int(multiplier * 0.6) + (int(multiplier * 0.4) * (percent_complete / 100)))
-                    elif "Receiving objects:" in p_status:
-                        generic.progress(start_percent + (int(multiplier * 0.6) * (percent_complete / 100)))
-                    elif "Unpacking objects:" in p_status:
-                        generic.progress(start_percent + (multiplier * (percent_complete / 100)))
-            except (TypeError, ValueError):
-                    pass
-        err = process.poll()
-    return err
+    import engine  # engine imports prog_manage
+    on_progress = None
+    if not config.verbose:
+        on_progress = lambda done: generic.progress(start_percent + (end_percent - start_percent) * done)
+    return asyncio.run(engine.git_clone(url, branch, sparse_path, dest, on_progress=on_progress))
 
 
 def reinstall_deps():
@@ -163,197 +267,1135 @@ def repair_tarstall():
     return update(True, True)
     
 
-def repair_db():
-    """Attempts to Repair Tarstall DB.
+def repair_db():
+    """Attempts to Repair Tarstall DB.
+
+    WARNING: THIS SHOULD NOT BE USED UNLESS THE DATABASE CANNOT BE RECOVERED OTHERWISE
+    BECAUSE OF LIMITED KNOWLEDGE OF THE CODE ITSELF, THINGS SUCH AS PROGRAM TYPE HAVE TO BE ASSUMED
+    THIS ONLY EXISTS AS A LAST RESORT OPTION!!!!!!!
+    """
+    config.vprint("Attempting repair of database, things are going to get crazy!")
+
+    config.vprint("Getting stock database to build off of")
+    new_db = get_default_db()
+    generic.progress(5)
+
+    config.vprint("Re-discovering programs:")
+    for pf in os.listdir(config.full("~/.tarstall/bin/")):
+        if pf.startswith("."):
+            continue
+        config.vprint("Re-discovering " + pf, end="\r")
+        new_db["programs"][pf] = discover_program(pf)
+    
+    generic.progress(20)
+    
+    config.vprint("Reading tarstall's bashrc file for further operations...")
+    with open(config.full("~/.tarstall/.bashrc")) as f:
+        bashrc_lines = f.readlines()
+    
+    generic.progress(25)
+
+    config.vprint("Re-registering PATHs")
+    for l in bashrc_lines:
+        if l.startswith("export PATH=$PATH") and '#' in l:
+            program = l[l.find("#")+2:].rstrip()
+            config.vprint("Re-registering PATH for " + program, end="\r")
+            new_db["programs"][program]["has_path"] = True
+    
+    generic.progress(45)
+    
+    config.vprint("Re-registering binlinks")
+    for l in bashrc_lines:
+        if l.startswith("alias ") and '#' in l:
+            program = l[l.find("#")+2:].rstrip()
+            config.vprint("Re-registering a binlink or binlinks for " + program, end="\r")
+            binlinked_file = l[6:l.find("=")]
+            new_db["programs"][program]["binlinks"].append(binlinked_file)
+    
+    generic.progress(70)
+    
+    config.vprint("Backing up old database...")
+    date_str = datetime.datetime.today().strftime("%d-%m-%Y-%H-%M-%S")
+    move(config.full("~/.tarstall/database"), config.full("~/.tarstall/database-backup-{}.bak".format(date_str)))
+
+    generic.progress(95)
+
+    config.vprint("Writing new database...")
+    config.db = new_db
+    rebuild_indexes()
+    config.write_db()
+
+    config.vprint("Database write complete!")
+    generic.progress(100)
+    return
+
+
+
+def discover_program(program):
+    """Discover a Program.
+
+    Guesses the database entry for a program from its files.
+
+    Args:
+        program (str): Program in ~/.tarstall/bin to discover
+
+    Returns:
+        dict: Database entry for the program, with no PATH, binlinks, or desktops
+
+    """
+    prog_info = {"install_type": "default", "desktops": [], 
+    "post_upgrade_script": None, "update_url": None, "has_path": False, "binlinks": [], "worktree_of": None,
+    "disk_usage": None, "update_checksum": None, "filters": None, "archive": None, "frozen": None, "commands": [],
+    "activated": int(time.time())}
+    files = os.listdir(config.full("~/.tarstall/bin/{}".format(program)))
+    if ".git" in files:
+        prog_info["install_type"] = "git"
+        if os.path.isfile(config.full("~/.tarstall/bin/{}/.git".format(program))):
+            with open(config.full("~/.tarstall/bin/{}/.git".format(program))) as f:
+                git_dir = f.read()
+            prog_info["worktree_of"] = re.sub(r".*/\.tarstall/bin/([^/]*)/\.git/.*", r"\1", git_dir.rstrip())
+    elif len(files) == 1:
+        prog_info["install_type"] = "single"
+    return prog_info
+
+
+def shell_lines(program, name=None, file_chosen=None):
+    """Get Shell Lines.
+
+    Args:
+        program (str): Program the lines are for
+        name (str): Name of the binlink, or None to get the lines for adding the program to PATH. Defaults to None.
+        file_chosen (str): File in the program the binlink runs. Defaults to None.
+
+    Returns:
+        dict: The line to add to tarstall's .bashrc and .fishrc, with those file names as keys
+
+    """
+    if name is None:
+        return {".bashrc": "export PATH=$PATH:~/.tarstall/bin/" + program + ' # ' + program,
+        ".fishrc": "set PATH $PATH ~/.tarstall/bin/" + program + ' # ' + program}
+    return {".bashrc": 'alias ' + name + "='cd " + config.full('~/.tarstall/bin/' + program) + '/ && ./' + file_chosen + "' # " + program,
+    ".fishrc": "function " + name + ";cd " + config.full("~/.tarstall/bin/" + program) + "/;./" + file_chosen + ";end # " + program}
+
+
+def read_shell_file(shell_file):
+    """Read PATHs and Binlinks from a Shell File.
+
+    Args:
+        shell_file (str): ".bashrc" or ".fishrc"
+
+    Returns:
+        dict: Program names as keys, and dicts as values containing "path" (the line adding the program to PATH, or None)
+        and "binlinks" (binlink names as keys, and tuples of the file the binlink runs and its line as values).
+
+    """
+    if shell_file == ".bashrc":
+        path_re = re.compile(r"export PATH=\$PATH:~/\.tarstall/bin/\S+ # (\S+)$")
+        binlink_re = re.compile(r"alias (\S+)='cd \S+/ && \./(.*)' # (\S+)$")
+    else:
+        path_re = re.compile(r"set PATH \$PATH ~/\.tarstall/bin/\S+ # (\S+)$")
+        binlink_re = re.compile(r"function (\S+);cd \S+/;\./(.*);end # (\S+)$")
+    programs = {}
+    try:
+        with open(config.full("~/.tarstall/" + shell_file)) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return programs
+    for l in lines:
+        match = path_re.match(l)
+        if match:
+            programs.setdefault(match.group(1), {"path": None, "binlinks": {}})["path"] = l
+            continue
+        match = binlink_re.match(l)
+        if match:
+            programs.setdefault(match.group(3), {"path": None, "binlinks": {}})["binlinks"][match.group(1)] = (match.group(2), l)
+    return programs
+
+
+def scan_bin():
+    """Scan Program Directories.
+
+    Returns:
+        set: Names of the directories in ~/.tarstall/bin
+
+    """
+    with os.scandir(config.full("~/.tarstall/bin")) as it:
+        return {e.name for e in it if not e.name.startswith(".") and e.is_dir()}
+
+
+def scan_desktops():
+    """Scan .desktop Files.
+
+    Returns:
+        dict: Names of .desktop files that run a tarstall program as keys, and the program they run as values
+
+    """
+    desktops = {}
+    bin_path = "Path=" + config.full("~/.tarstall/bin/")
+    try:
+        with os.scandir(config.full("~/.local/share/applications")) as it:
+            for e in it:
+                if not (e.name.endswith(".desktop") and e.is_file()):
+                    continue
+                with open(e.path, errors="replace") as f:
+                    for l in f:
+                        if l.startswith(bin_path):
+                            desktops[e.name[:-8]] = l[len(bin_path):].rstrip().rstrip("/")
+                            break
+    except FileNotFoundError:
+        pass
+    return desktops
+
+
+def check_programs():
+    """Check Programs.
+
+    Compares the database against ~/.tarstall/bin, tarstall's .bashrc and .fishrc, and ~/.local/share/applications,
+    which are all scanned at once. The database is taken as correct for programs it knows about,
+    and entries for programs it doesn't know about are guessed with discover_program().
+
+    Returns:
+        list: Tuples of an issue, the program it's for, and details for repair_programs(). Issues can be:
+        "Missing files", "Untracked files", "Missing PATH", "Untracked PATH", "Missing binlink", "Untracked binlink",
+        "Missing desktop", or "Untracked desktop".
+
+    """
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        bin_future = executor.submit(scan_bin)
+        shell_futures = {sf: executor.submit(read_shell_file, sf) for sf in [".bashrc", ".fishrc"]}
+        desktop_future = executor.submit(scan_desktops)
+    on_disk = bin_future.result()
+    shells = {sf: shell_futures[sf].result() for sf in shell_futures}
+    desktops = desktop_future.result()
+    empty = {"path": None, "binlinks": {}}
+    issues = []
+    expected = {}
+    for p in sorted(config.db["programs"]):
+        if p in on_disk:
+            expected[p] = config.db["programs"][p]
+        else:
+            issues.append(("Missing files", p, None))
+    for p in sorted(on_disk - set(config.db["programs"])):
+        prog_info = discover_program(p)
+        prog_info["has_path"] = any(shells[sf].get(p, empty)["path"] is not None for sf in shells)
+        prog_info["binlinks"] = sorted(set().union(*[shells[sf].get(p, empty)["binlinks"] for sf in shells]))
+        prog_info["desktops"] = sorted(d for d in desktops if desktops[d] == p)
+        expected[p] = prog_info
+        issues.append(("Untracked files", p, prog_info))
+    for p in expected:
+        for sf in shells:
+            found = shells[sf].get(p, empty)
+            if expected[p]["has_path"] and found["path"] is None:
+                issues.append(("Missing PATH", p, sf))
+            for b in expected[p]["binlinks"]:
+                if b not in found["binlinks"]:
+                    file_chosen = None
+                    for other in shells:
+                        if b in shells[other].get(p, empty)["binlinks"]:
+                            file_chosen = shells[other][p]["binlinks"][b][0]
+                    issues.append(("Missing binlink", p, (sf, b, file_chosen)))
+        for d in expected[p]["desktops"]:
+            if d not in desktops:
+                issues.append(("Missing desktop", p, d))
+    for sf in shells:
+        for p in sorted(shells[sf]):
+            found = shells[sf][p]
+            if found["path"] is not None and not (p in expected and expected[p]["has_path"]):
+                issues.append(("Untracked PATH", p, (sf, found["path"])))
+            for b in sorted(found["binlinks"]):
+                if not (p in expected and b in expected[p]["binlinks"]):
+                    issues.append(("Untracked binlink", p, (sf, found["binlinks"][b][1])))
+    for d in sorted(desktops):
+        if not (desktops[d] in expected and d in expected[desktops[d]]["desktops"]):
+            issues.append(("Untracked desktop", desktops[d], d))
+    return issues
+
+
+def repair_programs(issues):
+    """Repair Programs.
+
+    Repairs only the issues found by check_programs(). Programs missing their files are removed from the database
+    along with their PATHs, binlinks, and .desktop files. Shell lines the database doesn't know about are removed,
+    and .desktop files the database doesn't know about are added to it, or removed if their program isn't installed.
+
+    Args:
+        issues (list): Issues from check_programs()
+
+    """
+    for issue, program, detail in issues:
+        config.vprint("Repairing {} for {}".format(issue.lower(), program))
+        if issue == "Missing files":
+            for sf in [".bashrc", ".fishrc"]:
+                config.remove_line(program, "~/.tarstall/" + sf, "poundword")
+            for d in config.db["programs"][program]["desktops"]:
+                try:
+                    os.remove(config.full("~/.local/share/applications/{}.desktop".format(d)))
+                except FileNotFoundError:
+                    pass
+            del config.db["programs"][program]
+        elif issue == "Untracked files":
+            config.db["programs"][program] = detail
+        elif issue == "Missing PATH":
+            config.add_line("\n" + shell_lines(program)[detail], "~/.tarstall/" + detail)
+        elif issue == "Missing binlink":
+            sf, name, file_chosen = detail
+            if file_chosen is not None:
+                config.add_line("\n" + shell_lines(program, name, file_chosen)[sf], "~/.tarstall/" + sf)
+            elif name in config.db["programs"][program]["binlinks"]:
+                config.db["programs"][program]["binlinks"].remove(name)
+        elif issue == "Untracked PATH" or issue == "Untracked binlink":
+            config.remove_line(detail[1], "~/.tarstall/" + detail[0], "fuzzy")
+        elif issue == "Missing desktop":
+            config.db["programs"][program]["desktops"].remove(detail)
+        elif issue == "Untracked desktop":
+            if program in config.db["programs"]:
+                config.db["programs"][program]["desktops"].append(detail)
+            else:
+                os.remove(config.full("~/.local/share/applications/{}.desktop".format(detail)))
+    rebuild_indexes()
+    config.write_db()
+
+
+def add_upgrade_url(program, url):
+    """Adds an Upgrade URL to a Program.
+
+    Args:
+        program (str): The program that will be upgraded
+        url (str): The URL containing the archive to upgrade from. THIS MUST BE A VALID URL!!!!!
+
+    """
+    config.db["programs"][program]["update_url"] = url
+    config.write_db()
+
+
+def remove_update_url(program):
+    """Removes Upgrade URL for Program.
+
+    The program's update checksum is removed alongside it.
+
+    Args:
+        program (str): Program to remove URL of.
+
+    """
+    config.db["programs"][program]["update_url"] = None
+    config.db["programs"][program]["update_checksum"] = None
+    config.write_db()
+
+
+def set_filters(program, include, exclude):
+    """Set Install Filters.
+
+    Sets globs of paths to include and exclude when installing and overwriting a program from an archive,
+    including when it's updated from its update URL. Globs match paths relative to the program's directory,
+    and also match everything inside matching directories.
+
+    Args:
+        program (str): Program to set the filters of
+        include (str[]): Globs of paths to install. Everything is installed if empty.
+        exclude (str[]): Globs of paths to not install
+
+    Returns:
+        str: "Success", or "Wiped" if there are no filters anymore.
+
+    """
+    include = [g.strip().strip("/") for g in include if g.strip().strip("/")]
+    exclude = [g.strip().strip("/") for g in exclude if g.strip().strip("/")]
+    config.db["programs"][program]["archive"] = None  # So the next install applies the new filters
+    if not include and not exclude:
+        config.db["programs"][program]["filters"] = None
+        config.write_db()
+        return "Wiped"
+    config.db["programs"][program]["filters"] = {"include": include, "exclude": exclude}
+    config.write_db()
+    return "Success"
+
+
+def set_update_checksum(program, checksum):
+    """Set Update Checksum.
+
+    Sets what the archive at a program's update URL is checked against before it's installed.
+
+    Args:
+        program (str): Program to set the update checksum of
+        checksum (str): A hex digest, optionally prefixed with an algorithm (ie. "sha512:<digest>"), or
+        a URL to a checksum file as made by sha256sum and similar programs. Blank to remove the checksum.
+
+    Returns:
+        str: "Bad checksum" if the checksum isn't understood, "Success" on success, and "Wiped" on clear.
+
+    """
+    if checksum == "":
+        config.db["programs"][program]["update_checksum"] = None
+        config.write_db()
+        return "Wiped"
+    if re.match(r"https?://", checksum) is None:
+        if re.search(r"\s", checksum.strip()) is not None or parse_checksum(checksum) is None:
+            return "Bad checksum"
+        checksum = checksum.strip()
+    config.db["programs"][program]["update_checksum"] = checksum
+    config.write_db()
+    return "Success"
+
+
+def wget_program(program, show_progress=False, progress_modifier=1, force=False, script=False):
+    """Wget an Archive and Overwrite Program.
+
+    The blocking version of engine.wget_program().
+
+    Args:
+        program (str): Program that has an update_url to update
+        show_progress (bool): Whether to display a progress bar. Defaults to False.
+        progress_modifier (int): The number to divide the total progress by. Defaults to 1.
+        force (bool): Whether to install the archive even if it's the same as the installed one. Defaults to False.
+        script (bool): Whether to run the program's upgrade script in its new version before it's activated.
+        Defaults to False.
+
+    Returns:
+        str: The same as engine.wget_program()
+
+    """
+    import engine  # engine imports prog_manage
+    return asyncio.run(engine.wget_program(program, force, script, show_progress, progress_modifier))
+
+
+def make_update_dir(program, temp_dir="/tmp/tarstall-temp2"):
+    """Make a Directory to Download an Update to.
+
+    Args:
+        program (str): Program being updated
+        temp_dir (str): Directory to create, emptying it if it already exists. Defaults to "/tmp/tarstall-temp2".
+
+    Returns:
+        str: Path to the directory
+
+    """
+    config.vprint("Creating second temp folder for archive.")
+    try:
+        rmtree(config.full(temp_dir))
+    except FileNotFoundError:
+        pass
+    os.mkdir(temp_dir)
+    return temp_dir
+
+
+def install_update(program, archive, digests, expected=None, force=False, show_progress=False, progress_modifier=1, script=False):
+    """Install a Downloaded Update.
+
+    The second half of wget_program(), run once the program's update URL has been downloaded.
+    The directory the archive is in is deleted afterwards.
+
+    Args:
+        program (str): Program being updated
+        archive (str): Path to the downloaded archive
+        digests (dict/None): Digests from download(), or None if the download failed
+        expected (tuple): The algorithm and digest the archive should have from get_update_checksum(),
+        or None if it doesn't have a checksum. Defaults to None.
+        force (bool): Whether to install the archive even if it's the same as the installed one. Defaults to False.
+        show_progress (bool): Whether to display a progress bar. Defaults to False.
+        progress_modifier (int): The number to divide the total progress by. Defaults to 1.
+        script (bool): Passed to pre_install(). Defaults to False.
+
+    Returns:
+        str: The same as wget_program()
+
+    """
+    temp_dir = os.path.dirname(archive)
+    if digests is None:
+        rmtree(temp_dir, ignore_errors=True)
+        return "Wget error"
+    if expected is not None and digests[expected[0]] != expected[1]:
+        config.vprint("Archive checksum {} doesn't match {}!".format(digests[expected[0]], expected[1]))
+        rmtree(temp_dir)
+        return "Checksum error"
+    digest = digests["sha256"]
+    if not force and is_installed_from(program, digest):
+        config.vprint("Downloaded archive is the same as the installed one, not installing it.")
+        rmtree(temp_dir)
+        generic.progress(100 / progress_modifier, show_progress)
+        return "No update"
+    generic.progress(70 / progress_modifier, show_progress)
+    config.vprint("Using install to install the program.")
+    inst_status = pre_install(archive, True, show_progress=False, force=True, script=script, sha256=digest)
+    generic.progress(95 / progress_modifier, show_progress)
+    rmtree(temp_dir, ignore_errors=True)
+    generic.progress(100 / progress_modifier, show_progress)
+    if inst_status in ["Script error", "OSError"]:
+        return inst_status
+    elif inst_status != "Installed":
+        return "Install error"
+    else:
+        return "Success"
+
+
+def list_snapshots(program):
+    """List Snapshots of a Program.
+
+    Args:
+        program (str): Program to list the snapshots of
+
+    Returns:
+        str[]: Names of the program's snapshots, oldest first
+
+    """
+    try:
+        return sorted([s for s in os.listdir(config.full("~/.tarstall/snapshots/{}".format(program))) if not s.startswith(".")])
+    except FileNotFoundError:
+        return []
+
+
+def version_name():
+    """Get Name for a New Version or Snapshot.
+
+    Returns:
+        str: Name made from the current time, so names sort oldest first
+
+    """
+    return datetime.datetime.today().strftime("%Y-%m-%d-%H-%M-%S-%f")
+
+
+def trim_snapshots(program):
+    """Remove Old Snapshots.
+
+    Removes all but the newest SnapshotCount snapshots of a program.
+
+    Args:
+        program (str): Program to remove the old snapshots of
+
+    """
+    count = config.read_config("SnapshotCount")
+    old_snapshots = list_snapshots(program)[:-count or None]
+    for s in old_snapshots:
+        config.vprint("Removing old snapshot {}".format(s))
+        remove_snapshot(program, s)
+    if old_snapshots:
+        empty_trash()
+
+
+def snapshot_program(program):
+    """Snapshot a Program.
+
+    Takes a snapshot of a program's directory with config.link_tree(), so it can be restored with rollback().
+    Only the newest SnapshotCount snapshots are kept. Snapshots share their files with the program, so
+    updates must replace files rather than write to them, which git, copy_tree(), and sync_tree() all do.
+    Programs with an upgrade script are snapshotted with config.copy_tree() instead, since scripts may
+    write to files in place.
+
+    Args:
+        program (str): Program to snapshot
+
+    Returns:
+        str/None: Name of the snapshot, or None if snapshots are disabled.
+
+    """
+    if config.read_config("SnapshotCount") <= 0:
+        return None
+    snapshot = version_name()
+    config.vprint("Taking snapshot of {}".format(program))
+    program_dir = config.full("~/.tarstall/bin/{}".format(program))
+    snapshot_dir = config.full("~/.tarstall/snapshots/{}/{}".format(program, snapshot))
+    if config.db["programs"][program]["post_upgrade_script"] is not None:
+        config.copy_tree(program_dir, snapshot_dir)
+    else:
+        config.link_tree(program_dir, snapshot_dir)
+    trim_snapshots(program)
+    return snapshot
+
+
+def remove_snapshot(program, snapshot):
+    """Remove a Snapshot.
+
+    Args:
+        program (str): Program the snapshot belongs to
+        snapshot (str): Name of snapshot to remove
+
+    """
+    trash(config.full("~/.tarstall/snapshots/{}/{}".format(program, snapshot)))
+
+
+def trash(path):
+    """Move to Trash.
+
+    Renames a file or directory into ~/.tarstall/trash, which takes the same time no matter how
+    large it is. empty_trash() deletes it for real.
+
+    Args:
+        path (str): Path to trash. Must be on the same filesystem as ~/.tarstall.
+
+    """
+    os.makedirs(config.full("~/.tarstall/trash"), exist_ok=True)
+    config.vprint("Moving {} to the trash".format(path))
+    os.rename(path, config.full("~/.tarstall/trash/{}-{}".format(version_name(), os.path.basename(path.rstrip("/")))))
+
+
+def empty_trash(background=True):
+    """Empty the Trash.
+
+    Deletes everything in ~/.tarstall/trash, along with any copies of tarstall left behind by erase().
+    Files in the trash still count as using the store, so prune_store() is worth running once it's empty.
+
+    Args:
+        background (bool): Whether to delete in a detached process at the lowest CPU and I/O priority
+        available instead of waiting for the deletion. Defaults to True.
+
+    """
+    paths = [config.full("~/" + d) for d in os.listdir(config.full("~")) if d.startswith(".tarstall-trash-")]
+    if config.exists("~/.tarstall/trash"):
+        paths += [config.full("~/.tarstall/trash/" + t) for t in os.listdir(config.full("~/.tarstall/trash"))]
+    if background:
+        if paths:
+            config.vprint("Emptying the trash in the background")
+            Popen(low_priority(["rm", "-rf", "--"] + paths), stdout=DEVNULL, stderr=DEVNULL, start_new_session=True)
+    else:
+        config.vprint("Emptying the trash")
+        for p in paths:
+            rmtree(p, ignore_errors=True)  # A background deletion may be removing it too
+        prune_store()
+
+
+def uses_versions(program):
+    """Check if a Program Updates Through Versions.
+
+    Programs that are, or have, git worktrees are updated in place instead, since git
+    stores the paths between a repository and its worktrees.
+
+    Args:
+        program (str): Program to check
+
+    Returns:
+        bool: Whether updates to the program are staged with stage_version()
+
+    """
+    return config.db["programs"][program]["worktree_of"] is None and not get_worktrees(program)
+
+
+def stage_version(program, copy=False):
+    """Stage a New Version of a Program.
+
+    Creates a new version of a program in ~/.tarstall/versions, starting as a config.link_tree() copy of
+    the active version so it takes next to no time or space. Updates are made to the new version,
+    which is then made live with activate_version(). A .git directory is always copied, since git
+    writes to some of its files in place.
+
+    Args:
+        program (str): Program to stage a new version of
+        copy (bool): Whether to copy every file with config.copy_tree(), for when an upgrade script
+        will run in the new version and may write to files in place. Defaults to False.
+
+    Returns:
+        str: Path to the new version
+
+    """
+    version_dir = config.full("~/.tarstall/versions/{}/{}".format(program, version_name()))
+    active_dir = os.path.realpath(config.full("~/.tarstall/bin/{}".format(program)))
+    config.vprint("Staging new version of {}".format(program))
+    if copy:
+        config.copy_tree(active_dir, version_dir)
+        return version_dir
+    config.link_tree(active_dir, version_dir, skip=[".git"])
+    git_dir = os.path.join(active_dir, ".git")
+    if os.path.isdir(git_dir) and not os.path.islink(git_dir):
+        config.copy_tree(git_dir, os.path.join(version_dir, ".git"))
+    elif os.path.lexists(git_dir):
+        config.copy_file(git_dir, os.path.join(version_dir, ".git"))
+    return version_dir
+
+
+def run_upgrade_script(program, program_dir=None):
+    """Run a Program's Upgrade Script.
+
+    Args:
+        program (str): Program with a post_upgrade_script to run
+        program_dir (str): Directory to run the script in. Defaults to None, running it in ~/.tarstall/bin/<program>.
+
+    Returns:
+        str: "Script error" if the script fails, "OSError" if it can't be run, or "Success"
+
+    """
+    if program_dir is None:
+        program_dir = config.full("~/.tarstall/bin/{}".format(program))
+    try:
+        err = call(config.db["programs"][program]["post_upgrade_script"], cwd=program_dir, stdout=c_out)
+    except OSError:
+        return "OSError"
+    if err != 0:
+        return "Script error"
+    return "Success"
+
+
+def finish_version(program, version_dir, script=False):
+    """Finish a Staged Version.
+
+    Runs the program's upgrade script in the staged version, if asked to, then activates it. If the script
+    fails, the staged version is thrown away and the active version is left as it was.
+
+    Args:
+        program (str): Program the version is of
+        version_dir (str): Path to the staged version
+        script (bool): Whether to run the program's upgrade script first. Defaults to False.
+
+    Returns:
+        str: "Success", or a failure from run_upgrade_script()
+
+    """
+    if script:
+        config.vprint("Running upgrade script for {}".format(program))
+        status = run_upgrade_script(program, version_dir)
+        if status != "Success":
+            trash(version_dir)
+            empty_trash()
+            return status
+    activate_version(program, version_dir)
+    return "Success"
+
+
+def swap_version(program, version_dir):
+    """Swap a Program's Active Version.
+
+    ~/.tarstall/bin/<program> is a symlink to the active version, so a version is made live by renaming a
+    new symlink over it. Anything launching the program sees either the old version or the new one,
+    never a mix of the two. Programs installed before versions have a directory there instead, which is
+    exchanged with the new symlink and then moved into ~/.tarstall/versions, so the program is never missing.
+
+    Args:
+        program (str): Program to swap the version of
+        version_dir (str): Path to the version to make live
+
+    Returns:
+        str: Path to the previously active version
+
+    """
+    program_dir = config.full("~/.tarstall/bin/{}".format(program))
+    temp = config.temp_name(program_dir)
+    try:
+        os.remove(temp)
+    except FileNotFoundError:
+        pass
+    os.symlink(version_dir, temp)
+    if os.path.islink(program_dir):
+        old_dir = os.path.realpath(program_dir)
+        os.replace(temp, program_dir)
+    else:
+        config.vprint("Moving {} into its versions directory".format(program))
+        old_dir = config.full("~/.tarstall/versions/{}/{}".format(program, version_name()))
+        os.makedirs(os.path.dirname(old_dir), exist_ok=True)
+        if config.exchange(temp, program_dir):
+            os.rename(temp, old_dir)  # temp is now the old directory
+        else:
+            os.rename(program_dir, old_dir)
+            os.replace(temp, program_dir)  # Right away, so the program is only missing for a moment
+    config.db["programs"][program]["activated"] = int(time.time())
+    index_program(program)  # The new version may have different executables on PATH
+    return old_dir
+
+
+def activate_version(program, version_dir):
+    """Activate a Staged Version.
+
+    Makes a version from stage_version() live, keeping the previous version as a
+    snapshot for rollback(), or deleting it if snapshots are disabled.
+
+    Args:
+        program (str): Program to activate the version of
+        version_dir (str): Path to the version to activate
+
+    """
+    old_dir = swap_version(program, version_dir)
+    config.vprint("Activated new version of {}".format(program))
+    if config.read_config("SnapshotCount") <= 0:
+        trash(old_dir)
+        empty_trash()
+        return
+    os.makedirs(config.full("~/.tarstall/snapshots/{}".format(program)), exist_ok=True)
+    os.rename(old_dir, config.full("~/.tarstall/snapshots/{}/{}".format(program, version_name())))
+    trim_snapshots(program)
+
+
+def rollback(program):
+    """Roll Back a Program.
+
+    Restores a program to its newest snapshot by making the snapshot the program's active version.
+
+    Args:
+        program (str): Program to roll back
+
+    Returns:
+        str: "Not installed", "No snapshots", or "Success"
+
+    """
+    if program not in config.db["programs"]:
+        return "Not installed"
+    snapshots = list_snapshots(program)
+    if not snapshots:
+        return "No snapshots"
+    config.vprint("Rolling {} back to {}".format(program, snapshots[-1]))
+    version_dir = config.full("~/.tarstall/versions/{}/{}".format(program, snapshots[-1]))
+    os.makedirs(os.path.dirname(version_dir), exist_ok=True)
+    os.rename(config.full("~/.tarstall/snapshots/{}/{}".format(program, snapshots[-1])), version_dir)
+    old_dir = swap_version(program, version_dir)
+    generic.progress(50)
+    config.vprint("Removing replaced version of {}".format(program))
+    trash(old_dir)
+    empty_trash()
+    config.db["programs"][program]["archive"] = None  # No longer installed from the last archive
+    record_program(program)
+    generic.progress(100)
+    return "Success"
+
+
+STUB = """#!/bin/sh
+# Stub left by tarstall while {program} is in cold storage
+{python} -c {thaw} {program} > /dev/null || exit 1
+if [ "$PWD" = {program_dir} ]; then cd {program_dir}; fi
+exec {target} "$@"
+"""
+
+
+def cold_archive(program):
+    """Get a Program's Cold Storage Archive.
+
+    Args:
+        program (str): Program to get the archive of
+
+    Returns:
+        str/None: Path to the archive the program is frozen into, or None if it isn't frozen
+
+    """
+    if config.db["programs"][program]["frozen"] is None:
+        return None
+    return config.full("~/.tarstall/cold/{}".format(config.db["programs"][program]["frozen"]["archive"]))
+
+
+def write_stubs(program, src, dest):
+    """Write Program Stubs.
+
+    Creates a stub script in dest for every executable file in src. Each stub thaws the program with stub_thaw(),
+    then runs the real file in its place, so binlinks, PATH entries, and .desktop files keep working.
+
+    Args:
+        program (str): Program the stubs are for
+        src (str): Program directory to make stubs of
+        dest (str): Directory to create the stubs in
+
+    Returns:
+        int: Number of stubs written
+
+    """
+    program_dir = config.full("~/.tarstall/bin/{}".format(program))
+    thaw_code = "import sys; sys.path.insert(0, {!r}); import prog_manage; sys.exit(prog_manage.stub_thaw(sys.argv[1]))".format(
+    os.path.dirname(os.path.abspath(__file__)))
+    written = 0
+    os.makedirs(dest, exist_ok=True)
+    for root, dirs, files in os.walk(src):
+        dirs[:] = [d for d in dirs if not (root == src and d == ".git")]
+        for f in files:
+            path = os.path.join(root, f)
+            try:
+                info = os.stat(path)  # Symlinks to executables get stubs too
+            except FileNotFoundError:
+                continue
+            if not stat.S_ISREG(info.st_mode) or not info.st_mode & 0o111:
+                continue
+            rel = os.path.relpath(path, src)
+            stub = os.path.join(dest, rel)
+            os.makedirs(os.path.dirname(stub), exist_ok=True)
+            with open(stub, "w") as s:
+                s.write(STUB.format(program=shlex.quote(program), python=shlex.quote(sys.executable), thaw=shlex.quote(thaw_code),
+                program_dir=shlex.quote(program_dir), target=shlex.quote(os.path.join(program_dir, rel))))
+            os.chmod(stub, 0o755)
+            written += 1
+    return written
+
+
+def pack_program(program):
+    """Pack a Program for Cold Storage.
+
+    Packs the active version of a program into a .tar.zst (or .tar.xz if zstd isn't installed) for freeze().
+    Neither the program nor the database are changed, so this can run without tarstall locked.
+
+    Args:
+        program (str): Program to pack
+
+    Returns:
+        tuple/None: The version directory that was packed, the name the archive should have in ~/.tarstall/cold,
+        and the temporary path it was packed to, or None if packing failed
+
+    """
+    src = os.path.realpath(config.full("~/.tarstall/bin/{}".format(program)))
+    os.makedirs(config.full("~/.tarstall/cold"), exist_ok=True)
+    name = program + (".tar.zst" if config.check_bin("zstd") else ".tar.xz")
+    temp = config.temp_name(config.full("~/.tarstall/cold/{}".format(name)))
+    config.vprint("Packing {} into {}".format(program, temp))
+    try:
+        if name.endswith(".tar.zst"):
+            if call(low_priority(["tar", "--zstd", "-cf", temp, "-C", src, "."]), stdout=c_out, stderr=c_out) != 0:
+                raise OSError("tar failed")
+        else:
+            with tarfile.open(temp, "w:xz") as tar:
+                tar.add(src, ".")
+    except (OSError, tarfile.TarError):
+        config.vprint("Failed to pack {}!".format(program))
+        try:
+            os.remove(temp)
+        except FileNotFoundError:
+            pass
+        return None
+    return src, name, temp
+
+
+def freeze(program, packed=None):
+    """Move a Program to Cold Storage.
+
+    Packs a program into ~/.tarstall/cold with pack_program(), and replaces it with stubs made by write_stubs(),
+    so its files only take up space again once it's next launched. The program's snapshots are deleted, since
+    they'd keep most of its files on disk.
+
+    Args:
+        program (str): Program to freeze
+        packed (tuple): What pack_program() returned, if the program was already packed. Defaults to None.
+
+    Returns:
+        str: "Not installed", "Already frozen", "Can't freeze" for programs that are or have git worktrees,
+        "Error" if packing the program fails, "Changed" if the program's version changed since it was packed,
+        or "Success"
+
+    """
+    if program not in config.db["programs"]:
+        return "Not installed"
+    if config.db["programs"][program]["frozen"] is not None:
+        return "Already frozen"
+    if not uses_versions(program):
+        return "Can't freeze"
+    src = os.path.realpath(config.full("~/.tarstall/bin/{}".format(program)))
+    generic.progress(10)
+    if packed is None:
+        packed = pack_program(program)
+        if packed is None:
+            return "Error"
+    elif packed[0] != src:
+        config.vprint("{} changed since it was packed, not freezing it".format(program))
+        return "Changed"
+    src, name, temp = packed
+    archive = config.full("~/.tarstall/cold/{}".format(name))
+    os.replace(temp, archive)
+    generic.progress(70)
+    config.vprint("Replacing {} with stubs".format(program))
+    stub_dir = config.full("~/.tarstall/versions/{}/{}".format(program, version_name()))
+    write_stubs(program, src, stub_dir)
+    trash(swap_version(program, stub_dir))
+    if config.exists("~/.tarstall/snapshots/" + program):
+        trash(config.full("~/.tarstall/snapshots/" + program))
+    empty_trash()
+    config.db["programs"][program]["frozen"] = {"archive": name, "time": int(time.time())}
+    refresh_usage(program)
+    config.write_db()
+    generic.progress(100)
+    return "Success"
+
+
+def stub_thaw(program, timeout=600):
+    """Thaw a Program for its Stub.
+
+    What stubs from write_stubs() run when they're launched. Unlike tarstall --thaw, none of tarstall_startup()'s
+    checks and scheduled jobs run, and a locked tarstall is waited on instead of failing, since whatever
+    holds the lock will usually be done soon. The database is loaded again once tarstall is locked, in case
+    the program was thawed in the meantime. Errors are printed to stderr.
+
+    Args:
+        program (str): Program to thaw
+        timeout (int): Most seconds to wait for tarstall to be unlocked. Defaults to 600.
+
+    Returns:
+        int: Exit code for the stub, 0 if the program is thawed
 
-    WARNING: THIS SHOULD NOT BE USED UNLESS THE DATABASE CANNOT BE RECOVERED OTHERWISE
-    BECAUSE OF LIMITED KNOWLEDGE OF THE CODE ITSELF, THINGS SUCH AS PROGRAM TYPE HAVE TO BE ASSUMED
-    THIS ONLY EXISTS AS A LAST RESORT OPTION!!!!!!!
     """
-    config.vprint("Attempting repair of database, things are going to get crazy!")
+    config.mode = "cli"  # Stubs can be launched from anywhere, so never try to use the GUI
+    if not config.wait_for_unlock(timeout):
+        print("tarstall is locked, so {} couldn't be brought back from cold storage!".format(program), file=sys.stderr)
+        return 1
+    config.lock()
+    try:
+        config.db = config.get_db()
+        status = thaw(program)
+    finally:
+        config.unlock()
+    if status in ["Success", "Not frozen"]:
+        return 0
+    messages = {"Not installed": "{} isn't installed anymore!", "No zstd": "zstd must be installed to bring {} back from cold storage!",
+    "Error": "An error occured while bringing {} back from cold storage!"}
+    print(messages[status].format(program), file=sys.stderr)
+    return 1
 
-    config.vprint("Getting stock database to build off of")
-    new_db = get_default_db()
-    generic.progress(5)
 
-    config.vprint("Re-discovering programs:")
-    for pf in os.listdir(config.full("~/.tarstall/bin/")):
-        config.vprint("Re-discovering " + pf, end="\r")
-        prog_info = {pf: {"install_type": "default", "desktops": [], 
-        "post_upgrade_script": None, "update_url": None, "has_path": False, "binlinks": []}}
-        if ".git" in os.listdir(config.full("~/.tarstall/bin/{}".format(pf))):
-            prog_info[pf]["install_type"] = "git"
-        elif len(os.listdir(config.full("~/.tarstall/bin/{}".format(pf)))) == 1:
-            prog_info[pf]["install_type"] = "single"
-        new_db["programs"].update(prog_info)
-    
-    generic.progress(20)
-    
-    config.vprint("Reading tarstall's bashrc file for further operations...")
-    with open(config.full("~/.tarstall/.bashrc")) as f:
-        bashrc_lines = f.readlines()
-    
-    generic.progress(25)
+def thaw(program):
+    """Bring a Program Back from Cold Storage.
 
-    config.vprint("Re-registering PATHs")
-    for l in bashrc_lines:
-        if l.startswith("export PATH=$PATH") and '#' in l:
-            program = l[l.find("#")+2:].rstrip()
-            config.vprint("Re-registering PATH for " + program, end="\r")
-            new_db["programs"][program]["has_path"] = True
-    
-    generic.progress(45)
-    
-    config.vprint("Re-registering binlinks")
-    for l in bashrc_lines:
-        if l.startswith("alias ") and '#' in l:
-            program = l[l.find("#")+2:].rstrip()
-            config.vprint("Re-registering a binlink or binlinks for " + program, end="\r")
-            binlinked_file = l[6:l.find("=")]
-            new_db["programs"][program]["binlinks"].append(binlinked_file)
-    
-    generic.progress(70)
-    
-    config.vprint("Backing up old database...")
-    date_str = datetime.datetime.today().strftime("%d-%m-%Y-%H-%M-%S")
-    move(config.full("~/.tarstall/database"), config.full("~/.tarstall/database-backup-{}.bak".format(date_str)))
+    Unpacks a program frozen by freeze() into a new version, and makes it live in place of its stubs.
 
-    generic.progress(95)
+    Args:
+        program (str): Program to thaw
 
-    config.vprint("Writing new database...")
-    config.db = new_db
-    config.write_db()
+    Returns:
+        str: "Not installed", "Not frozen", "No zstd" if the program was packed with zstd and it's no longer
+        installed, "Error" if unpacking the program fails, or "Success"
 
-    config.vprint("Database write complete!")
+    """
+    if program not in config.db["programs"]:
+        return "Not installed"
+    archive = cold_archive(program)
+    if archive is None:
+        return "Not frozen"
+    if archive.endswith(".tar.zst") and not config.check_bin("zstd"):
+        return "No zstd"
+    version_dir = config.full("~/.tarstall/versions/{}/{}".format(program, version_name()))
+    os.makedirs(version_dir)
+    config.vprint("Unpacking {} from {}".format(program, archive))
+    generic.progress(10)
+    try:
+        if archive.endswith(".tar.zst"):
+            if call(["tar", "--zstd", "-xf", archive, "-C", version_dir], stdout=c_out, stderr=c_out) != 0:
+                raise OSError("tar failed")
+        else:
+            config.extract_archive(archive, version_dir)
+    except (OSError, tarfile.TarError):
+        config.vprint("Failed to unpack {}!".format(program))
+        rmtree(version_dir, ignore_errors=True)
+        return "Error"
+    generic.progress(80)
+    trash(swap_version(program, version_dir))
+    empty_trash()
+    os.remove(archive)
+    config.db["programs"][program]["frozen"] = None
+    refresh_usage(program)
+    config.write_db()
     generic.progress(100)
-    return
-
+    return "Success"
 
 
-def add_upgrade_url(program, url):
-    """Adds an Upgrade URL to a Program.
+def last_used(program):
+    """Get When a Program was Last Used.
 
     Args:
-        program (str): The program that will be upgraded
-        url (str): The URL containing the archive to upgrade from. THIS MUST BE A VALID URL!!!!!
+        program (str): Program to check
+
+    Returns:
+        float: Newest access time of any of the program's regular files, or when the program was installed or its
+        current version was activated if that's newer, so programs installed from archives with old access times
+        don't look unused. Directories are skipped, since tarstall's own walks refresh their access times.
 
     """
-    config.db["programs"][program]["update_url"] = url
-    config.write_db()
+    newest = config.db["programs"][program]["activated"]
+    for root, dirs, files in os.walk(os.path.realpath(config.full("~/.tarstall/bin/{}".format(program)))):
+        for f in files:
+            info = os.lstat(os.path.join(root, f))
+            if stat.S_ISREG(info.st_mode):
+                newest = max(newest, info.st_atime)
+    return newest
 
 
-def remove_update_url(program):
-    """Removes Upgrade URL for Program.
+def unused_programs(days):
+    """Get Unused Programs.
 
     Args:
-        program (str): Program to remove URL of.
+        days (int): Days a program must have gone unused for
+
+    Returns:
+        str[]: Programs that can be frozen and haven't been used in the given number of days
 
     """
-    config.db["programs"][program]["update_url"] = None
-    config.write_db()
+    cutoff = time.time() - days * 86400
+    return [p for p in config.db["programs"] if config.db["programs"][p]["frozen"] is None and uses_versions(p)
+    and last_used(p) < cutoff]
 
 
-def wget_program(program, show_progress=False, progress_modifier=1):
-    """Wget an Archive and Overwrite Program.
+def freeze_unused(days, show_progress=False):
+    """Freeze Unused Programs.
+
+    Moves every program that hasn't been used in the given number of days to cold storage with freeze().
 
     Args:
-        program (str): Program that has an update_url to update
+        days (int): Days a program must have gone unused for to be frozen
         show_progress (bool): Whether to display a progress bar. Defaults to False.
-        progress_modifier (int): The number to divide the total progress by. Defaults to 1.
 
     Returns:
-        str: "No wget", "Wget error", "Install error" if install() fails, "Success" on success.
+        dict: Names of the programs that were frozen, and results from freeze()
 
     """
-    if not config.check_bin("wget"):
-        return "No wget"
-    else:
-        config.vprint("Creating second temp folder for archive.")
+    candidates = unused_programs(days)
+    statuses = {}
+    for i, p in enumerate(candidates):
+        config.vprint("{} hasn't been used in {} days, freezing it".format(p, days))
+        statuses[p] = freeze(p)
+        generic.progress(100 * (i + 1) / len(candidates), show_progress)
+    config.change_config("LastFrozen", "change", int(time.time()))
+    return statuses
+
+
+def background_freeze(timeout=3600):
+    """Run the Scheduled Freeze of Unused Programs.
+
+    Only one of these runs at a time. Each program is packed with tarstall unlocked, then tarstall is locked
+    just to swap it for its stubs, so other tarstall commands and stubs aren't held up by packing.
+    LastFrozen is recorded once every program is done. The database is loaded again each time tarstall
+    is locked, so changes made by tarstall in the meantime aren't lost.
+
+    Args:
+        timeout (int): Most seconds to wait for tarstall to be unlocked each time it needs locking. Defaults to 3600.
+
+    Returns:
+        str/dict: "Running" if a freeze is already running, "Locked" if tarstall stayed locked, or the same as
+        freeze_unused()
+
+    """
+    with open(config.full("~/.tarstall/freeze-lock"), "w") as f:
         try:
-            rmtree(config.full("/tmp/tarstall-temp2"))
-        except FileNotFoundError:
-            pass
-        os.mkdir("/tmp/tarstall-temp2")
-        os.chdir("/tmp/tarstall-temp2")
-        generic.progress(10 / progress_modifier, show_progress)
-        config.vprint("Downloading archive...")
-        url = config.db["programs"][program]["update_url"]
-        err = wget_with_progress(url, 10 / progress_modifier, 65 / progress_modifier, show_progress=show_progress)
-        if err != 0:
-            return "Wget error"
-        generic.progress(65 / progress_modifier, show_progress)
-        files = os.listdir()
-        config.vprint("Renaming archive")
-        os.rename("/tmp/tarstall-temp2/{}".format(files[0]), "/tmp/tarstall-temp2/{}".format(program + ".tar.gz"))
-        os.chdir("/tmp/")
-        generic.progress(70 / progress_modifier, show_progress)
-        config.vprint("Using install to install the program.")
-        inst_status = pre_install("/tmp/tarstall-temp2/{}".format(program + ".tar.gz"), True, show_progress=False)
-        generic.progress(95 / progress_modifier, show_progress)
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return "Running"
+        statuses = {}
+        for p in unused_programs(config.read_config("FreezeAfterDays")):
+            packed = pack_program(p)
+            if packed is None:
+                statuses[p] = "Error"
+                continue
+            try:
+                if not config.wait_for_unlock(timeout):
+                    return "Locked"
+                config.lock()
+                try:
+                    config.db = config.get_db()
+                    statuses[p] = freeze(p, packed)
+                finally:
+                    config.unlock()
+            finally:
+                if os.path.exists(packed[2]):  # Not used, since the program changed while it was packed
+                    os.remove(packed[2])
+        if not config.wait_for_unlock(timeout):
+            return "Locked"
+        config.lock()
         try:
-            rmtree(config.full("/tmp/tarstall-temp2"))
-        except FileNotFoundError:
-            pass
-        generic.progress(100 / progress_modifier, show_progress)
-        if inst_status != "Installed":
-            return "Install error"
-        else:
-            return "Success"
+            config.db = config.get_db()
+            config.change_config("LastFrozen", "change", int(time.time()))
+        finally:
+            config.unlock()
+        return statuses
 
 
-def update_program(program, show_progress=False):
+def update_program(program, show_progress=False, force=False):
     """Update Program.
 
+    The blocking version of engine.update_program(). Frozen programs are thawed first.
+
     Args:
         program (str): Name of program to update
+        show_progress (bool): Whether to display a progress bar. Defaults to False.
+        force (bool): Whether to reinstall a program from its update URL even if the archive hasn't changed. Defaults to False.
 
     Returns:
-        str: "No script" if script doesn't exist, "Script error" if script
-        failed to execute, or "Success" on a success. Can also be something
-        from update_git_program if the program supplied is a
-        git installed program. Can also return "OSError" if the supplied
-        script doesn't specify the shell to be used. Can also return
-        something from wget_program().
+        str: The same as engine.update_program()
 
     """
-    progs = 0
-    if config.db["programs"][program]["install_type"] == "git" or config.db["programs"][program]["update_url"] is not None:
-        progs += 1
-    if config.db["programs"][program]["post_upgrade_script"] is not None:
-        if not config.exists(config.db["programs"][program]["post_upgrade_script"]):
-            config.db["programs"][program]["post_upgrade_script"] = None
-            config.write_db()
-            return "No script"
-        else:
-            progs += 1
-    if config.db["programs"][program]["install_type"] == "git":
-        status = update_git_program(program, show_progress, progs)
-        if status != "Success" and status != "No update":
-            return status
-        elif config.db["programs"][program]["post_upgrade_script"] is None:
-            return status
-        elif status == "No update":
-            generic.progress(100)
-            return status
-    elif config.db["programs"][program]["update_url"] is not None:
-        status = wget_program(program, show_progress, progs)
-        if status != "Success":
-            return status
-        elif config.db["programs"][program]["post_upgrade_script"] is None:
-            return status
-    if config.db["programs"][program]["post_upgrade_script"] is not None:
-        try:
-            generic.progress(50 * (progs - 1), show_progress)
-            err = call(config.db["programs"][program]["post_upgrade_script"], 
-            cwd=config.full("~/.tarstall/bin/{}".format(program)), stdout=c_out)
-            generic.progress(100, show_progress)
-            if err != 0:
-                return "Script error"
-            else:
-                return "Success"
-        except OSError:
-            return "OSError"
-    return "Does not update"
+    import engine  # engine imports prog_manage
+    return asyncio.run(engine.update_program(program, force, show_progress=show_progress))
 
 
 def update_script(program, script_path):
@@ -379,72 +1421,240 @@ def update_script(program, script_path):
     return "Success"
 
 
-def update_git_program(program, show_progress=False, progress_modifier=1):
+def update_git_program(program, show_progress=False, progress_modifier=1, script=False):
     """Update Git Program.
 
+    The blocking version of engine.update_git_program().
+
     Args:
         program (str): Name of program to update
         show_progress (bool): Whether to display a progress bar. Defaults to False.
         progress_modifier (int): The number to divide the total progress by. Defaults to 1.
+        script (bool): Whether to run the program's upgrade script in its staged version before it's activated.
+        Defaults to False.
 
     Returns:
-        str: "No git" if git isn't found, "Error updating" on a generic failure, "Success" on a successful update, and
-        "No update" if the program is already up-to-date.
+        str: The same as engine.update_git_program()
 
     """
-    if not config.check_bin("git"):
-        config.vprint("git isn't installed!")
-        return "No git"
-    generic.progress(5 / progress_modifier, show_progress)
-    outp = run(["git", "pull"], cwd=config.full("~/.tarstall/bin/{}".format(program)), stdout=PIPE, stderr=PIPE)
-    generic.progress(95 / progress_modifier, show_progress)
-    err = outp.returncode
-    output = str(outp.stdout) + "\n\n\n" + str(outp.stderr)
+    import engine  # engine imports prog_manage
+    return asyncio.run(engine.update_git_program(program, script, show_progress=show_progress, progress_modifier=progress_modifier))
+
+
+def start_git_update(program, script=False):
+    """Start Updating a Git Program.
+
+    Stages a new version of the program to pull into, or snapshots it if it's updated in place.
+
+    Args:
+        program (str): Name of program to update
+        script (bool): Whether the program's upgrade script will run in the staged version. Defaults to False.
+
+    Returns:
+        tuple: The directory to run git pull in, whether it's a staged version, and the snapshot taken (if any),
+        to pass to finish_git_update()
+
+    """
+    staged = uses_versions(program)
+    snapshot = None
+    if staged:
+        program_dir = stage_version(program, script)
+    else:
+        snapshot = snapshot_program(program)
+        program_dir = config.full("~/.tarstall/bin/{}".format(program))
+    return (program_dir, staged, snapshot)
+
+
+def finish_git_update(program, update, err, output):
+    """Finish Updating a Git Program.
+
+    Args:
+        program (str): Name of program being updated
+        update (tuple): What start_git_update() returned
+        err (int): Exit code of git pull
+        output (str): Output of git pull. The program's upgrade script should already have run in a staged
+        version if it has one.
+
+    Returns:
+        str: The same as engine.update_git_program()
+
+    """
+    program_dir, staged, snapshot = update
     if err != 0:
         config.vprint("Failed updating: {}".format(program))
-        generic.progress(100 / progress_modifier, show_progress)
+        if staged:
+            trash(program_dir)
+            empty_trash()
         return "Error updating"
     else:
         if "Already up to date." in output:
             config.vprint("{} is already up to date!".format(program))
-            generic.progress(100 / progress_modifier, show_progress)
+            if staged:
+                trash(program_dir)
+            elif snapshot is not None:
+                remove_snapshot(program, snapshot)
+            empty_trash()
             return "No update"
         else:
             config.vprint("Successfully updated: {}".format(program))
-            generic.progress(100 / progress_modifier, show_progress)
+            if staged:
+                activate_version(program, program_dir)
+            record_program(program)
             return "Success"
 
 
-def update_programs():
+def update_programs(force=False):
     """Update Programs Installed through Git or Ones with Upgrade Scripts.
 
+    Args:
+        force (bool): Passed to update_program(). Defaults to False.
+
+    Programs are updated concurrently with engine.update_programs(), so their downloads, git pulls,
+    and upgrade scripts overlap.
+
     Returns:
         str/dict: "No git" if git isn't installed, or a dict containing program names and results from update_git_program()
         It can also return "No programs" if no programs are installed.
 
     """
-    if len(config.db["programs"].keys()) == 0:
-        return "No programs"
+    import engine  # engine imports prog_manage
+    done = []
+
+    def on_update(program, status):
+        done.append(program)
+        generic.progress(100 * len(done) / len(config.db["programs"]))
+
+    generic.progress(0)
+    statuses = asyncio.run(engine.update_programs(force, on_update=on_update))
+    if isinstance(statuses, dict):
+        generic.progress(100)
+    return statuses
+
+
+def low_priority(command):
+    """Run a Command at Low Priority.
+
+    Args:
+        command (str[]): Command to run
+
+    Returns:
+        str[]: The command, run at the lowest CPU and I/O priority available
+
+    """
+    if config.check_bin("nice"):
+        command = ["nice", "-n", "19"] + command
+    if config.check_bin("ionice"):
+        command = ["ionice", "-c", "3"] + command
+    return command
+
+
+def maintain_git_program(program, auto=False):
+    """Run Git Maintenance on a Program.
+
+    Runs git gc on a git installed program at the lowest CPU and I/O priority available.
+
+    Args:
+        program (str): Git program to perform maintenance on
+        auto (bool): Whether to only perform maintenance if git thinks it's needed (git gc --auto). Defaults to False.
+
+    Returns:
+        int/str: Number of bytes reclaimed, or "Error" if git gc failed.
+
+    """
+    git_dir = config.full("~/.tarstall/bin/{}/.git".format(program))
+    command = ["git", "gc", "--quiet"]
+    if auto:
+        command.append("--auto")
+    command = low_priority(command)
+    size_before = config.dir_size(git_dir)
+    err = call(command, cwd=config.full("~/.tarstall/bin/{}".format(program)), stdout=c_out, stderr=c_out)
+    if err != 0:
+        config.vprint("git gc failed for {}".format(program))
+        return "Error"
+    return size_before - config.dir_size(git_dir)
+
+
+def maintain_git_programs(auto=False, show_progress=True, record=True):
+    """Run Git Maintenance on all Git Programs.
+
+    Maintenance is run on multiple programs at once. Programs installed as worktrees
+    are skipped, since they share the repository of the program they were installed from.
+
+    Args:
+        auto (bool): Whether to only perform maintenance where git thinks it's needed. Defaults to False.
+        show_progress (bool): Whether to display a progress bar. Defaults to True.
+        record (bool): Whether to record the time maintenance was run as LastMaintained. Defaults to True.
+
+    Returns:
+        str/dict: "No git" if git isn't installed, "No programs" if there are no git programs, or a dict
+        containing program names and results from maintain_git_program().
+
+    """
     if not config.check_bin("git"):
         return "No git"
-    increment = int(100 / len(config.db["programs"].keys()))
-    progress = 0
+    programs = [p for p in config.db["programs"] if config.db["programs"][p]["install_type"] == "git" and
+    config.db["programs"][p]["worktree_of"] is None]
+    if not programs:
+        return "No programs"
     statuses = {}
-    generic.progress(progress)
-    for p in config.db["programs"].keys():
-        if not config.db["programs"][p]["update_url"] and (config.db["programs"][p]["install_type"] == "git" or config.db["programs"][p]["post_upgrade_script"]):
-            statuses[p] = update_program(p)
-        elif (config.db["programs"][p]["update_url"] and config.read_config("UpdateURLPrograms")):
-            statuses[p] = update_program(p)
-        else:
-            statuses[p] = "Does not update"
-        progress += increment
-        generic.progress(progress)
-    if progress < 100:
-        generic.progress(100)
+    generic.progress(0, show_progress)
+    with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as executor:
+        futures = {executor.submit(maintain_git_program, p, auto): p for p in programs}
+        for future in as_completed(futures):
+            statuses[futures[future]] = future.result()
+            generic.progress(100 * len(statuses) / len(programs), show_progress)
+    if record:
+        config.change_config("LastMaintained", "change", int(time.time()))
     return statuses
 
 
+def start_in_background(job):
+    """Start a Job in the Background.
+
+    Runs a function from prog_manage in a detached process at the lowest CPU and I/O priority available,
+    so tarstall doesn't wait on it.
+
+    Args:
+        job (str): Name of the function to run, such as "background_maintenance"
+
+    """
+    code = "import sys; sys.path.insert(0, {!r}); import prog_manage; prog_manage.{}()".format(
+    os.path.dirname(os.path.abspath(__file__)), job)
+    Popen(low_priority([sys.executable, "-c", code]), stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL, start_new_session=True)
+
+
+def background_maintenance(timeout=3600):
+    """Run Scheduled Git Maintenance.
+
+    Only one of these runs at a time. Once maintenance is done, LastMaintained is recorded in a freshly loaded
+    database while tarstall is locked, so changes made by tarstall in the meantime aren't lost.
+
+    Args:
+        timeout (int): Most seconds to wait for tarstall to be unlocked before giving up on recording LastMaintained,
+        in which case maintenance runs again next time. Defaults to 3600.
+
+    Returns:
+        str/dict: "Running" if maintenance is already running, "Locked" if LastMaintained couldn't be recorded,
+        or the same as maintain_git_programs()
+
+    """
+    with open(config.full("~/.tarstall/maintain-lock"), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return "Running"
+        statuses = maintain_git_programs(True, False, False)
+        if not config.wait_for_unlock(timeout):
+            return "Locked"
+        config.lock()
+        try:
+            config.db = config.get_db()
+            config.change_config("LastMaintained", "change", int(time.time()))
+        finally:
+            config.unlock()
+        return statuses
+
+
 def change_git_branch(program, branch):
     """Change Git Program's Branch.
 
@@ -465,6 +1675,62 @@ def change_git_branch(program, branch):
         return "Success"
 
 
+def add_git_worktree(program, branch):
+    """Install Another Branch of a Git Program.
+
+    Installs a branch of an already installed git program as its own program. The new program
+    is a git worktree of the original program, so both share one copy of the repository's history.
+
+    Args:
+        program (str): Git program to install another branch of
+        branch (str): Branch to install
+
+    Returns:
+        str: "No git", "Not git", "Bad name", "Application exists", "Error", or the name of the new program on success.
+
+    """
+    if not config.check_bin("git"):
+        return "No git"
+    if config.db["programs"][program]["install_type"] != "git":
+        return "Not git"
+    if config.db["programs"][program]["worktree_of"] is not None:
+        program = config.db["programs"][program]["worktree_of"]
+    program_internal_name = program + "-" + branch.replace("/", "-")
+    if config.char_check(program_internal_name) or "\\" in program_internal_name:
+        return "Bad name"
+    if program_internal_name in config.db["programs"]:
+        return "Application exists"
+    generic.progress(10)
+    config.vprint("Fetching branches for {}".format(program))
+    program_dir = config.full("~/.tarstall/bin/{}".format(program))
+    if call(["git", "fetch"], cwd=program_dir, stdout=c_out, stderr=c_out) != 0:
+        config.vprint("Failed to fetch, using the branches that were already fetched")
+    generic.progress(40)
+    config.vprint("Creating worktree for branch {}".format(branch))
+    err = call(["git", "worktree", "add", config.full("~/.tarstall/bin/{}".format(program_internal_name)), branch],
+    cwd=program_dir, stdout=c_out, stderr=c_out)
+    if err != 0:
+        return "Error"
+    generic.progress(80)
+    finish_install(program_internal_name, "git")
+    config.db["programs"][program_internal_name]["worktree_of"] = program
+    config.write_db()
+    return program_internal_name
+
+
+def get_worktrees(program):
+    """Get Worktrees of a Git Program.
+
+    Args:
+        program (str): Program to get the worktrees of
+
+    Returns:
+        str[]: Names of programs installed as worktrees of program
+
+    """
+    return [p for p in config.db["programs"] if config.db["programs"][p]["worktree_of"] == program]
+
+
 def change_branch(branch, reset=False):
     """Change Branch.
 
@@ -629,6 +1895,54 @@ def tarstall_startup(start_fts=False, del_lock=False, old_upgrade=False, force_f
             config.vprint("Adding WarnMissingDeps key...")
             config.db["options"]["WarnMissingDeps"] = True
 
+        elif file_version == 17:
+            config.vprint("Adding 'worktree_of' to programs.")
+            for program in config.db["programs"]:
+                config.db["programs"][program]["worktree_of"] = None
+
+        elif file_version == 18:
+            config.vprint("Adding 'disk_usage' to programs.")
+            for program in config.db["programs"]:
+                config.db["programs"][program]["disk_usage"] = None
+
+        elif file_version == 19:
+            config.vprint("Adding 'update_checksum' to programs.")
+            for program in config.db["programs"]:
+                config.db["programs"][program]["update_checksum"] = None
+
+        elif file_version == 20:
+            config.vprint("Adding 'filters' to programs.")
+            for program in config.db["programs"]:
+                config.db["programs"][program]["filters"] = None
+
+        elif file_version == 21:
+            config.vprint("Adding 'archive' to programs.")
+            for program in config.db["programs"]:
+                config.db["programs"][program]["archive"] = None
+
+        elif file_version == 22:
+            config.vprint("Adding 'frozen' to programs.")
+            for program in config.db["programs"]:
+                config.db["programs"][program]["frozen"] = None
+
+        elif file_version == 23:
+            config.vprint("Indexing the commands and .desktop files programs provide.")
+            for program in config.db["programs"]:
+                config.db["programs"][program]["commands"] = []
+            rebuild_indexes()
+
+        elif file_version == 24:
+            config.vprint("Adding 'activated' to programs.")
+            for program in config.db["programs"]:
+                config.db["programs"][program]["activated"] = int(time.time())
+
+        elif file_version == 25:
+            config.vprint("Rewriting stubs of frozen programs to thaw without running all of tarstall.")
+            for program in config.db["programs"]:
+                if config.db["programs"][program]["frozen"] is not None:
+                    stub_dir = os.path.realpath(config.full("~/.tarstall/bin/{}".format(program)))
+                    write_stubs(program, stub_dir, stub_dir)
+
         config.db["version"]["file_version"] += 1
         file_version = get_file_version('file')
         config.write_db()
@@ -636,8 +1950,7 @@ def tarstall_startup(start_fts=False, del_lock=False, old_upgrade=False, force_f
     if get_file_version('prog') == 1:  # Online update broke between prog versions 1 and 2 of tarstall
         return "Old"
 
-    if config.read_config("AutoInstall"):  # Auto-update, if enabled
-        update(show_progress=False)
+    scheduled_jobs()
     
     username = getpass.getuser()  # Root check
     if username == 'root':
@@ -647,34 +1960,136 @@ def tarstall_startup(start_fts=False, del_lock=False, old_upgrade=False, force_f
     return final_status
 
 
-def pre_install(program, overwrite=None, show_progress=True):
+def scheduled_jobs():
+    """Run Scheduled Jobs.
+
+    Runs whatever is due of tarstall's automatic jobs. tarstall_startup() runs these on every run of tarstall,
+    and the daemon runs them regularly for as long as it's running. tarstall must be locked.
+
+    """
+    if config.read_config("AutoInstall"):  # Auto-update, if enabled
+        update(show_progress=False)
+
+    if config.read_config("AutoMaintain") and time.time() - config.read_config("LastMaintained") > 604800:  # Weekly git maintenance
+        config.vprint("Starting weekly git maintenance in the background")
+        start_in_background("background_maintenance")
+
+    if config.read_config("FreezeAfterDays") > 0 and time.time() - config.read_config("LastFrozen") > 86400:  # Daily cold storage
+        config.vprint("Freezing unused programs in the background")
+        start_in_background("background_freeze")
+
+    if config.exists("~/.tarstall/trash") and os.listdir(config.full("~/.tarstall/trash")):  # Finish deletions a previous run started
+        empty_trash()
+    elif config.exists("~/.tarstall/store"):
+        prune_store()
+
+
+def archive_stamp(path, program=None, sha256=None):
+    """Stamp Archive.
+
+    Identifies an archive by its SHA-256. If the program was last installed from an archive at the same path
+    with the same size and modification time, its recorded digest is reused instead of reading the archive again.
+
+    Args:
+        path (str): Path to archive
+        program (str): Program to reuse the recorded digest of. Defaults to None.
+        sha256 (str): SHA-256 of the archive, if it's already known, such as from download(). Defaults to None.
+
+    Returns:
+        dict: "path", "size", "mtime", and "sha256" of the archive
+
+    """
+    path = os.path.realpath(config.full(path))
+    info = os.stat(path)
+    stamp = {"path": path, "size": info.st_size, "mtime": info.st_mtime_ns, "sha256": sha256}
+    if sha256 is not None:
+        return stamp
+    if program is not None and program in config.db["programs"]:
+        recorded = config.db["programs"][program]["archive"]
+        if recorded is not None and [recorded["path"], recorded["size"], recorded["mtime"]] == [path, info.st_size, info.st_mtime_ns]:
+            stamp["sha256"] = recorded["sha256"]
+            return stamp
+    stamp["sha256"] = config.hash_file(path)
+    return stamp
+
+
+def is_installed_from(program, digest, filters=None):
+    """Check if Program is Installed from Archive.
+
+    Args:
+        program (str): Program to check
+        digest (str): SHA-256 of the archive
+        filters (dict): Filters the archive is about to be installed with, or None to keep the program's filters.
+        Defaults to None.
+
+    Returns:
+        bool: Whether the program was last installed from an archive with the same contents and filters,
+        and is still there
+
+    """
+    if program not in config.db["programs"] or config.db["programs"][program]["archive"] is None:
+        return False
+    if filters is not None and filters != config.db["programs"][program]["filters"]:
+        return False
+    return config.db["programs"][program]["archive"]["sha256"] == digest and \
+    os.path.isdir(config.full("~/.tarstall/bin/{}".format(program)))
+
+
+def pre_install(program, overwrite=None, show_progress=True, filters=None, force=False, script=False, sha256=None):
     """Pre-Archive Install.
 
-    Preparation before installing an archive.
+    Preparation before installing an archive. Installing an archive with the same contents as the one the program
+    was last installed from does nothing, unless force is set.
 
     Arguments:
         program (str): Path to archive to attempt installation.
         overwrite (bool/None): Whether or not to overwrite the program if it exists.
+        filters (dict): Include and exclude globs to install with. Defaults to None, keeping the program's
+        saved filters when it already exists.
+        force (bool): Whether to install even if the program is already installed from this archive. Defaults to False.
+        script (bool): Passed to sync_program() when overwriting. Defaults to False.
+        sha256 (str): Passed to archive_stamp(), so an archive that was hashed as it downloaded isn't read again.
+        Defaults to None.
 
     Returns:
-        str: Status of the installation. Possible returns are: "Bad file", and "Application exists".
+        str: Status of the installation. Possible returns are: "Bad file", "Application exists", "Unchanged" if
+        the program is already installed from this archive, and anything install() returns.
 
     """
     if not config.exists(program):
         return "Bad file"
     program_internal_name = config.name(program)  # Get the program name
+    stamp = archive_stamp(program, program_internal_name, sha256)
+    if not force and is_installed_from(program_internal_name, stamp["sha256"], filters):
+        config.vprint("{} is already installed from this archive".format(program_internal_name))
+        return "Unchanged"
     if program_internal_name in config.db["programs"]:  # Reinstall check
         if overwrite is None:
             return "Application exists"
         else:
+            try:
+                scan = config.scan_archive(program)
+            except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError):
+                return "Error"
+            if scan is not None and not config.has_space(scan["size"]):
+                return "No space"
+            if filters is None:
+                filters = config.db["programs"][program_internal_name]["filters"]
+            if overwrite and config.db["programs"][program_internal_name]["frozen"] is not None:
+                status = thaw(program_internal_name)
+                if status != "Success":
+                    return status
             if not overwrite:
                 uninstall(program_internal_name)
-                return install(program, False, True, show_progress)  # Reinstall
+                status = install(program, False, True, show_progress, scan, filters)  # Reinstall
             elif overwrite:
-                return install(program, True, True, show_progress)
+                status = install(program, True, True, show_progress, scan, filters, script)
     else:
-        return install(program, show_progress=show_progress)  # No reinstall needed to be asked, install program
-    config.write_db()
+        status = install(program, show_progress=show_progress, filters=filters)  # No reinstall needed to be asked, install program
+    if status == "Installed" and program_internal_name in config.db["programs"]:
+        config.db["programs"][program_internal_name]["archive"] = stamp
+        config.write_db()
+    return status
 
 
 def pre_singleinstall(program, reinstall=None):
@@ -702,12 +2117,15 @@ def pre_gitinstall(program, overwrite=None):
         str: Statuses. Includes: 
 
     """
+    git_url, sparse_path = config.split_git_url(program)
     if not config.check_bin("git"):
         return "No git"
-    elif re.match(r"https://\w.\w", program) is None or " " in program or "\\" in program or config.extension(program) != ".git":
+    elif re.match(r"https://\w.\w", git_url) is None or " " in program or "\\" in program or config.extension(git_url) != ".git":
+        return "Bad URL"
+    elif sparse_path is not None and (sparse_path == "" or ".." in sparse_path.split("/")):
         return "Bad URL"
     else:
-        program_internal_name = config.name(program)
+        program_internal_name = config.git_name(program)
         if program_internal_name in config.db["programs"]:
             if overwrite is None:
                 return "Application exists"
@@ -756,7 +2174,9 @@ def get_default_db():
             "branch": "master"
         },
         "programs": {
-        }
+        },
+        "command_index": {},
+        "desktop_index": {}
     }
     return db_template
 
@@ -784,6 +2204,8 @@ def remove_desktop(program, desktop):
     except FileNotFoundError:
         pass
     config.db["programs"][program]["desktops"].remove(desktop)
+    if config.db["desktop_index"].get(desktop) == program:
+        del config.db["desktop_index"][desktop]
     config.write_db()
 
 
@@ -803,6 +2225,7 @@ def remove_paths_and_binlinks(program):
     config.remove_line(program, "~/.tarstall/.fishrc", 'poundword')
     config.db["programs"][program]["has_path"] = False
     config.db["programs"][program]["binlinks"] = []
+    index_program(program)
     config.write_db()
     return "Complete"
 
@@ -832,6 +2255,7 @@ def rename(program, new_name):
             config.full("~/.local/share/applications/{p}-{p}.desktop".format(p=new_name)))
     generic.progress(25)
     config.vprint("Replacing PATHs")
+    unindex_program(program)
     config.db["programs"][new_name] = config.db["programs"].pop(program)
     config.replace_in_file("export PATH=$PATH:~/.tarstall/bin/" + program, 
     "export PATH=$PATH:~/.tarstall/bin/" + new_name, "~/.tarstall/.bashrc")
@@ -853,15 +2277,178 @@ def rename(program, new_name):
     config.replace_in_file("# " + program, "# " + new_name, "~/.tarstall/.bashrc")
     config.replace_in_file("# " + program, "# " + new_name, "~/.tarstall/.fishrc")
     move(config.full("~/.tarstall/bin/" + program), config.full("~/.tarstall/bin/" + new_name))
+    if config.exists("~/.tarstall/snapshots/" + program):
+        move(config.full("~/.tarstall/snapshots/" + program), config.full("~/.tarstall/snapshots/" + new_name))
+    if config.exists("~/.tarstall/versions/" + program):
+        move(config.full("~/.tarstall/versions/" + program), config.full("~/.tarstall/versions/" + new_name))
+    for record in ["usage", "manifests"]:
+        if config.exists("~/.tarstall/{}/{}.json".format(record, program)):
+            move(config.full("~/.tarstall/{}/{}.json".format(record, program)), config.full("~/.tarstall/{}/{}.json".format(record, new_name)))
+    if os.path.islink(config.full("~/.tarstall/bin/" + new_name)):
+        config.vprint("Pointing program at its moved versions")
+        version = os.path.basename(os.readlink(config.full("~/.tarstall/bin/" + new_name)))
+        swap_version(new_name, config.full("~/.tarstall/versions/{}/{}".format(new_name, version)))
+    if config.db["programs"][new_name]["install_type"] == "git" and config.check_bin("git"):
+        config.vprint("Repairing links between git worktrees")
+        call(["git", "worktree", "repair"], cwd=config.full("~/.tarstall/bin/" + new_name), stdout=c_out, stderr=c_out)
+        for p in get_worktrees(program):
+            config.db["programs"][p]["worktree_of"] = new_name
     config.write_db()
     generic.progress(90)
     if is_single:
         config.vprint("Renaming single-file")
         move(config.full("~/.tarstall/bin/{}/{}".format(new_name, program)), config.full("~/.tarstall/bin/{}/{}".format(new_name, new_name)))
+    index_program(new_name)
+    config.write_db()
     generic.progress(100)
     return new_name
 
 
+def sync_program(source, program_internal_name, script=False):
+    """Sync Files into a Program.
+
+    Used by overwrite installs to only copy files that changed from source into a program's directory.
+    Whether files are compared by checksum, and whether files missing from source are deleted,
+    is controlled by the OverwriteChecksums and OverwriteDeletes options. Files are synced into
+    a new version of the program that is activated once complete, if the program uses versions.
+
+    Args:
+        source (str): Directory containing the new copy of the program
+        program_internal_name (str): Program to sync the files into
+        script (bool): Whether to run the program's upgrade script in its new version before it's activated.
+        Only used if the program uses versions. Defaults to False.
+
+    Returns:
+        int/str: Number of bytes written, or a failure from run_upgrade_script()
+
+    """
+    global last_sync
+    total = config.dir_size(source)
+    staged = uses_versions(program_internal_name)
+    if staged:
+        program_dir = stage_version(program_internal_name, script)
+    else:
+        snapshot_program(program_internal_name)
+        program_dir = config.full("~/.tarstall/bin/{}".format(program_internal_name))
+    written = config.sync_tree(source, program_dir, config.read_config("OverwriteChecksums"), config.read_config("OverwriteDeletes"))
+    if staged:
+        status = finish_version(program_internal_name, program_dir, script)
+        if status != "Success":
+            return status
+    config.vprint("{} written to {}".format(generic.human_size(written), program_internal_name))
+    last_sync = [program_internal_name, written, max(0, total - written)]
+    if config.read_config("Dedupe"):
+        dedupe_program(program_internal_name)
+        prune_store()
+    record_program(program_internal_name)
+    return written
+
+
+def sync_report():
+    """Get the Report from the Last Sync.
+
+    Returns:
+        list/None: The program, bytes written, and bytes left alone because they were unchanged from the last
+        sync_program() since this was last called, or None if there hasn't been one
+
+    """
+    global last_sync
+    report = last_sync
+    last_sync = None
+    return report
+
+
+def dedupe_program(program):
+    """Deduplicate a Program's Files.
+
+    Hardlinks each of a program's files to one canonical copy in tarstall's store (~/.tarstall/store),
+    shared with every other program that has a file with the same contents and permissions.
+    A store file's link count is its reference count, so renaming a program needs no extra work,
+    and prune_store() removes anything no program uses anymore. Files of deduplicated programs
+    must not be modified in place, as that would change them for every program sharing them.
+
+    Args:
+        program (str): Program to deduplicate
+
+    Returns:
+        int: Number of bytes saved
+
+    """
+    files = []
+    for root, dirs, file_names in os.walk(config.full("~/.tarstall/bin/{}".format(program))):
+        for f in file_names:
+            path = os.path.join(root, f)
+            st = os.lstat(path)
+            if stat.S_ISREG(st.st_mode) and st.st_size >= 4096:  # Smaller files aren't worth an extra inode
+                files.append((path, st))
+    with ThreadPoolExecutor() as executor:
+        digests = list(executor.map(config.hash_file, [f[0] for f in files]))
+    saved = 0
+    for (path, st), digest in zip(files, digests):
+        store_path = config.full("~/.tarstall/store/{}/{}-{:o}".format(digest[:2], digest, stat.S_IMODE(st.st_mode)))
+        try:
+            if not os.path.exists(store_path):
+                os.makedirs(os.path.dirname(store_path), exist_ok=True)
+                os.link(path, store_path)
+            elif not os.path.samestat(st, os.stat(store_path)):
+                os.link(store_path, config.temp_name(path))
+                os.replace(config.temp_name(path), path)
+                if st.st_nlink == 1:
+                    saved += st.st_size
+        except OSError:
+            config.vprint("Couldn't deduplicate {}".format(path))
+    config.vprint("Saved {} by deduplicating {}".format(generic.human_size(saved), program))
+    return saved
+
+
+def prune_store():
+    """Remove Unused Files from the Store.
+
+    Returns:
+        int: Number of bytes freed
+
+    """
+    freed = 0
+    if not os.path.isdir(config.full("~/.tarstall/store")):
+        return freed
+    with os.scandir(config.full("~/.tarstall/store")) as store:
+        for folder in store:
+            with os.scandir(folder.path) as it:
+                for entry in it:
+                    st = entry.stat(follow_symlinks=False)
+                    if st.st_nlink == 1:  # Only the store has this file
+                        os.remove(entry.path)
+                        freed += st.st_size
+            try:
+                os.rmdir(folder.path)
+            except OSError:
+                pass  # Folder still has files in it
+    return freed
+
+
+def dedupe_programs(show_progress=True):
+    """Deduplicate all Programs.
+
+    Args:
+        show_progress (bool): Whether to display a progress bar. Defaults to True.
+
+    Returns:
+        str/dict: "No programs" if no programs are installed, or a dict containing program names
+        and results from dedupe_program().
+
+    """
+    if len(config.db["programs"].keys()) == 0:
+        return "No programs"
+    statuses = {}
+    generic.progress(0, show_progress)
+    for p in config.db["programs"].keys():
+        statuses[p] = dedupe_program(p)
+        generic.progress(95 * len(statuses) / len(config.db["programs"].keys()), show_progress)
+    prune_store()
+    generic.progress(100, show_progress)
+    return statuses
+
+
 def finish_install(program_internal_name, install_type="default"):
     """End of Install.
 
@@ -884,8 +2471,13 @@ def finish_install(program_internal_name, install_type="default"):
     config.vprint("Adding program to tarstall list of programs")
     generic.progress(95)
     config.db["programs"].update({program_internal_name: {"install_type": install_type, "desktops": [], 
-    "post_upgrade_script": None, "update_url": None, "has_path": False, "binlinks": []}})
-    config.write_db()
+    "post_upgrade_script": None, "update_url": None, "has_path": False, "binlinks": [], "worktree_of": None,
+    "disk_usage": None, "update_checksum": None, "filters": None, "archive": None, "frozen": None, "commands": [],
+    "activated": int(time.time())}})
+    if config.read_config("Dedupe"):
+        config.vprint("Deduplicating program files")
+        dedupe_program(program_internal_name)
+    record_program(program_internal_name)
     generic.progress(100)
     return "Installed"
 
@@ -953,6 +2545,7 @@ Categories={categories}
         f.write(to_write)
     if program_internal_name is not None:
         config.db["programs"][program_internal_name]["desktops"].append(desktop_name)
+        config.db["desktop_index"][desktop_name] = program_internal_name
         config.write_db()
     return "Created"
 
@@ -960,7 +2553,8 @@ Categories={categories}
 def gitinstall(git_url, program_internal_name, overwrite=False, reinstall=False):
     """Git Install.
 
-    Installs a program from a URL to a Git repository
+    Installs a program from a URL to a Git repository. If the URL ends in #path/to/subdir,
+    only that subdirectory of the repository is checked out.
 
     Args:
         git_url (str): URL to Git repository
@@ -968,11 +2562,9 @@ def gitinstall(git_url, program_internal_name, overwrite=False, reinstall=False)
         overwrite (bool): Whether or not to assume the program is already installed and to overwite it
 
     Returns:
-       str: A string from finish_install(), "No rsync", "Installed", or "Error"
+       str: A string from finish_install(), "Installed", or "Error"
 
     """
-    if not config.check_bin("rsync") and overwrite:
-        return "No rsync"
     config.vprint("Downloading git repository")
     if overwrite:
         try:
@@ -984,12 +2576,16 @@ def gitinstall(git_url, program_internal_name, overwrite=False, reinstall=False)
     else:
         os.chdir(config.full("~/.tarstall/bin"))
     generic.progress(5)
-    err = git_clone_with_progress(git_url, 5, 65)
+    git_url, sparse_path = config.split_git_url(git_url)
+    if sparse_path is not None:
+        err = git_clone_with_progress(git_url, 5, 65, sparse_path=sparse_path, dest=program_internal_name)
+    else:
+        err = git_clone_with_progress(git_url, 5, 65)
     if err != 0:
         return "Error"
     generic.progress(65)
     if overwrite:
-        call(["rsync", "-a", "/tmp/tarstall-temp/{}/".format(program_internal_name), config.full("~/.tarstall/bin/{}".format(program_internal_name))], stdout=c_out)
+        sync_program("/tmp/tarstall-temp/{}/".format(program_internal_name), program_internal_name)
     if not overwrite:
         return finish_install(program_internal_name, "git")
     else:
@@ -1014,13 +2610,12 @@ def add_binlink(file_chosen, program_internal_name):
         name = config.name(name)
     if name in config.db["programs"][program_internal_name]["binlinks"]:
         return "Already there"
-    line_to_add = '\nalias ' + name + "='cd " + config.full('~/.tarstall/bin/' + program_internal_name) + \
-    '/ && ./' + file_chosen + "' # " + program_internal_name
+    lines = shell_lines(program_internal_name, name, file_chosen)
     config.vprint("Adding alias to bashrc and fishrc")
-    config.add_line(line_to_add, "~/.tarstall/.bashrc")
-    line_to_add = "\nfunction " + name + ";cd " + config.full("~/.tarstall/bin/" + program_internal_name) + "/;./" + file_chosen + ";end # " + program_internal_name
-    config.add_line(line_to_add, "~/.tarstall/.fishrc")
+    config.add_line("\n" + lines[".bashrc"], "~/.tarstall/.bashrc")
+    config.add_line("\n" + lines[".fishrc"], "~/.tarstall/.fishrc")
     config.db["programs"][program_internal_name]["binlinks"].append(name)
+    index_program(program_internal_name)
     config.write_db()
     return "Added"
 
@@ -1040,15 +2635,130 @@ def pathify(program_internal_name):
     if config.db["programs"][program_internal_name]["has_path"]:
         return "Already there"
     config.vprint('Adding program to PATH')
-    line_to_write = "\nexport PATH=$PATH:~/.tarstall/bin/" + program_internal_name + ' # ' + program_internal_name
-    config.add_line(line_to_write, "~/.tarstall/.bashrc")
-    line_to_write = "\nset PATH $PATH ~/.tarstall/bin/" + program_internal_name + ' # ' + program_internal_name
-    config.add_line(line_to_write, "~/.tarstall/.fishrc")
+    lines = shell_lines(program_internal_name)
+    config.add_line("\n" + lines[".bashrc"], "~/.tarstall/.bashrc")
+    config.add_line("\n" + lines[".fishrc"], "~/.tarstall/.fishrc")
     config.db["programs"][program_internal_name]["has_path"] = True
+    index_program(program_internal_name)
     config.write_db()
     return "Complete"
 
 
+def exposed_commands(program):
+    """Get the Commands a Program Provides.
+
+    Args:
+        program (str): Installed program
+
+    Returns:
+        str[]: The program's binlinks, plus the executables at the top of its directory if it's in PATH, sorted
+
+    """
+    commands = set(config.db["programs"][program]["binlinks"])
+    if config.db["programs"][program]["has_path"]:
+        try:
+            with os.scandir(config.full("~/.tarstall/bin/{}".format(program))) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and entry.stat().st_mode & 0o111:
+                            commands.add(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+    return sorted(commands)
+
+
+def unindex_program(program):
+    """Remove a Program from the Reverse Indexes.
+
+    Removes the commands stored in the program's "commands" key from "command_index", and its .desktop files
+    from "desktop_index". The database isn't written.
+
+    Args:
+        program (str): Program to remove
+
+    """
+    for c in config.db["programs"][program]["commands"]:
+        providers = config.db["command_index"].get(c, [])
+        if program in providers:
+            providers.remove(program)
+        if providers == []:
+            config.db["command_index"].pop(c, None)
+    for d in config.db["programs"][program]["desktops"]:
+        if config.db["desktop_index"].get(d) == program:
+            del config.db["desktop_index"][d]
+    config.db["programs"][program]["commands"] = []
+
+
+def index_program(program):
+    """Update the Reverse Indexes for a Program.
+
+    The database's "command_index" maps each command to the programs providing it, and "desktop_index" maps
+    each .desktop file ID to its program, so which_program() doesn't have to look through every program.
+    This should be called whenever a program's binlinks, PATH, or files change. The database isn't written.
+
+    Args:
+        program (str): Program to index. Programs that aren't installed are ignored.
+
+    """
+    if program not in config.db["programs"]:
+        return
+    unindex_program(program)
+    config.db["programs"][program]["commands"] = exposed_commands(program)
+    for c in config.db["programs"][program]["commands"]:
+        config.db["command_index"].setdefault(c, []).append(program)
+    for d in config.db["programs"][program]["desktops"]:
+        config.db["desktop_index"][d] = program
+
+
+def rebuild_indexes():
+    """Rebuild the Reverse Indexes.
+
+    Used when programs' database entries are replaced wholesale, such as by repairs. The database isn't written.
+
+    """
+    config.db["command_index"] = {}
+    config.db["desktop_index"] = {}
+    for program in config.db["programs"]:
+        config.db["programs"][program]["commands"] = []
+        index_program(program)
+
+
+def which_program(command):
+    """Find Which Programs Provide a Command.
+
+    Args:
+        command (str): Command or .desktop file ID to look up
+
+    Returns:
+        str[]: Programs providing command as a binlink, an executable in PATH, or a .desktop file, sorted
+
+    """
+    providers = set(config.db["command_index"].get(command, []))
+    if command in config.db["desktop_index"]:
+        providers.add(config.db["desktop_index"][command])
+    return sorted(providers)
+
+
+def find_conflicts(program):
+    """Find Commands That Clash with Other Programs.
+
+    Args:
+        program (str): Installed program to check
+
+    Returns:
+        dict: Maps each command the program provides that other programs also provide to those programs
+
+    """
+    conflicts = {}
+    for c in config.db["programs"][program]["commands"]:
+        others = [p for p in config.db["command_index"].get(c, []) if p != program]
+        if others:
+            conflicts[c] = sorted(others)
+    return conflicts
+
+
 def update(force_update=False, show_progress=True):
     """Update tarstall.
 
@@ -1103,7 +2813,7 @@ def update(force_update=False, show_progress=True):
         config.vprint("Removing old tarstall files")
         os.chdir(config.full("~/.tarstall/"))
         files = os.listdir()
-        to_keep = ["bin", "database", ".bashrc", ".fishrc"]
+        to_keep = ["bin", "database", ".bashrc", ".fishrc", "store", "snapshots", "versions", "trash", "usage", "manifests", "cold"]
         progress = 55
         adder = 15 / int(len(files) - len(to_keep))
         for f in files:
@@ -1177,7 +2887,8 @@ def erase():
                     pass
     generic.progress(40)
     config.vprint('Removing tarstall directory')
-    rmtree(config.full('~/.tarstall'))
+    os.rename(config.full('~/.tarstall'), config.full('~/.tarstall-trash-' + version_name()))
+    empty_trash()
     generic.progress(90)
     try:
         rmtree("/tmp/tarstall-temp")
@@ -1283,53 +2994,39 @@ def verbose_toggle():
     return generic.endi(new_value)
 
 
-def create_command(file_extension, program):
+def create_command(file_extension, program, include=[], exclude=[]):
     """Create Extraction Command.
 
+    Used for archives config.extract_archive() can't extract itself. Include and exclude globs
+    are passed to the extractor, which matches them against file names.
+
     Args:
         file_extension (str): File extension of program (including .)
         program (str): Program name
-        overwrite_files (bool): Whether or not the command should overwrite files. Defaults to False.
+        include (str[]): Globs of files to extract. Everything is extracted if empty. Defaults to [].
+        exclude (str[]): Globs of files to not extract. Defaults to [].
 
     Returns:
         str: Command to run, "Bad Filetype", or "No bin_that_is_needed"
 
     """
     if config.vcheck():  # Creates the command to run to extract the archive
-        if file_extension == '.tar.gz' or file_extension == '.tar.xz':
-            vflag = 'v'
-        elif file_extension == '.zip':
-            vflag = ''
-        elif file_extension == '.7z':
-            vflag = ''
-        elif file_extension == '.rar':
-            vflag = ''
+        vflag = ''
     else:
-        if file_extension == '.tar.gz' or file_extension == '.tar.xz':
-            vflag = ''
-        elif file_extension == '.zip':
-            vflag = '-qq'
-        elif file_extension == '.7z':
+        if file_extension == '.7z':
             vflag = '-bb0 -bso0 -bd '
         elif file_extension == '.rar':
             vflag = '-idcdpq '
-    if file_extension == '.tar.gz' or file_extension == '.tar.xz':
-        command_to_go = "tar " + vflag + "xf " + program + " -C /tmp/tarstall-temp/"
-        if which("tar") is None:
-            config.vprint("tar not installed!")
-            return "No tar"
-    elif file_extension == '.zip':
-        command_to_go = 'unzip ' + vflag + ' ' + program + ' -d /tmp/tarstall-temp/'
-        if which("unzip") is None:
-            config.vprint("unzip not installed!")
-            return "No unzip"
-    elif file_extension == '.7z':
-        command_to_go = '7z x ' + vflag + program + ' -o/tmp/tarstall-temp/'
+    if file_extension == '.7z':
+        filters = "".join(["-ir!" + shlex.quote(g) + " " for g in include] + ["-xr!" + shlex.quote(g) + " " for g in exclude])
+        command_to_go = '7z x -mmt=on ' + vflag + filters + program + ' -o/tmp/tarstall-temp/'
         if which("7z") is None:
             config.vprint("7z not installed!")
             return "No 7z"
     elif file_extension == '.rar':
-        command_to_go = 'unrar x ' + vflag + program + ' /tmp/tarstall-temp/'
+        filters = "".join(["-x" + shlex.quote(g) + " " for g in exclude])
+        masks = "".join([shlex.quote(g) + " " for g in include])
+        command_to_go = 'unrar x ' + vflag + filters + program + ' ' + masks + '/tmp/tarstall-temp/'
         if which("unrar") is None:
             config.vprint("unrar not installed!")
             return "No unrar"
@@ -1340,24 +3037,59 @@ def create_command(file_extension, program):
     return command_to_go
 
 
-def install(program, overwrite=False, reinstall=False, show_progress=True):
+def archive_source(scan, program_internal_name):
+    """Get Archive Source.
+
+    Works out which directory of an archive is the program, from its scan.
+
+    Args:
+        scan (dict): Scan of the archive from config.scan_archive()
+        program_internal_name (str): Name of program the archive is for
+
+    Returns:
+        str: Directory in the archive that contains the program, or "" if the program is at the top of the archive
+
+    """
+    if scan["top"].get(program_internal_name):
+        config.vprint('Folder in folder detected! Using that directory instead...')
+        return program_internal_name
+    elif len(scan["top"]) == 1 and list(scan["top"].values())[0]:
+        config.vprint("Single folder detected!")
+        return list(scan["top"].keys())[0]
+    config.vprint('Folder in folder not detected!')
+    return ""
+
+
+def install(program, overwrite=False, reinstall=False, show_progress=True, scan=None, filters=None, script=False):
     """Install Archive.
 
-    Takes an archive and installs it.
+    Takes an archive and installs it. The archive is scanned before extracting anything, so its
+    layout is known up front and installs without enough free space are refused.
 
     Args:
         program (str): Path to archive to install
         overwrite (bool): Whether or not to assume the program is already installed and to overwite it
+        scan (dict): Scan of the archive from config.scan_archive(), if already done. Defaults to None.
+        filters (dict): Include and exclude globs for the archive's members (see set_filters()), which are
+        saved to the program. Defaults to None, using the program's saved filters if it's being overwritten.
+        script (bool): Passed to sync_program() when overwriting. Defaults to False.
 
     Returns:
-       str: A string from finish_install() a string from create_command(), "No rsync", "Bad name", "Installed", or "Error".
+       str: A string from finish_install() a string from create_command(), a string from sync_program(), "Bad name",
+       "No space", "Installed", or "Error".
 
     """
-    if not config.check_bin("rsync") and overwrite:
-        return "No rsync"
     program_internal_name = config.name(program)
     if config.char_check(program_internal_name):
         return "Bad name"
+    if scan is None:
+        try:
+            scan = config.scan_archive(program)
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError):
+            config.vprint("Failed to read archive!")
+            return "Error"
+        if scan is not None and not config.has_space(scan["size"]):
+            return "No space"
     config.vprint("Removing old temp directory (if it exists!)")
     try:
         rmtree(config.full("/tmp/tarstall-temp"))  # Removes temp directory (used during installs)
@@ -1366,23 +3098,47 @@ def install(program, overwrite=False, reinstall=False, show_progress=True):
     generic.progress(10, show_progress)
     config.vprint("Creating new temp directory")
     os.mkdir(config.full("/tmp/tarstall-temp"))  # Creates temp directory for extracting archive
+    if filters is None and overwrite:
+        filters = config.db["programs"][program_internal_name]["filters"]
+    include = [] if filters is None else filters["include"]
+    exclude = [] if filters is None else filters["exclude"]
     config.vprint("Extracting archive to temp directory")
     file_extension = config.extension(program)
-    program = config.spaceify(program)
-    command_to_go = create_command(file_extension, program)
     config.vprint('File type detected: ' + file_extension)
     generic.progress(15, show_progress)
-    if command_to_go.startswith("No") or command_to_go == "Bad Filetype":
-        return command_to_go
-    try:
-        os.system(command_to_go)  # Extracts program archive
-    except:
-        config.vprint('Failed to run command: ' + command_to_go + "! Program installation halted!")
-        return "Error"
+    if scan is not None:
+        root = archive_source(scan, program_internal_name)
+        shown = [15]
+
+        def on_progress(done, total):
+            percent = 15 + int(35 * done / max(total or scan["size"], 1))
+            if percent > shown[0]:
+                shown[0] = percent
+                generic.progress(percent, show_progress)
+
+        try:
+            config.extract_archive(program, "/tmp/tarstall-temp", root, include, exclude, on_progress,
+            config.read_config("ExtractMemoryLimit") * 1024 * 1024)
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError):
+            config.vprint("Failed to extract archive! Program installation halted!")
+            return "Error"
+    else:
+        command_to_go = create_command(file_extension, config.spaceify(program), include, exclude)
+        if command_to_go.startswith("No") or command_to_go == "Bad Filetype":
+            return command_to_go
+        try:
+            os.system(command_to_go)  # Extracts program archive
+        except:
+            config.vprint('Failed to run command: ' + command_to_go + "! Program installation halted!")
+            return "Error"
     generic.progress(50, show_progress)
     config.vprint('Checking for folder in folder')
     os.chdir("/tmp/tarstall-temp/")
-    if os.path.isdir(config.full('/tmp/tarstall-temp/' + program_internal_name + '/')):
+    if scan is not None:
+        source = os.path.join(config.full('/tmp/tarstall-temp'), root, "")
+        dest = config.full('~/.tarstall/bin/' + program_internal_name) + '/'
+        os.makedirs(source, exist_ok=True)  # Everything may have been filtered out
+    elif os.path.isdir(config.full('/tmp/tarstall-temp/' + program_internal_name + '/')):
         config.vprint('Folder in folder detected! Using that directory instead...')
         source = config.full('/tmp/tarstall-temp/' + program_internal_name) + '/'
         dest = config.full('~/.tarstall/bin/' + program_internal_name) + '/'
@@ -1396,14 +3152,11 @@ def install(program, overwrite=False, reinstall=False, show_progress=True):
         source = config.full('/tmp/tarstall-temp') + '/'
         dest = config.full('~/.tarstall/bin/' + program_internal_name) + '/'
     config.vprint("Moving program to directory")
+    synced = None
     if overwrite:
-        if verbose:
-            verbose_flag = "v"
-        else:
-            verbose_flag = ""
-        call(["rsync", "-a{}".format(verbose_flag), source, dest], stdout=c_out)
+        synced = sync_program(source, program_internal_name, script)
     else:
-        move(source, dest)
+        config.move_tree(source, dest)
     generic.progress(80, show_progress)
     config.vprint("Adding program to tarstall list of programs")
     config.vprint('Removing old temp directory...')
@@ -1412,9 +3165,17 @@ def install(program, overwrite=False, reinstall=False, show_progress=True):
         rmtree(config.full("/tmp/tarstall-temp"))
     except FileNotFoundError:
         config.vprint('Temp folder not found so not deleted!')
+    if isinstance(synced, str):
+        return synced
     if not overwrite:
-        return finish_install(program_internal_name)
+        status = finish_install(program_internal_name)
+        if filters is not None and program_internal_name in config.db["programs"]:
+            config.db["programs"][program_internal_name]["filters"] = filters
+            config.write_db()
+        return status
     else:
+        config.db["programs"][program_internal_name]["filters"] = filters
+        config.write_db()
         generic.progress(100, show_progress)
         return "Installed"
 
@@ -1458,18 +3219,16 @@ def dirinstall(program_path, program_internal_name, overwrite=False, reinstall=F
         overwrite (bool): Whether or not to assume the program is already installed and to overwite it
 
     Returns:
-       str: A string from finish_install(), "Installed", or "No rsync"
+       str: A string from finish_install() or "Installed"
 
     """
     generic.progress(10)
-    if not config.check_bin("rsync") and overwrite:
-        return "No rsync"
     config.vprint("Moving folder to tarstall destination")
     if overwrite:
-        call(["rsync", "-a", program_path, config.full("~/.tarstall/bin/{}".format(program_internal_name))], stdout=c_out)
+        sync_program(program_path, program_internal_name)
         rmtree(program_path)
     else:
-        move(program_path, config.full("~/.tarstall/bin/"))
+        config.move_tree(program_path, config.full("~/.tarstall/bin/{}".format(program_internal_name)))
     if not overwrite:
         return finish_install(program_internal_name)
     else:
@@ -1479,6 +3238,8 @@ def dirinstall(program_path, program_internal_name, overwrite=False, reinstall=F
 def uninstall(program):
     """Uninstall a Program.
 
+    Any branches of the program installed as git worktrees are uninstalled alongside it.
+
     Args:
         program (str): Name of program to uninstall
 
@@ -1488,11 +3249,23 @@ def uninstall(program):
     """
     if not program in config.db["programs"]:
         return "Not installed"
+    for p in get_worktrees(program):
+        config.vprint("Uninstalling worktree {}".format(p))
+        uninstall(p)
     config.vprint("Removing program files")
-    rmtree(config.full("~/.tarstall/bin/" + program + '/'))
+    if os.path.islink(config.full("~/.tarstall/bin/" + program)):
+        os.remove(config.full("~/.tarstall/bin/" + program))
+        trash(config.full("~/.tarstall/versions/" + program))
+    else:
+        trash(config.full("~/.tarstall/bin/" + program))
+    parent = config.db["programs"][program]["worktree_of"]
+    if parent is not None and config.check_bin("git"):
+        config.vprint("Removing worktree from {}".format(parent))
+        call(["git", "worktree", "prune"], cwd=config.full("~/.tarstall/bin/" + parent), stdout=c_out, stderr=c_out)
     generic.progress(40)
     config.vprint("Removing program from PATH and any binlinks for the program")
     config.remove_line(program, "~/.tarstall/.bashrc", 'poundword')
+    config.remove_line(program, "~/.tarstall/.fishrc", 'poundword')
     generic.progress(50)
     config.vprint("Removing program desktop files")
     if config.db["programs"][program]["desktops"]:
@@ -1506,13 +3279,246 @@ def uninstall(program):
             progress += adder
             generic.progress(progress)
     generic.progress(80)
+    if config.exists("~/.tarstall/snapshots/" + program):
+        config.vprint("Removing program snapshots")
+        trash(config.full("~/.tarstall/snapshots/" + program))
+    if cold_archive(program) is not None:
+        config.vprint("Removing program from cold storage")
+        try:
+            os.remove(cold_archive(program))
+        except FileNotFoundError:
+            pass
+    for record in ["usage", "manifests"]:
+        try:
+            os.remove(config.full("~/.tarstall/{}/{}.json".format(record, program)))
+        except FileNotFoundError:
+            pass
+    empty_trash()
+    config.vprint("Removing files no other programs use from the store")
+    prune_store()
     config.vprint("Removing program from tarstall list of programs")
+    unindex_program(program)
     del config.db["programs"][program]
     config.write_db()
     generic.progress(100)
     return "Success"
 
 
+def refresh_usage(program):
+    """Refresh a Program's Disk Usage.
+
+    Stores the size and number of files of a program in its "disk_usage" key in the database. Only directories
+    that changed since the last refresh are looked at again, using a cache kept in ~/.tarstall/usage.
+    Frozen programs count the size of their cold storage archive. The database isn't written.
+
+    Args:
+        program (str): Program to refresh the disk usage of
+
+    Returns:
+        dict: The program's new disk usage, with "bytes" and "files" keys
+
+    """
+    cache_file = config.full("~/.tarstall/usage/{}.json".format(program))
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = None
+    size, files, cache = config.tree_usage("~/.tarstall/bin/{}".format(program), cache)
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    with open(cache_file, "w") as f:
+        json.dump(cache, f)
+    if cold_archive(program) is not None and config.exists(cold_archive(program)):
+        size += os.path.getsize(cold_archive(program))
+    config.db["programs"][program]["disk_usage"] = {"bytes": size, "files": files}
+    return config.db["programs"][program]["disk_usage"]
+
+
+def disk_usage(show_progress=True):
+    """Get Disk Usage of all Programs.
+
+    Refreshes the disk usage of every program at once with refresh_usage().
+
+    Args:
+        show_progress (bool): Whether to display a progress bar. Defaults to True.
+
+    Returns:
+        str/dict: "No programs" if there are no programs installed, or a dict containing program names
+        and their disk usage from refresh_usage().
+
+    """
+    if not config.db["programs"]:
+        return "No programs"
+    usages = {}
+    generic.progress(0, show_progress)
+    with ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) * 2)) as executor:
+        futures = {executor.submit(refresh_usage, p): p for p in config.db["programs"]}
+        for future in as_completed(futures):
+            usages[futures[future]] = future.result()
+            generic.progress(100 * len(usages) / len(futures), show_progress)
+    config.write_db()
+    return usages
+
+
+def record_program(program):
+    """Record a Program's Files.
+
+    Ran whenever a program's files change, to refresh its disk usage, manifest, and the commands it provides,
+    and write the database.
+
+    Args:
+        program (str): Program whose files changed
+
+    """
+    refresh_usage(program)
+    record_manifest(program)
+    index_program(program)  # Changing files in place can add or remove executables on PATH
+    config.write_db()
+
+
+def scan_program_files(program):
+    """Scan a Program's Files.
+
+    Args:
+        program (str): Program to scan the files of
+
+    Returns:
+        dict: Paths relative to the program's directory as keys, and os.lstat() results as values. Directories
+        aren't included, and neither is git's own data, as git checks that itself.
+
+    """
+    root = config.full("~/.tarstall/bin/{}".format(program))
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        if dir_path == root:
+            if ".git" in dir_names:
+                dir_names.remove(".git")
+            if ".git" in file_names:
+                file_names.remove(".git")  # Worktree link to the repository
+        for f in file_names + [d for d in dir_names if os.path.islink(os.path.join(dir_path, d))]:
+            path = os.path.join(dir_path, f)
+            files[os.path.relpath(path, root)] = os.lstat(path)
+    return files
+
+
+def load_manifest(program):
+    """Load a Program's Manifest.
+
+    Args:
+        program (str): Program to load the manifest of
+
+    Returns:
+        dict/None: The manifest from record_manifest(), or None if the program doesn't have one
+
+    """
+    try:
+        with open(config.full("~/.tarstall/manifests/{}.json".format(program))) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def record_manifest(program):
+    """Record a Program's Manifest.
+
+    Records the size, permissions, modification time, and SHA-256 hash of every file in a program to
+    ~/.tarstall/manifests. Files are hashed in parallel, and files with the same size and modification
+    time as in the previous manifest keep their old hash instead of being hashed again.
+
+    Args:
+        program (str): Program to record the manifest of
+
+    Returns:
+        dict: Paths relative to the program's directory as keys, and dicts describing them as values
+
+    """
+    root = config.full("~/.tarstall/bin/{}".format(program))
+    old_manifest = load_manifest(program) or {}
+    manifest = {}
+    to_hash = []
+    for rel, st in scan_program_files(program).items():
+        if stat.S_ISLNK(st.st_mode):
+            manifest[rel] = {"link": os.readlink(os.path.join(root, rel))}
+            continue
+        manifest[rel] = {"size": st.st_size, "mode": stat.S_IMODE(st.st_mode), "mtime": st.st_mtime_ns}
+        old = old_manifest.get(rel, {})
+        if old.get("size") == st.st_size and old.get("mtime") == st.st_mtime_ns:
+            manifest[rel]["sha256"] = old["sha256"]
+        else:
+            to_hash.append(rel)
+    config.vprint("Hashing {} files of {}".format(len(to_hash), program))
+    with ThreadPoolExecutor() as executor:
+        for rel, digest in zip(to_hash, executor.map(config.hash_file, [os.path.join(root, r) for r in to_hash])):
+            manifest[rel]["sha256"] = digest
+    os.makedirs(config.full("~/.tarstall/manifests"), exist_ok=True)
+    with open(config.full("~/.tarstall/manifests/{}.json".format(program)), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def verify_program(program):
+    """Verify a Program.
+
+    Compares a program's files against its manifest. Files with the same size and modification time as
+    in the manifest are assumed to be unchanged, and the rest are hashed in parallel.
+
+    Args:
+        program (str): Program to verify
+
+    Returns:
+        str/dict: "Not installed", "Frozen" if the program is in cold storage, "No manifest" if the program
+        didn't have a manifest (one is recorded), or a dict with "Missing", "Added", and "Modified" keys, each containing a sorted list of paths.
+
+    """
+    if program not in config.db["programs"]:
+        return "Not installed"
+    if config.db["programs"][program]["frozen"] is not None:
+        return "Frozen"
+    manifest = load_manifest(program)
+    if manifest is None:
+        record_manifest(program)
+        return "No manifest"
+    root = config.full("~/.tarstall/bin/{}".format(program))
+    files = scan_program_files(program)
+    problems = {"Missing": sorted(set(manifest) - set(files)), "Added": sorted(set(files) - set(manifest)), "Modified": []}
+    to_hash = []
+    for rel in set(files) & set(manifest):
+        st = files[rel]
+        entry = manifest[rel]
+        if stat.S_ISLNK(st.st_mode) or "link" in entry:
+            if not (stat.S_ISLNK(st.st_mode) and os.readlink(os.path.join(root, rel)) == entry.get("link")):
+                problems["Modified"].append(rel)
+        elif st.st_size != entry["size"] or stat.S_IMODE(st.st_mode) != entry["mode"]:
+            problems["Modified"].append(rel)
+        elif st.st_mtime_ns != entry["mtime"]:
+            to_hash.append(rel)
+    config.vprint("Hashing {} files of {}".format(len(to_hash), program))
+    with ThreadPoolExecutor() as executor:
+        for rel, digest in zip(to_hash, executor.map(config.hash_file, [os.path.join(root, r) for r in to_hash])):
+            if digest != manifest[rel]["sha256"]:
+                problems["Modified"].append(rel)
+    problems["Modified"].sort()
+    return problems
+
+
+def list_files(program):
+    """List a Program's Files.
+
+    Args:
+        program (str): Program to list the files of
+
+    Returns:
+        str/str[]: "Not installed", "No manifest", or the paths in the program's manifest, sorted
+
+    """
+    if program not in config.db["programs"]:
+        return "Not installed"
+    manifest = load_manifest(program)
+    if manifest is None:
+        return "No manifest"
+    return sorted(manifest)
+
+
 def list_programs():
     """List Installed Programs.
 
@@ -1523,6 +3529,34 @@ def list_programs():
     return list(config.db["programs"].keys())
 
 
+def program_info(program):
+    """Get Information About a Program.
+
+    Args:
+        program (str): Installed program to get information about
+
+    Returns:
+        dict: The program's install "type", "frozen" (whether it's in cold storage), "size" in bytes (None if it
+        hasn't been measured), "source" it updates from ("git", its update URL, "script", or None), and when it
+        was last installed or "updated" (None if its files are missing)
+
+    """
+    prog = config.db["programs"][program]
+    source = None
+    if prog["update_url"] is not None:
+        source = prog["update_url"]
+    elif prog["install_type"] == "git":
+        source = "git"
+    elif prog["post_upgrade_script"] is not None:
+        source = "script"
+    try:
+        updated = os.lstat(config.full("~/.tarstall/bin/{}".format(program))).st_mtime  # Replaced on each install and upgrade
+    except FileNotFoundError:
+        updated = None
+    return {"type": prog["install_type"], "frozen": prog["frozen"] is not None,
+    "size": prog["disk_usage"]["bytes"] if prog["disk_usage"] is not None else None, "source": source, "updated": updated}
+
+
 def get_online_version(type_of_replacement, branch=config.branch):
     """Get tarstall Version from GitHub.
 
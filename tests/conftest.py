@@ -1,6 +1,9 @@
 import pytest
+import os
+from subprocess import call
 
 import prog_manage
+import config
 from io import StringIO
 
 
@@ -13,4 +16,13 @@ def pre_test(monkeypatch):
     prog_manage.verbose_toggle()
 
     monkeypatch.setattr('sys.stdin', StringIO("n\n"*3))
-    prog_manage.install("./tests/fake_packages/package.tar.gz")
\ No newline at end of file
+    prog_manage.install("./tests/fake_packages/package.tar.gz")
+
+
+def make_test_repo(files, path="/tmp/tarstall-test-repo"):
+    for f in files:
+        os.makedirs(os.path.dirname(os.path.join(path, f)), exist_ok=True)
+        config.create(os.path.join(path, f))
+    call(["git", "init", "-q", "-b", "master"], cwd=path)
+    call(["git", "add", "."], cwd=path)
+    call(["git", "-c", "user.name=tarstall", "-c", "user.email=tarstall@localhost", "commit", "-q", "-m", "Test"], cwd=path)
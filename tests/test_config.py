@@ -1,7 +1,15 @@
+import pytest
 import config
 import os
+import stat
+import errno
+import tarfile
+import zipfile
 import prog_manage
 import json
+import sys
+from subprocess import call, check_output
+from shutil import rmtree
 
 
 def test_check_bin():
@@ -54,7 +62,9 @@ def test_unlock():
     assert not os.path.isfile("/tmp/tarstall-lock")
 
 def test_get_db():
-    assert config.get_db() == {
+    db = config.get_db()
+    assert isinstance(db["programs"]["package"].pop("activated"), int)
+    assert db == {
         "options": {
             "Verbose": True,
             "AutoInstall": False,
@@ -75,9 +85,18 @@ def test_get_db():
                 "post_upgrade_script": None,
                 "update_url": None,
                 "has_path": False,
-                "binlinks": []
+                "binlinks": [],
+                "worktree_of": None,
+                "disk_usage": {"bytes": 8, "files": 1},
+                "update_checksum": None,
+                "filters": None,
+                "archive": None,
+                "frozen": None,
+                "commands": []
             }
-        }
+        },
+        "command_index": {},
+        "desktop_index": {}
     }
 
 
@@ -87,6 +106,16 @@ def test_name():
     assert config.name("./tar/xz/files/are/pretty/cool.tar.xz") == "cool"
 
 
+def test_split_git_url():
+    assert config.split_git_url("https://example.com/repo.git") == ("https://example.com/repo.git", None)
+    assert config.split_git_url("https://example.com/repo.git#tools/thing/") == ("https://example.com/repo.git", "tools/thing")
+
+
+def test_git_name():
+    assert config.git_name("https://example.com/repo.git") == "repo"
+    assert config.git_name("https://example.com/repo.git#tools/thing") == "thing"
+
+
 def test_extension():
     assert config.extension("weeeeee.zip") == ".zip"
     assert config.extension("asdf.tar.gz") == ".tar.gz"
@@ -99,6 +128,267 @@ def test_exists():
     assert config.exists("./config.no") is False
 
 
+def test_dir_size():
+    os.mkdir("/tmp/tarstall-test-temp")
+    os.mkdir("/tmp/tarstall-test-temp/folder")
+    with open("/tmp/tarstall-test-temp/a", "w") as f:
+        f.write("a" * 10)
+    with open("/tmp/tarstall-test-temp/folder/b", "w") as f:
+        f.write("b" * 5)
+    assert config.dir_size("/tmp/tarstall-test-temp") == 15
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_scan_archive():
+    assert config.scan_archive(os.path.dirname(__file__) + "/fake_packages/package.tar.gz") == {"size": 8, "files": 1, "top": {"test.sh": False}}
+    with zipfile.ZipFile("/tmp/tarstall-test.zip", "w") as z:
+        z.writestr("folder/a", "a" * 10)
+        z.writestr("folder/b/c", "c" * 5)
+    assert config.scan_archive("/tmp/tarstall-test.zip") == {"size": 15, "files": 2, "top": {"folder": True}}
+    os.remove("/tmp/tarstall-test.zip")
+    assert config.scan_archive("/tmp/tarstall-test.7z") is None
+
+
+def test_index_files():
+    rmtree("/tmp/tarstall-index", ignore_errors=True)
+    os.makedirs("/tmp/tarstall-index/bin")
+    os.makedirs("/tmp/tarstall-index/.git")
+    with open("/tmp/tarstall-index/bin/program", "wb") as f:
+        f.write(b"\x7fELF")
+    with open("/tmp/tarstall-index/run.sh", "w") as f:
+        f.write("#!/bin/sh\n")
+    os.chmod("/tmp/tarstall-index/run.sh", 0o755)
+    with open("/tmp/tarstall-index/README.md", "w") as f:
+        f.write("#!not a script")
+    with open("/tmp/tarstall-index/.git/HEAD", "w") as f:
+        f.write("ref")
+    assert config.index_files("/tmp/tarstall-index") == [("README.md", None), ("bin/program", "elf"), ("run.sh", "script")]
+    rmtree("/tmp/tarstall-index")
+
+
+def test_filter_path():
+    assert config.filter_path("docs/manual.txt", exclude=["docs"]) is False
+    assert config.filter_path("bin/run", exclude=["docs"]) is True
+    assert config.filter_path("lib/a.so", include=["lib/*.so"]) is True
+    assert config.filter_path("lib/a.a", include=["lib/*.so"]) is False
+
+
+def test_extract_archive():
+    with zipfile.ZipFile("/tmp/tarstall-test.zip", "w") as z:
+        z.writestr("folder/bin/run", "run")
+        z.writestr("folder/docs/manual.txt", "manual")
+    assert config.extract_archive("/tmp/tarstall-test.zip", "/tmp/tarstall-test-temp", "folder", exclude=["docs"]) == 1
+    assert os.path.isfile("/tmp/tarstall-test-temp/folder/bin/run")
+    assert not os.path.exists("/tmp/tarstall-test-temp/folder/docs")
+    os.remove("/tmp/tarstall-test.zip")
+    rmtree("/tmp/tarstall-test-temp")
+
+
+@pytest.mark.filterwarnings("ignore:Duplicate name")
+def test_extract_archive_escape():
+    os.makedirs("/tmp/tarstall-test-esc")
+    config.create("/tmp/tarstall-test-esc/outside.txt")
+
+    def link(name, target):
+        info = zipfile.ZipInfo(name)
+        info.external_attr = (stat.S_IFLNK | 0o777) << 16
+        return info, target
+
+    for members, refused in [([link("prog/link", "/tmp/tarstall-test-esc/outside.txt"), ("prog/link", "escaped")], False),
+    ([link("prog/link", "../../tarstall-test-esc"), ("prog/link/outside.txt", "escaped")], True),
+    ([link("prog/link", "/tmp/tarstall-test-esc/outside.txt")], True)]:
+        with zipfile.ZipFile("/tmp/tarstall-test.zip", "w") as z:
+            for info, data in members:
+                z.writestr(info, data)
+        if refused:
+            with pytest.raises(OSError):
+                config.extract_archive("/tmp/tarstall-test.zip", "/tmp/tarstall-test-temp")
+        else:
+            config.extract_archive("/tmp/tarstall-test.zip", "/tmp/tarstall-test-temp")
+        assert not os.path.islink("/tmp/tarstall-test-temp/prog/link")  # Only the last member with a name is used
+        with open("/tmp/tarstall-test-esc/outside.txt") as f:
+            assert f.read() == ""
+        rmtree("/tmp/tarstall-test-temp")
+    with zipfile.ZipFile("/tmp/tarstall-test.zip", "w") as z:
+        z.writestr(*link("prog/link", "bin/run"))
+        z.writestr("prog/bin/run", "run")
+        z.writestr("prog/dup", "first")
+        z.writestr(*link("prog/dup", "bin/run"))
+        z.writestr("prog/dup", "last")
+    config.extract_archive("/tmp/tarstall-test.zip", "/tmp/tarstall-test-temp")
+    assert os.readlink("/tmp/tarstall-test-temp/prog/link") == "bin/run"
+    assert not os.path.islink("/tmp/tarstall-test-temp/prog/dup")
+    with open("/tmp/tarstall-test-temp/prog/dup") as f:
+        assert f.read() == "last"
+    os.remove("/tmp/tarstall-test.zip")
+    rmtree("/tmp/tarstall-test-temp")
+    os.symlink("/tmp/tarstall-test-esc/outside.txt", "/tmp/tarstall-test-esc/link")
+    call(["tar", "-czf", "/tmp/tarstall-test.tar.gz", "-C", "/tmp/tarstall-test-esc", "link"])
+    with pytest.raises(tarfile.TarError):
+        config.extract_archive("/tmp/tarstall-test.tar.gz", "/tmp/tarstall-test-temp")
+    assert not os.path.lexists("/tmp/tarstall-test-temp/link")
+    os.remove("/tmp/tarstall-test.tar.gz")
+    rmtree("/tmp/tarstall-test-temp", ignore_errors=True)
+    rmtree("/tmp/tarstall-test-esc")
+
+
+def test_extract_archive_hardlink():
+    os.makedirs("/tmp/tarstall-test-temp/src/folder/docs")
+    os.makedirs("/tmp/tarstall-test-temp/src/folder/bin")
+    with open("/tmp/tarstall-test-temp/src/folder/docs/manual.txt", "w") as f:
+        f.write("manual")
+    os.link("/tmp/tarstall-test-temp/src/folder/docs/manual.txt", "/tmp/tarstall-test-temp/src/folder/bin/help.txt")
+    call(["tar", "-czf", "/tmp/tarstall-test-temp/test.tar.gz", "-C", "/tmp/tarstall-test-temp/src", "folder"])
+    assert config.extract_archive("/tmp/tarstall-test-temp/test.tar.gz", "/tmp/tarstall-test-temp/out", "folder", exclude=["docs"]) == 2
+    assert os.path.isdir("/tmp/tarstall-test-temp/out/folder/bin")
+    assert not os.path.exists("/tmp/tarstall-test-temp/out/folder/docs")
+    assert config.extract_archive("/tmp/tarstall-test-temp/test.tar.gz", "/tmp/tarstall-test-temp/all") == 5
+    with open("/tmp/tarstall-test-temp/all/folder/bin/help.txt") as f:
+        assert f.read() == "manual"
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_extract_zip_parallel():
+    with zipfile.ZipFile("/tmp/tarstall-test.zip", "w", zipfile.ZIP_DEFLATED) as z:
+        for i in range(50):
+            z.writestr("folder/{}/file{}".format(i % 5, i), str(i) * 100)
+    progress = []
+    assert config.extract_archive("/tmp/tarstall-test.zip", "/tmp/tarstall-test-temp", on_progress=lambda done, total: progress.append((done, total))) == 50
+    assert len(progress) == 50
+    assert progress[-1][0] == progress[-1][1]
+    with open("/tmp/tarstall-test-temp/folder/2/file42") as f:
+        assert f.read() == "42" * 100
+    os.remove("/tmp/tarstall-test.zip")
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_extract_archive_memory():
+    os.makedirs("/tmp/tarstall-test-temp/src/big")
+    with open("/tmp/tarstall-test-temp/src/big/huge.img", "w") as f:
+        f.truncate(10 * 1024 ** 3)  # 10GB sparse file
+    with open("/tmp/tarstall-test-temp/src/big/dense.img", "wb") as f:
+        for i in range(256):
+            f.write(os.urandom(1024) * 1024)
+    call(["tar", "-cSzf", "/tmp/tarstall-test-temp/big.tar.gz", "-C", "/tmp/tarstall-test-temp/src", "big"])
+    rmtree("/tmp/tarstall-test-temp/src")
+    limit = 64 * 1024 * 1024
+    # Extract in a fresh interpreter so peak RSS only counts the extraction
+    code = "import config, resource\n" + \
+    "config.extract_archive('/tmp/tarstall-test-temp/big.tar.gz', '/tmp/tarstall-test-temp/out', memory_limit={})\n".format(limit) + \
+    "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)"
+    peak = int(check_output([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).split()[-1])
+    assert os.path.getsize("/tmp/tarstall-test-temp/out/big/huge.img") == 10 * 1024 ** 3
+    assert os.path.getsize("/tmp/tarstall-test-temp/out/big/dense.img") == 256 * 1024 ** 2
+    assert peak < limit
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_tree_usage():
+    os.makedirs("/tmp/tarstall-test-temp/folder")
+    with open("/tmp/tarstall-test-temp/a", "w") as f:
+        f.write("a" * 10)
+    with open("/tmp/tarstall-test-temp/folder/b", "w") as f:
+        f.write("b" * 5)
+    size, files, cache = config.tree_usage("/tmp/tarstall-test-temp")
+    assert (size, files) == (15, 2)
+    with open("/tmp/tarstall-test-temp/folder/c", "w") as f:
+        f.write("c" * 3)
+    os.utime("/tmp/tarstall-test-temp/folder", ns=(0, 0))
+    size, files, cache = config.tree_usage("/tmp/tarstall-test-temp", cache)
+    assert (size, files) == (18, 3)
+    assert config.tree_usage("/tmp/tarstall-test-temp", cache)[:2] == (18, 3)
+    config.copy_tree("/tmp/tarstall-test-temp/folder", "/tmp/tarstall-test-temp/new")  # Keeps folder's mtime
+    os.remove("/tmp/tarstall-test-temp/new/c")
+    rmtree("/tmp/tarstall-test-temp/folder")
+    os.utime("/tmp/tarstall-test-temp/new", ns=(0, 0))
+    os.rename("/tmp/tarstall-test-temp/new", "/tmp/tarstall-test-temp/folder")
+    assert config.tree_usage("/tmp/tarstall-test-temp", cache)[:2] == (15, 2)
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_copy_tree():
+    os.makedirs("/tmp/tarstall-test-temp/src/folder")
+    with open("/tmp/tarstall-test-temp/src/folder/run.sh", "w") as f:
+        f.write("#!/bin/sh")
+    os.chmod("/tmp/tarstall-test-temp/src/folder/run.sh", 0o755)
+    os.symlink("folder/run.sh", "/tmp/tarstall-test-temp/src/link")
+    os.makedirs("/tmp/tarstall-test-temp/dest/folder")
+    with open("/tmp/tarstall-test-temp/dest/folder/run.sh", "w") as f:
+        f.write("Old")
+    os.link("/tmp/tarstall-test-temp/dest/folder/run.sh", "/tmp/tarstall-test-temp/hardlink")
+    assert config.copy_tree("/tmp/tarstall-test-temp/src/", "/tmp/tarstall-test-temp/dest") == 9
+    with open("/tmp/tarstall-test-temp/dest/folder/run.sh") as f:
+        assert f.read() == "#!/bin/sh"
+    with open("/tmp/tarstall-test-temp/hardlink") as f:
+        assert f.read() == "Old"
+    assert os.stat("/tmp/tarstall-test-temp/dest/folder/run.sh").st_mode & 0o777 == 0o755
+    assert os.readlink("/tmp/tarstall-test-temp/dest/link") == "folder/run.sh"
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_sync_tree():
+    os.makedirs("/tmp/tarstall-test-temp/src")
+    with open("/tmp/tarstall-test-temp/src/same", "w") as f:
+        f.write("Same")
+    with open("/tmp/tarstall-test-temp/src/changed", "w") as f:
+        f.write("New")
+    config.copy_tree("/tmp/tarstall-test-temp/src", "/tmp/tarstall-test-temp/dest")
+    with open("/tmp/tarstall-test-temp/src/changed", "w") as f:
+        f.write("Newer")
+    config.create("/tmp/tarstall-test-temp/dest/extra")
+    assert config.sync_tree("/tmp/tarstall-test-temp/src", "/tmp/tarstall-test-temp/dest") == 5
+    assert os.path.isfile("/tmp/tarstall-test-temp/dest/extra")
+    assert config.sync_tree("/tmp/tarstall-test-temp/src", "/tmp/tarstall-test-temp/dest", True, True) == 0
+    assert not os.path.isfile("/tmp/tarstall-test-temp/dest/extra")
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_copy_contents(monkeypatch):
+    def no_clone(fd, request, arg):
+        raise OSError(errno.EOPNOTSUPP, "No reflinks")
+
+    def copy_nothing(*args):
+        return 0
+    monkeypatch.setattr(config.fcntl, "ioctl", no_clone)
+    monkeypatch.setattr(config.os, "copy_file_range", copy_nothing)
+    with open("/tmp/tarstall-test-temp", "w") as f:
+        f.write("tarstall" * 1000)
+    for sendfile in (os.sendfile, copy_nothing):
+        monkeypatch.setattr(config.os, "sendfile", sendfile)
+        config.copy_file("/tmp/tarstall-test-temp", "/tmp/tarstall-test-temp-copy")
+        with open("/tmp/tarstall-test-temp-copy") as f:
+            assert f.read() == "tarstall" * 1000
+    os.remove("/tmp/tarstall-test-temp")
+    os.remove("/tmp/tarstall-test-temp-copy")
+
+
+def test_hash_file():
+    with open("/tmp/tarstall-test-temp", "w") as f:
+        f.write("tarstall")
+    assert config.hash_file("/tmp/tarstall-test-temp") == "61ecf69bdfa20c2566b1b2eb9f546ea213eacd89b4532c70e3bef9e9fc768b9d"
+    os.remove("/tmp/tarstall-test-temp")
+
+
+def test_move_tree():
+    os.makedirs("/tmp/tarstall-test-temp/src")
+    config.create("/tmp/tarstall-test-temp/src/file")
+    config.move_tree("/tmp/tarstall-test-temp/src/", "/tmp/tarstall-test-temp/dest/")
+    assert os.path.isfile("/tmp/tarstall-test-temp/dest/file")
+    assert not os.path.exists("/tmp/tarstall-test-temp/src")
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_exchange():
+    os.makedirs("/tmp/tarstall-test-temp/dir")
+    os.symlink("/tmp/tarstall-test-temp/dir", "/tmp/tarstall-test-temp/link")
+    if config.exchange("/tmp/tarstall-test-temp/link", "/tmp/tarstall-test-temp/dir"):
+        assert os.path.islink("/tmp/tarstall-test-temp/dir")
+        assert os.path.isdir("/tmp/tarstall-test-temp/link") and not os.path.islink("/tmp/tarstall-test-temp/link")
+        with pytest.raises(FileNotFoundError):
+            config.exchange("/tmp/tarstall-test-temp/missing", "/tmp/tarstall-test-temp/dir")
+    rmtree("/tmp/tarstall-test-temp")
+
+
 def test_spaceify():
     assert config.spaceify("this is a test") == "this\\ is\\ a\\ test"
 
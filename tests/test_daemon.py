@@ -0,0 +1,58 @@
+import pytest
+import os
+import sys
+import time
+import signal
+import fcntl
+from subprocess import Popen
+
+import daemon
+import config
+
+
+def test_daemon():
+    server = Popen([sys.executable, "-c", "import daemon; daemon.serve()"], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for i in range(100):
+        if daemon.running():
+            break
+        time.sleep(0.1)
+    assert daemon.running()
+    client = daemon.Client()
+    assert client.list_programs() == ["package"]
+    assert client.verify_program("package") == {"Missing": [], "Added": [], "Modified": []}
+    assert client.uninstall("package") == "Success"
+    assert "package" not in config.db["programs"]
+    with pytest.raises(AttributeError):
+        client.erase()
+    with pytest.raises(RuntimeError):
+        client.call("erase")
+    client.close()
+    server.send_signal(signal.SIGTERM)
+    assert server.wait(10) == 0
+    assert not os.path.exists(config.full(daemon.SOCKET))
+
+
+def test_run_scheduled(monkeypatch):
+    import prog_manage
+    ran = []
+    monkeypatch.setattr(prog_manage, "scheduled_jobs", lambda: ran.append(config.locked()))
+    assert daemon.run_scheduled(prog_manage) is True
+    assert ran == [True]
+    assert not config.locked()
+    config.lock()
+    assert daemon.run_scheduled(prog_manage) is False
+    config.unlock()
+    assert ran == [True]
+
+
+def test_read_only_calls():
+    import prog_manage
+    with daemon.lock:  # A call that changes things is running
+        assert daemon.run_call(prog_manage, {"call": "list_programs"}) == {"status": "Success", "result": ["package"]}
+
+
+def test_one_daemon():
+    with open(config.full(daemon.PIDFILE), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        assert daemon.serve() == "Running"
+    assert not daemon.running()
@@ -0,0 +1,48 @@
+import pytest
+import os
+import asyncio
+from subprocess import call
+from shutil import rmtree
+
+import engine
+import prog_manage
+import config
+from tests.conftest import make_test_repo
+
+
+def test_run_command():
+    lines = []
+    err, output = asyncio.run(engine.run_command(["printf", "a 10%%\\rb 50%%\\nc"], on_line=lines.append))
+    assert err == 0
+    assert output == "a 10%\rb 50%\nc"
+    assert lines == ["a 10%", "b 50%", "c"]
+
+
+def test_update_programs():
+    for repo in ["/tmp/tarstall-test-repo-a", "/tmp/tarstall-test-repo-b"]:
+        os.makedirs(repo)
+        make_test_repo(["run.sh"], repo)
+        prog_manage.gitinstall(repo + "/.git", os.path.basename(repo))
+        make_test_repo(["new.sh"], repo)
+    statuses = asyncio.run(engine.update_programs())
+    assert statuses == {"package": "Does not update", "tarstall-test-repo-a": "Success", "tarstall-test-repo-b": "Success"}
+    for repo in ["/tmp/tarstall-test-repo-a", "/tmp/tarstall-test-repo-b"]:
+        assert os.path.isfile(config.full("~/.tarstall/bin/{}/new.sh".format(os.path.basename(repo))))
+        rmtree(repo)
+
+
+def test_update_programs_worktrees():
+    make_test_repo(["run.sh"])
+    call(["git", "branch", "dev"], cwd="/tmp/tarstall-test-repo")
+    prog_manage.gitinstall("/tmp/tarstall-test-repo/.git", "tarstall-test-repo")
+    assert prog_manage.add_git_worktree("tarstall-test-repo", "dev") == "tarstall-test-repo-dev"
+    make_test_repo(["new.sh"])
+    call(["git", "checkout", "-q", "dev"], cwd="/tmp/tarstall-test-repo")
+    make_test_repo(["dev.sh"])
+    statuses = asyncio.run(engine.update_programs())
+    assert statuses == {"package": "Does not update", "tarstall-test-repo": "Success", "tarstall-test-repo-dev": "Success"}
+    assert os.path.isfile(config.full("~/.tarstall/bin/tarstall-test-repo/new.sh"))
+    assert not os.path.isfile(config.full("~/.tarstall/bin/tarstall-test-repo/dev.sh"))
+    assert os.path.isfile(config.full("~/.tarstall/bin/tarstall-test-repo-dev/dev.sh"))
+    prog_manage.uninstall("tarstall-test-repo")
+    rmtree("/tmp/tarstall-test-repo")
@@ -1,5 +1,8 @@
 from io import StringIO
+import queue
+import threading
 
+import config
 import generic
 
 
@@ -12,6 +15,50 @@ def test_get_input(monkeypatch):
     assert generic.get_input("question_string", ['y', 'n'], 'n') == 'y'
 
 
+def test_file_browser(monkeypatch):
+    monkeypatch.setattr("sys.stdin", StringIO("1\n"))
+    assert generic.file_browser("~/.tarstall/bin/package", "package") == "test.sh"
+    monkeypatch.setattr("sys.stdin", StringIO("tsh\n2\nexit\n"))
+    assert generic.file_browser("~/.tarstall/bin/package", "package") is None
+    config.create("~/.tarstall/bin/package/new.sh")  # Changed in place after being indexed
+    monkeypatch.setattr("sys.stdin", StringIO("new.sh\n"))
+    assert generic.file_browser("~/.tarstall/bin/package", "package") == "new.sh"
+
+
+def test_search_files():
+    files = [("bin/program", "elf"), ("docs/program.txt", None), ("lib/libprogram.so", "elf"), ("tools/prgm", "script")]
+    assert generic.launch_targets(files, "program") == [("bin/program", "elf"), ("tools/prgm", "script")]
+    assert generic.search_files(files, "prgm") == [("tools/prgm", "script"), ("bin/program", "elf"),
+    ("lib/libprogram.so", "elf"), ("docs/program.txt", None)]
+
+
 def test_endi():
     assert generic.endi(True) == "enabled"
-    assert generic.endi(False) == "disabled"
\ No newline at end of file
+    assert generic.endi(False) == "disabled"
+
+def test_human_size():
+    assert generic.human_size(10) == "10 B"
+    assert generic.human_size(1536) == "1.5 KB"
+    assert generic.human_size(5 * 1024 * 1024) == "5.0 MB"
+
+
+def test_on_gui_thread(monkeypatch):
+    events = queue.Queue()
+    monkeypatch.setattr(config, "mode", "gui")
+    monkeypatch.setattr(config, "gui_events", lambda event, value: events.put((event, value)))
+    where = generic.on_gui_thread(lambda: threading.current_thread())
+    results = []
+
+    def worker():
+        generic.progress(50)
+        results.append(where())
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert events.get(timeout=5) == ("-PROGRESS-", 50)
+    event, call = events.get(timeout=5)
+    assert event == "-CALL-"
+    generic.run_call(call)
+    thread.join(5)
+    assert results == [threading.main_thread()]
+    assert where() is threading.main_thread()
@@ -1,9 +1,15 @@
 import pytest
 import os
+import fcntl
+import time
+import hashlib
 from io import StringIO
+from subprocess import call, check_output, Popen, PIPE
+from shutil import rmtree
 
 import prog_manage
 import config
+from tests.conftest import make_test_repo
 
 """
 To write tests for:
@@ -28,6 +34,173 @@ def test_gitinstall(monkeypatch):
     assert os.path.isfile(os.path.expanduser("~/.tarstall/bin/tarstall/prog_manage.py"))
 
 
+def test_gitinstall_sparse(monkeypatch):
+    monkeypatch.setattr(prog_manage, "finish_install", nothing_two)
+    make_test_repo(["tools/sparse_tool/run.sh", "docs/manual.txt"])
+    prog_manage.gitinstall("file:///tmp/tarstall-test-repo/.git#tools/sparse_tool", "sparse_tool")
+    rmtree("/tmp/tarstall-test-repo")
+    assert os.path.isfile(os.path.expanduser("~/.tarstall/bin/sparse_tool/tools/sparse_tool/run.sh"))
+    assert not os.path.isdir(os.path.expanduser("~/.tarstall/bin/sparse_tool/docs"))
+
+
+def test_add_git_worktree():
+    make_test_repo(["run.sh"])
+    call(["git", "branch", "dev"], cwd="/tmp/tarstall-test-repo")
+    prog_manage.gitinstall("/tmp/tarstall-test-repo/.git", "tarstall-test-repo")
+    rmtree("/tmp/tarstall-test-repo")
+    assert prog_manage.add_git_worktree("tarstall-test-repo", "dev") == "tarstall-test-repo-dev"
+    assert os.path.isfile(os.path.expanduser("~/.tarstall/bin/tarstall-test-repo-dev/.git"))
+    assert config.db["programs"]["tarstall-test-repo-dev"]["worktree_of"] == "tarstall-test-repo"
+    prog_manage.uninstall("tarstall-test-repo")
+    assert "tarstall-test-repo-dev" not in config.db["programs"]
+
+
+def test_update_git_program():
+    make_test_repo(["run.sh"])
+    prog_manage.gitinstall("/tmp/tarstall-test-repo/.git", "tarstall-test-repo")
+    assert prog_manage.update_git_program("tarstall-test-repo") == "No update"
+    assert not os.path.islink(os.path.expanduser("~/.tarstall/bin/tarstall-test-repo"))
+    make_test_repo(["new.sh"])
+    assert prog_manage.update_git_program("tarstall-test-repo") == "Success"
+    rmtree("/tmp/tarstall-test-repo")
+    assert os.path.islink(os.path.expanduser("~/.tarstall/bin/tarstall-test-repo"))
+    assert os.path.isfile(os.path.expanduser("~/.tarstall/bin/tarstall-test-repo/new.sh"))
+    assert prog_manage.rollback("tarstall-test-repo") == "Success"
+    assert not os.path.isfile(os.path.expanduser("~/.tarstall/bin/tarstall-test-repo/new.sh"))
+
+
+def test_update_program_script():
+    make_test_repo(["run.sh"])
+    prog_manage.gitinstall("/tmp/tarstall-test-repo/.git", "tarstall-test-repo")
+    with open("/tmp/tarstall-test-script.sh", "w") as f:
+        f.write("#!/bin/sh\npwd > ran\n")
+    os.chmod("/tmp/tarstall-test-script.sh", 0o755)
+    prog_manage.update_script("tarstall-test-repo", "/tmp/tarstall-test-script.sh")
+    make_test_repo(["new.sh"])
+    assert prog_manage.update_program("tarstall-test-repo") == "Success"
+    rmtree("/tmp/tarstall-test-repo")
+    program_dir = os.path.realpath(os.path.expanduser("~/.tarstall/bin/tarstall-test-repo"))
+    with open(os.path.join(program_dir, "ran")) as f:
+        assert f.read().strip() == program_dir  # Run in the new version before it went live
+    assert os.path.isfile(os.path.join(program_dir, "new.sh"))
+    staged = prog_manage.stage_version("tarstall-test-repo")
+    assert os.stat(os.path.join(staged, ".git/HEAD")).st_ino != os.stat(os.path.join(program_dir, ".git/HEAD")).st_ino
+    rmtree(staged)
+    os.remove("/tmp/tarstall-test-script.sh")
+
+
+def test_maintain_git_programs():
+    assert prog_manage.maintain_git_programs() == "No programs"
+    make_test_repo(["run.sh"])
+    prog_manage.gitinstall("/tmp/tarstall-test-repo/.git", "tarstall-test-repo")
+    rmtree("/tmp/tarstall-test-repo")
+    status = prog_manage.maintain_git_programs()
+    assert list(status.keys()) == ["tarstall-test-repo"]
+    assert isinstance(status["tarstall-test-repo"], int)
+    assert config.read_config("LastMaintained") > 0
+
+
+def test_background_maintenance():
+    make_test_repo(["run.sh"])
+    prog_manage.gitinstall("/tmp/tarstall-test-repo/.git", "tarstall-test-repo")
+    rmtree("/tmp/tarstall-test-repo")
+    with open(config.full("~/.tarstall/maintain-lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        assert prog_manage.background_maintenance() == "Running"
+    assert config.read_config("LastMaintained") == 0
+    assert list(prog_manage.background_maintenance().keys()) == ["tarstall-test-repo"]
+    assert config.read_config("LastMaintained") > 0
+    assert not config.locked()
+
+
+def test_dedupe_programs():
+    for p in ["package", "package_two"]:
+        os.makedirs(config.full("~/.tarstall/bin/{}/lib".format(p)), exist_ok=True)
+        with open(config.full("~/.tarstall/bin/{}/lib/runtime.so".format(p)), "w") as f:
+            f.write("a" * 8192)
+    prog_manage.finish_install("package_two")
+    assert prog_manage.dedupe_programs() == {"package": 0, "package_two": 8192}
+    assert os.path.samefile(config.full("~/.tarstall/bin/package/lib/runtime.so"), config.full("~/.tarstall/bin/package_two/lib/runtime.so"))
+    prog_manage.uninstall("package")
+    assert os.path.isfile(config.full("~/.tarstall/bin/package_two/lib/runtime.so"))
+    prog_manage.uninstall("package_two")
+    prog_manage.empty_trash(False)
+    assert os.listdir(config.full("~/.tarstall/store")) == []
+
+
+def test_rollback():
+    with open(config.full("~/.tarstall/bin/package/test.sh"), "w") as f:
+        f.write("old")
+    assert prog_manage.rollback("package") == "No snapshots"
+    prog_manage.snapshot_program("package")
+    os.remove(config.full("~/.tarstall/bin/package/test.sh"))
+    with open(config.full("~/.tarstall/bin/package/test.sh"), "w") as f:
+        f.write("new")
+    assert len(prog_manage.list_snapshots("package")) == 1
+    assert prog_manage.rollback("package") == "Success"
+    with open(config.full("~/.tarstall/bin/package/test.sh")) as f:
+        assert f.read() == "old"
+    assert prog_manage.list_snapshots("package") == []
+
+
+def test_rollback_script():
+    with open("/tmp/tarstall-test-script.sh", "w") as f:
+        f.write("#!/bin/sh\necho new > test.sh\n")
+    os.chmod("/tmp/tarstall-test-script.sh", 0o755)
+    prog_manage.update_script("package", "/tmp/tarstall-test-script.sh")
+    with open(config.full("~/.tarstall/bin/package/test.sh"), "w") as f:
+        f.write("old")
+    prog_manage.snapshot_program("package")
+    with open(config.full("~/.tarstall/bin/package/test.sh"), "w") as f:  # Written in place, the way scripts may
+        f.write("new")
+    assert prog_manage.rollback("package") == "Success"
+    with open(config.full("~/.tarstall/bin/package/test.sh")) as f:
+        assert f.read() == "old"
+    os.remove("/tmp/tarstall-test-script.sh")
+
+
+def test_check_programs():
+    assert prog_manage.check_programs() == []
+    prog_manage.pathify("package")
+    config.remove_line("package", "~/.tarstall/.fishrc", "poundword")
+    os.mkdir(config.full("~/.tarstall/bin/orphan"))
+    config.create("~/.tarstall/bin/orphan/orphan")
+    config.add_line("\nexport PATH=$PATH:~/.tarstall/bin/ghost # ghost", "~/.tarstall/.bashrc")
+    issues = prog_manage.check_programs()
+    assert ("Missing PATH", "package", ".fishrc") in issues
+    assert ("Untracked PATH", "ghost", (".bashrc", "export PATH=$PATH:~/.tarstall/bin/ghost # ghost")) in issues
+    assert [i[:2] for i in issues if i[0] == "Untracked files"] == [("Untracked files", "orphan")]
+    prog_manage.repair_programs(issues)
+    assert prog_manage.check_programs() == []
+    assert config.db["programs"]["orphan"]["install_type"] == "single"
+
+
+def test_verify_program():
+    assert prog_manage.list_files("package") == ["test.sh"]
+    assert prog_manage.verify_program("package") == {"Missing": [], "Added": [], "Modified": []}
+    with open(config.full("~/.tarstall/bin/package/test.sh"), "r+") as f:
+        f.write("x")
+    config.create("~/.tarstall/bin/package/extra.sh")
+    assert prog_manage.verify_program("package") == {"Missing": [], "Added": ["extra.sh"], "Modified": ["test.sh"]}
+    assert prog_manage.verify_program("not_a_program") == "Not installed"
+
+
+def test_parse_checksum():
+    digest = "61ecf69bdfa20c2566b1b2eb9f546ea213eacd89b4532c70e3bef9e9fc768b9d"
+    assert prog_manage.parse_checksum(digest) == ("sha256", digest)
+    assert prog_manage.parse_checksum("SHA256:" + digest.upper()) == ("sha256", digest)
+    sums = "{}  other.tar.gz\n{} *package.tar.gz\n".format("0" * 64, digest)
+    assert prog_manage.parse_checksum(sums, "package.tar.gz") == ("sha256", digest)
+    assert prog_manage.parse_checksum("SHA256 (package.tar.gz) = " + digest, "package.tar.gz") == ("sha256", digest)
+    assert prog_manage.parse_checksum(digest + "  package-1.2.tar.gz", "package.tar.gz") == ("sha256", digest)
+    assert prog_manage.parse_checksum(sums, "missing.tar.gz") is None
+    assert prog_manage.parse_checksum("not a checksum") is None
+    assert prog_manage.set_update_checksum("package", "abc") == "Bad checksum"
+    assert prog_manage.set_update_checksum("package", digest) == "Success"
+    prog_manage.remove_update_url("package")
+    assert config.db["programs"]["package"]["update_checksum"] is None
+
+
 def test_get_file_version():
     assert prog_manage.get_file_version("prog") == config.prog_internal_version
     assert prog_manage.get_file_version("file") == config.file_version
@@ -49,6 +222,37 @@ def test_list_programs(capsys):
     prog_manage.list_programs() == ["package"]
 
 
+def test_program_info():
+    info = prog_manage.program_info("package")
+    assert info["type"] == "default"
+    assert info["source"] is None
+    assert info["updated"] is not None
+    prog_manage.add_upgrade_url("package", "https://example.com/package.tar.gz")
+    assert prog_manage.program_info("package")["source"] == "https://example.com/package.tar.gz"
+
+
+def test_which_program():
+    assert prog_manage.which_program("test.sh") == []
+    prog_manage.pathify("package")
+    assert prog_manage.which_program("test.sh") == ["package"]
+    config.create("~/.tarstall/bin/package/new.sh")
+    os.chmod(config.full("~/.tarstall/bin/package/new.sh"), 0o755)
+    prog_manage.record_program("package")
+    assert prog_manage.which_program("new.sh") == ["package"]
+    prog_manage.add_binlink("test.sh", "package")
+    prog_manage.create_desktop("package", "Name", "test.sh", "Comment here", "False")
+    assert prog_manage.which_program("test.sh-package") == ["package"]
+    assert prog_manage.find_conflicts("package") == {}
+    config.db["programs"]["other"] = prog_manage.discover_program("package")
+    config.db["programs"]["other"]["binlinks"] = ["test.sh"]
+    prog_manage.index_program("other")
+    assert prog_manage.which_program("test.sh") == ["other", "package"]
+    assert prog_manage.find_conflicts("package") == {"test.sh": ["other"]}
+    prog_manage.uninstall("package")
+    assert prog_manage.which_program("test.sh") == ["other"]
+    assert prog_manage.which_program("test.sh-package") == []
+
+
 def test_create_desktop(monkeypatch):
     prog_manage.create_desktop("package", "Name", "test.sh", "Comment here", "False")
     assert config.exists("~/.local/share/applications/test.sh-package.desktop")
@@ -78,6 +282,137 @@ def test_install(monkeypatch):
     assert os.path.isfile(os.path.expanduser("~/.tarstall/bin/package/test.sh"))
 
 
+def test_install_overwrite():
+    os.remove(config.full("~/.tarstall/bin/package/test.sh"))
+    assert prog_manage.install(os.path.dirname(__file__) + "/fake_packages/package.tar.gz", True) == "Installed"
+    assert os.path.isfile(config.full("~/.tarstall/bin/package/test.sh"))
+    assert os.path.islink(config.full("~/.tarstall/bin/package"))
+    assert not os.path.lexists(config.temp_name(config.full("~/.tarstall/bin/package")))
+    assert prog_manage.sync_report() == ["package", 8, 0]
+    assert prog_manage.sync_report() is None
+    assert prog_manage.rollback("package") == "Success"
+    assert not os.path.isfile(config.full("~/.tarstall/bin/package/test.sh"))
+    assert prog_manage.install(os.path.dirname(__file__) + "/fake_packages/package.tar.gz", True) == "Installed"
+    assert len(os.listdir(config.full("~/.tarstall/versions/package"))) == 1
+
+
+def test_install_filters():
+    os.makedirs("/tmp/tarstall-test-temp/filtered/docs")
+    os.makedirs("/tmp/tarstall-test-temp/filtered/bin")
+    config.create("/tmp/tarstall-test-temp/filtered/docs/manual.txt")
+    config.create("/tmp/tarstall-test-temp/filtered/bin/run.sh")
+    call(["tar", "-czf", "/tmp/tarstall-test-temp/filtered.tar.gz", "-C", "/tmp/tarstall-test-temp", "filtered"])
+    assert prog_manage.pre_install("/tmp/tarstall-test-temp/filtered.tar.gz", filters={"include": [], "exclude": ["docs"]}) == "Installed"
+    assert os.path.isfile(config.full("~/.tarstall/bin/filtered/bin/run.sh"))
+    assert not os.path.exists(config.full("~/.tarstall/bin/filtered/docs"))
+    assert config.db["programs"]["filtered"]["filters"] == {"include": [], "exclude": ["docs"]}
+    assert prog_manage.pre_install("/tmp/tarstall-test-temp/filtered.tar.gz", True, force=True) == "Installed"
+    assert not os.path.exists(config.full("~/.tarstall/bin/filtered/docs"))
+    assert prog_manage.set_filters("filtered", [""], [" "]) == "Wiped"
+    prog_manage.uninstall("filtered")
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_install_unchanged():
+    os.makedirs("/tmp/tarstall-test-temp/unchanged")
+    config.create("/tmp/tarstall-test-temp/unchanged/run.sh")
+    call(["tar", "-czf", "/tmp/tarstall-test-temp/unchanged.tar.gz", "-C", "/tmp/tarstall-test-temp", "unchanged"])
+    assert prog_manage.pre_install("/tmp/tarstall-test-temp/unchanged.tar.gz") == "Installed"
+    assert config.db["programs"]["unchanged"]["archive"]["sha256"] == config.hash_file("/tmp/tarstall-test-temp/unchanged.tar.gz")
+    assert prog_manage.pre_install("/tmp/tarstall-test-temp/unchanged.tar.gz", True) == "Unchanged"
+    assert prog_manage.pre_install("/tmp/tarstall-test-temp/unchanged.tar.gz", True, force=True) == "Installed"
+    config.create("/tmp/tarstall-test-temp/unchanged/new.sh")
+    call(["tar", "-czf", "/tmp/tarstall-test-temp/unchanged.tar.gz", "-C", "/tmp/tarstall-test-temp", "unchanged"])
+    assert prog_manage.pre_install("/tmp/tarstall-test-temp/unchanged.tar.gz", True) == "Installed"
+    assert os.path.isfile(config.full("~/.tarstall/bin/unchanged/new.sh"))
+    prog_manage.uninstall("unchanged")
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_install_update(monkeypatch):
+    os.makedirs("/tmp/tarstall-test-temp/package")
+    with open("/tmp/tarstall-test-temp/package/test.sh", "w") as f:
+        f.write("new")
+    call(["tar", "-czf", "/tmp/tarstall-test-temp/package.tar.gz", "-C", "/tmp/tarstall-test-temp", "package"])
+    with open("/tmp/tarstall-test-temp/package.tar.gz", "rb") as f:
+        data = f.read()
+    digests = {"sha256": hashlib.sha256(data).hexdigest(), "sha512": hashlib.sha512(data).hexdigest()}
+
+    hash_file = config.hash_file
+
+    def no_reading(path, *args, **kwargs):
+        assert not path.endswith(".tar.gz"), "Archive was read again"
+        return hash_file(path, *args, **kwargs)
+
+    monkeypatch.setattr(config, "hash_file", no_reading)
+    assert prog_manage.install_update("package", "/tmp/tarstall-test-temp/package.tar.gz", digests, ("sha512", digests["sha512"])) == "Success"
+    assert config.db["programs"]["package"]["archive"]["sha256"] == digests["sha256"]
+    assert not os.path.exists("/tmp/tarstall-test-temp")
+
+
+def test_freeze():
+    os.makedirs("/tmp/tarstall-test-temp/frozen/bin")
+    with open("/tmp/tarstall-test-temp/frozen/bin/run.sh", "w") as f:
+        f.write("#!/bin/sh\necho Hello")
+    os.chmod("/tmp/tarstall-test-temp/frozen/bin/run.sh", 0o755)
+    config.create("/tmp/tarstall-test-temp/frozen/readme.txt")
+    call(["tar", "-czf", "/tmp/tarstall-test-temp/frozen.tar.gz", "-C", "/tmp/tarstall-test-temp", "frozen"])
+    assert prog_manage.pre_install("/tmp/tarstall-test-temp/frozen.tar.gz") == "Installed"
+    assert prog_manage.freeze("frozen") == "Success"
+    assert prog_manage.freeze("frozen") == "Already frozen"
+    assert os.path.isfile(prog_manage.cold_archive("frozen"))
+    assert not os.path.exists(config.full("~/.tarstall/bin/frozen/readme.txt"))
+    with open(config.full("~/.tarstall/bin/frozen/bin/run.sh")) as f:
+        assert "stub_thaw" in f.read()
+    assert prog_manage.verify_program("frozen") == "Frozen"
+    config.lock()  # Stubs wait for whatever holds the lock instead of failing
+    stub = Popen([config.full("~/.tarstall/bin/frozen/bin/run.sh")], stdout=PIPE, stderr=PIPE)
+    time.sleep(2)
+    assert stub.poll() is None
+    config.unlock()
+    out, err = stub.communicate(timeout=60)
+    assert (stub.returncode, out.decode().strip(), err) == (0, "Hello", b"")
+    config.db = config.get_db()  # The stub thawed the program from another process
+    assert config.db["programs"]["frozen"]["frozen"] is None
+    assert os.path.isfile(config.full("~/.tarstall/bin/frozen/readme.txt"))
+    assert prog_manage.thaw("frozen") == "Not frozen"
+    prog_manage.uninstall("frozen")
+    rmtree("/tmp/tarstall-test-temp")
+
+
+def test_freeze_unused():
+    os.makedirs("/tmp/tarstall-test-temp/unused/bin")
+    config.create("/tmp/tarstall-test-temp/unused/bin/run.sh")
+    config.create("/tmp/tarstall-test-temp/unused/readme.txt")
+    call(["tar", "-czf", "/tmp/tarstall-test-temp/unused.tar.gz", "-C", "/tmp/tarstall-test-temp", "unused"])
+    assert prog_manage.pre_install("/tmp/tarstall-test-temp/unused.tar.gz") == "Installed"
+    assert prog_manage.freeze_unused(30) == {}  # Just installed
+    month_ago = int(time.time()) - 31 * 86400
+    config.db["programs"]["unused"]["activated"] = month_ago
+    for root, dirs, files in os.walk(config.full("~/.tarstall/bin/unused/")):
+        for f in files:
+            os.utime(os.path.join(root, f), (month_ago, month_ago))
+    assert prog_manage.last_used("unused") == month_ago  # Walking refreshed directory access times
+    assert prog_manage.freeze_unused(30) == {"unused": "Success"}
+    assert prog_manage.thaw("unused") == "Success"
+    packed = prog_manage.pack_program("unused")
+    assert prog_manage.freeze("unused", ("/tmp/other-version",) + packed[1:]) == "Changed"
+    os.remove(packed[2])
+    config.db["programs"]["unused"]["activated"] = month_ago
+    for root, dirs, files in os.walk(config.full("~/.tarstall/bin/unused/")):
+        for f in files:
+            os.utime(os.path.join(root, f), (month_ago, month_ago))
+    config.change_config("FreezeAfterDays", "change", 30)
+    config.change_config("LastFrozen", "change", 0)
+    assert prog_manage.background_freeze() == {"unused": "Success"}
+    assert config.db["programs"]["unused"]["frozen"] is not None
+    assert config.read_config("LastFrozen") > 0
+    assert not config.locked()
+    assert [f for f in os.listdir(config.full("~/.tarstall/cold")) if not f.startswith("unused.tar")] == []
+    prog_manage.uninstall("unused")
+    rmtree("/tmp/tarstall-test-temp")
+
+
 def test_repair_db():
     prog_manage.repair_db()
     assert config.db["programs"]["package"]["install_type"] == "single"  # Since the archive only contains one file, it gets re-detected as single-file
@@ -101,7 +436,9 @@ def test_create_db():
             "branch": "master"
         },
         "programs": {
-        }
+        },
+        "command_index": {},
+        "desktop_index": {}
     }
 
 